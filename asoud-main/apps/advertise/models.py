@@ -1,4 +1,4 @@
-from apps.base.models import models, BaseModel
+from apps.base.models import models, BaseModel, DerivedImagesModel
 from django.utils.translation import gettext_lazy as _
 from apps.product.models import Product
 from apps.category.models import Category
@@ -126,7 +126,7 @@ class Advertisement(BaseModel):
         return self.name
     
 
-class AdvImage(BaseModel):
+class AdvImage(DerivedImagesModel):
     advertise = models.ForeignKey(
         Advertisement,
         related_name='images',
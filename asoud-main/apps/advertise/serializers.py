@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from utils.images import ImageVariantField
 from apps.advertise.models import (
     Advertisement, 
     AdvImage,
@@ -8,15 +9,20 @@ from apps.product.models import Product
 from apps.product.serializers.owner_serializers import ProductDetailSerializer
 from apps.users.serializers import UserSerializer
 from jdatetime import datetime as jdatetime
+from utils.keywords import KeywordResolver
 
 class AdvertiseImageSerializer(serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
+    image_thumb = ImageVariantField(source='image', variant='thumb')
+    image_webp = ImageVariantField(source='image', variant='webp')
 
     class Meta:
         model = AdvImage
         fields = [
             'id',
-            'image'
+            'image',
+            'image_thumb',
+            'image_webp',
         ]
 
 class AdvertiseSerializer(serializers.ModelSerializer):
@@ -31,7 +37,10 @@ class AdvertiseSerializer(serializers.ModelSerializer):
 class AdvertiseCreateSerializer(serializers.ModelSerializer):
     product = serializers.UUIDField(required=False)
     user = serializers.UUIDField(read_only=True)
-    keywords = serializers.ListField(child=serializers.CharField(), required=False)
+    keywords = serializers.ListField(
+        child=serializers.CharField(max_length=AdvKeyword._meta.get_field('name').max_length),
+        required=False,
+    )
     images = serializers.ListField(child=serializers.ImageField(), required=False)
 
     class Meta:
@@ -55,11 +64,9 @@ class AdvertiseCreateSerializer(serializers.ModelSerializer):
             # create or get keywords
             keywords = []
             if 'keywords' in validated_data and validated_data['keywords']:
-                for keyword in validated_data['keywords']:
-                    key, _ = AdvKeyword.objects.get_or_create(
-                        name=keyword
-                    )
-                    keywords.append(key)
+                keywords = KeywordResolver.for_model(AdvKeyword).resolve(
+                    validated_data['keywords']
+                )
             
                 # remove keywords from validated_data
                 del validated_data['keywords']
@@ -114,11 +121,9 @@ class AdvertiseCreateSerializer(serializers.ModelSerializer):
         # create or get keywords
         keywords = []
         if 'keywords' in validated_data and validated_data['keywords']:
-            for keyword in validated_data['keywords']:
-                key, _ = AdvKeyword.objects.get_or_create(
-                    name=keyword
-                )
-                keywords.append(key)
+            keywords = KeywordResolver.for_model(AdvKeyword).resolve(
+                validated_data['keywords']
+            )
         
             # remove keywords from validated_data
             del validated_data['keywords']
@@ -43,7 +43,7 @@ class AdvertiseListView(views.APIView):
         advertises = Advertisement.objects.filter(is_paid=True)
 
         if q := request.GET.get('q'):
-            advertises = advertises.filter(name_icontain=q)
+            advertises = advertises.filter(name__icontains=q)
         
         if type := request.GET.get('type'):
             advertises = advertises.filter(type=type)
@@ -1,4 +1,4 @@
-from apps.base.models import models, BaseModel
+from apps.base.models import models, BaseModel, DerivedImagesModel
 from django.utils.translation import gettext_lazy as _
 from apps.market.models import Market
 from apps.category.models import SubCategory
@@ -230,12 +230,19 @@ class AffiliateProduct(BaseModel):
         db_table = 'affiliate_product'
         verbose_name = _('Affiliate Product')
         verbose_name_plural = _('Affiliate Products')
+        indexes = [
+            # keyset pagination of a market's products, see ProductListStream
+            models.Index(
+                fields=['market', '-created_at', '-id'],
+                name='aff_product_market_created_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class AffiliateProductImage(BaseModel):
+class AffiliateProductImage(DerivedImagesModel):
     product = models.ForeignKey(
         AffiliateProduct,
         on_delete=models.CASCADE,
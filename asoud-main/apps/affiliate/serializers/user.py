@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from utils.images import ImageVariantField
 from apps.affiliate.models import (
     AffiliateProduct,
     AffiliateProductTheme,
@@ -8,12 +9,16 @@ from apps.product.serializers.owner_serializers import ProductListSerializer
 
 class AffiliateProductImageSerializer(serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
+    image_thumb = ImageVariantField(source='image', variant='thumb')
+    image_webp = ImageVariantField(source='image', variant='webp')
 
     class Meta:
         model = AffiliateProductImage
         fields = [
             'id',
-            'image'
+            'image',
+            'image_thumb',
+            'image_webp',
         ]
 
 class AffiliateProductCreateSerializer(serializers.ModelSerializer):
@@ -2,6 +2,7 @@ from rest_framework import views, status
 from rest_framework.response import Response
 from utils.response import ApiResponse
 from apps.product.models import Product
+from apps.product.core import ThemeLayout
 from apps.product.serializers.owner_serializers import (
     ProductDetailSerializer,
     ProductListSerializer
@@ -248,7 +249,7 @@ class AffiliateProductThemeListAPIView(views.APIView):
                 )
             )
     
-        product_theme_list = AffiliateProductTheme.objects.filter(market=market)
+        product_theme_list = ThemeLayout.affiliate_themes(market.id)
 
         serializer = AffiliateProductThemeListSerializer(
             product_theme_list,
@@ -0,0 +1,123 @@
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from utils.images import thumb_name, webp_name
+
+CHUNK_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        'Find (and with --delete remove) files under MEDIA_ROOT that no '
+        'FileField/ImageField references. Dry run by default.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--delete',
+            action='store_true',
+            help='Delete orphaned files instead of only reporting them',
+        )
+        parser.add_argument(
+            '--prefix',
+            default='',
+            help='Only scan this sub directory of MEDIA_ROOT, e.g. market/logo',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=24,
+            help='Skip files modified in the last N hours (uploads in flight)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=0,
+            help='Stop after N orphaned files, to spread large cleanups over runs',
+        )
+        parser.add_argument(
+            '--verbose-files',
+            action='store_true',
+            help='Print every orphaned file',
+        )
+
+    def referenced_files(self):
+        """Names stored in every file field, plus their image derivatives."""
+        referenced = set()
+
+        for model in apps.get_models():
+            for field in model._meta.concrete_fields:
+                if not isinstance(field, models.FileField):
+                    continue
+
+                names = model._base_manager.exclude(
+                    **{field.name: ''},
+                ).exclude(
+                    **{f'{field.name}__isnull': True},
+                ).values_list(
+                    field.name, flat=True,
+                ).iterator(chunk_size=CHUNK_SIZE)
+
+                for name in names:
+                    referenced.add(name)
+                    if isinstance(field, models.ImageField):
+                        referenced.add(thumb_name(name))
+                        referenced.add(webp_name(name))
+
+        return referenced
+
+    def walk(self, root):
+        """Yields (path, stat) for every file under root, without listing it all."""
+        stack = [root]
+
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry.path, entry.stat(follow_symlinks=False)
+
+    def handle(self, *args, **options):
+        media_root = settings.MEDIA_ROOT
+        root = os.path.join(media_root, options['prefix'])
+        if not os.path.isdir(root):
+            self.stderr.write(f'{root} does not exist')
+            return
+
+        referenced = self.referenced_files()
+        self.stdout.write(f'{len(referenced)} referenced files')
+
+        cutoff = time.time() - options['min_age'] * 60 * 60
+        delete = options['delete']
+        scanned = orphaned = reclaimable = 0
+
+        for path, stat in self.walk(root):
+            scanned += 1
+
+            name = os.path.relpath(path, media_root).replace(os.sep, '/')
+            if name in referenced or stat.st_mtime > cutoff:
+                continue
+
+            orphaned += 1
+            reclaimable += stat.st_size
+
+            if options['verbose_files']:
+                self.stdout.write(f'{name} {stat.st_size}')
+
+            if delete:
+                os.remove(path)
+
+            if options['limit'] and orphaned >= options['limit']:
+                break
+
+        action = 'deleted' if delete else 'reclaimable (dry run, use --delete)'
+        self.stdout.write(
+            f'{scanned} files scanned, {orphaned} orphaned, '
+            f'{reclaimable / (1024 * 1024):.1f} MB {action}'
+        )
@@ -0,0 +1,58 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.base.signals import IMAGE_FIELDS
+from utils.images import (
+    generate_derivatives,
+    record_derivatives,
+    thumb_name,
+    webp_name,
+)
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnail/webp derivatives for uploaded images and record them'
+
+    def handle(self, *args, **options):
+        pending = defaultdict(list)  # path -> [(model, pk, field, file name)]
+        recorded = 0
+        for model, fields in IMAGE_FIELDS.items():
+            for name in fields:
+                rows = model.objects.exclude(
+                    **{name: ''},
+                ).exclude(
+                    **{f'{name}__isnull': True},
+                ).values_list('pk', name, 'derived_images').iterator()
+
+                for pk, file_name, derived in rows:
+                    if (derived or {}).get(name) == file_name:
+                        continue
+
+                    path = os.path.join(settings.MEDIA_ROOT, file_name)
+                    if not os.path.exists(path):
+                        continue
+
+                    if os.path.exists(thumb_name(path)) and os.path.exists(webp_name(path)):
+                        record_derivatives(model, pk, name, file_name)
+                        recorded += 1
+                    else:
+                        pending[path].append((model, pk, name, file_name))
+
+        done = 0
+        with ProcessPoolExecutor(settings.IMAGE_DERIVATIVE_WORKERS) as pool:
+            futures = [pool.submit(generate_derivatives, path) for path in pending]
+            for future in as_completed(futures):
+                try:
+                    path = future.result()
+                    for record in pending[path]:
+                        record_derivatives(*record)
+                    done += 1
+                except Exception as e:
+                    self.stderr.write(str(e))
+
+        self.stdout.write(f'{recorded} existing derivatives recorded')
+        self.stdout.write(f'{done} of {len(pending)} images processed')
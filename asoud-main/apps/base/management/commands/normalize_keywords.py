@@ -0,0 +1,95 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.advertise.models import AdvKeyword
+from apps.product.models import ProductKeyword
+from apps.search.normalizer import normalize
+from utils.keywords import KeywordResolver
+
+KEYWORD_MODELS = [ProductKeyword, AdvKeyword]
+
+
+class Command(BaseCommand):
+    help = (
+        'Normalize the names of existing keywords the way KeywordResolver '
+        'does, merging rows that normalize to the same name'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would change',
+        )
+
+    def handle(self, *args, **options):
+        for model in KEYWORD_MODELS:
+            renamed, merged, skipped = self.normalize_model(model, options['dry_run'])
+            self.stdout.write(
+                f'{model._meta.label}: {renamed} renamed, {merged} merged, '
+                f'{skipped} left as they are (empty or too long once normalized)'
+            )
+
+    @staticmethod
+    def links(model):
+        """(through model, keyword column, owner column) of each m2m to model."""
+        return [
+            (
+                relation.through,
+                f'{relation.field.m2m_reverse_field_name()}_id',
+                f'{relation.field.m2m_field_name()}_id',
+            )
+            for relation in model._meta.related_objects
+            if relation.many_to_many
+        ]
+
+    def normalize_model(self, model, dry_run):
+        max_length = model._meta.get_field('name').max_length
+        groups = defaultdict(list)
+        skipped = 0
+        for keyword_id, name in model.objects.values_list('id', 'name').iterator():
+            normalized = normalize(name)
+            if not normalized or len(normalized) > max_length:
+                skipped += 1
+                continue
+            groups[normalized].append((keyword_id, name))
+
+        renamed = merged = 0
+        resolver = KeywordResolver.for_model(model)
+        for normalized, rows in groups.items():
+            if len(rows) == 1 and rows[0][1] == normalized:
+                continue
+
+            # keep the row already named right, if any, so the rename can
+            # not hit the unique name
+            rows.sort(key=lambda row: row[1] != normalized)
+            keep, _ = rows[0]
+            duplicates = [keyword_id for keyword_id, _ in rows[1:]]
+            merged += len(duplicates)
+            renamed += rows[0][1] != normalized
+            if dry_run:
+                continue
+
+            with transaction.atomic():
+                for through, keyword_column, owner_column in self.links(model):
+                    links = through.objects.filter(**{f'{keyword_column}__in': duplicates})
+                    owners = set(links.values_list(owner_column, flat=True))
+                    links.delete()
+                    through.objects.bulk_create(
+                        [
+                            through(**{keyword_column: keep, owner_column: owner})
+                            for owner in owners
+                        ],
+                        ignore_conflicts=True,
+                    )
+
+                # deleting fires keyword_deleted, which evicts the old names
+                for duplicate in model.objects.filter(id__in=duplicates):
+                    duplicate.delete()
+                model.objects.filter(id=keep).update(name=normalized)
+
+            resolver.forget(normalized)
+
+        return renamed, merged, skipped
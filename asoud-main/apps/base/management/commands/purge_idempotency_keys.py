@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.base.models import IdempotencyKey
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Delete expired idempotency keys'
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        total = 0
+
+        while True:
+            ids = list(
+                IdempotencyKey.objects.filter(
+                    expires_at__lte=now,
+                ).values_list('id', flat=True)[:BATCH_SIZE]
+            )
+            if not ids:
+                break
+
+            IdempotencyKey.objects.filter(id__in=ids).delete()
+            total += len(ids)
+
+        self.stdout.write(f'{total} expired idempotency keys deleted')
@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 import uuid
@@ -25,3 +27,79 @@ class BaseModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class DerivedImagesModel(BaseModel):
+    """
+    A model with image fields that get thumbnail/webp derivatives (see
+    utils/images.py). derived_images maps each field to the file name whose
+    derivatives were written, so serializers link them without asking the
+    storage.
+    """
+    derived_images = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name=_('Derived images'),
+    )
+
+    class Meta:
+        abstract = True
+
+
+class IdempotencyKey(BaseModel):
+    """The first response to an Idempotency-Key, see utils.idempotency."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys',
+        verbose_name=_('User'),
+    )
+    scope = models.CharField(
+        max_length=64,
+        verbose_name=_('Scope'),
+    )
+    key = models.CharField(
+        max_length=255,
+        verbose_name=_('Key'),
+    )
+    # hash of the request body, a reused key must come with the same request
+    fingerprint = models.CharField(
+        max_length=64,
+        verbose_name=_('Fingerprint'),
+    )
+    # null while the first request is being processed
+    status_code = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_('Status code'),
+    )
+    response = models.JSONField(
+        null=True,
+        blank=True,
+        encoder=DjangoJSONEncoder,
+        verbose_name=_('Response'),
+    )
+    expires_at = models.DateTimeField(
+        verbose_name=_('Expires at'),
+    )
+
+    class Meta:
+        db_table = 'idempotency_key'
+        verbose_name = _('Idempotency key')
+        verbose_name_plural = _('Idempotency keys')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'scope', 'key'],
+                name='idempotency_key_unique',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['expires_at'],
+                name='idempotency_key_expires_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
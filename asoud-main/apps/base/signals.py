@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from apps.market.models import Market, MarketSlider
+from apps.product.models import ProductImage, ProductKeyword
+from apps.affiliate.models import AffiliateProductImage
+from apps.advertise.models import AdvImage, AdvKeyword
+from apps.price_inquiry.models import InquiryImage, InquiryAnswerImage
+from apps.users.models import UserProfile
+from utils.images import schedule_derivatives
+from utils.keywords import keyword_deleted
+
+# Image fields that get thumbnail/webp derivatives (see utils/images.py)
+IMAGE_FIELDS = {
+    Market: ['logo_img', 'background_img', 'user_only_img'],
+    MarketSlider: ['image'],
+    ProductImage: ['image'],
+    AffiliateProductImage: ['image'],
+    AdvImage: ['image'],
+    InquiryImage: ['image'],
+    InquiryAnswerImage: ['image'],
+    UserProfile: ['picture'],
+}
+
+
+def create_image_derivatives(sender, instance, **kwargs):
+    files = [getattr(instance, name) for name in IMAGE_FIELDS[sender]]
+
+    def schedule():
+        for field_file in files:
+            schedule_derivatives(field_file)
+
+    transaction.on_commit(schedule, robust=True)
+
+
+for model in IMAGE_FIELDS:
+    post_save.connect(create_image_derivatives, sender=model)
+
+# keep the shared keyword cache from handing out deleted ids
+for model in (ProductKeyword, AdvKeyword):
+    post_delete.connect(keyword_deleted, sender=model)
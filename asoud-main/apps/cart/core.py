@@ -0,0 +1,1175 @@
+import heapq
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import redis
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import transaction
+from django.db.models import (
+    Case,
+    Count,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    IntegerField,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from apps.affiliate.models import AffiliateProduct
+from apps.cart.models import (
+    MarketDailySales,
+    Order,
+    OrderItem,
+    ProductDailySales,
+    StockReservation,
+)
+from apps.discount.core import EffectivePrice
+from apps.discount.models import ProductUserPrice
+from apps.market.models import Market
+from apps.product.models import Product
+from utils.redis_client import get_redis_connection
+from utils.cursor import DATETIME_CURSOR
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_ids):
+        super().__init__('Out of stock')
+        self.product_ids = [str(product_id) for product_id in product_ids]
+
+
+class StockReservationCore:
+    """
+    Holds product stock for an order from checkout until payment.
+
+    The product rows are locked (SELECT ... FOR UPDATE) before their stock
+    is checked and taken in one UPDATE, so concurrent checkouts can never
+    take more than there is: the loser waits for the lock and sees the new
+    stock. Rows are always locked in id order, so two orders sharing
+    products can't deadlock, and an order costs the same few queries
+    whatever its number of lines.
+
+    A reservation is committed when the payment is verified or the owner
+    verifies the order, and released (its stock given back) when the cart
+    changes, the owner rejects the order, it is deleted or it expires;
+    release_expired is run periodically by the release_expired_reservations
+    command. Affiliate items draw on the stock of their source product.
+    """
+    RELEASE_BATCH = 1000
+
+    @staticmethod
+    def _quantities(order):
+        """Returns {product_id: quantity} for the items of order."""
+        rows = OrderItem.objects.filter(
+            order=order,
+        ).annotate(
+            stock_product=Coalesce('product', 'affiliate__product'),
+        ).values('stock_product').annotate(
+            total=Sum('quantity'),
+        ).values_list('stock_product', 'total')
+
+        return {
+            product_id: total for product_id, total in rows
+            if product_id is not None
+        }
+
+    @staticmethod
+    def _sync_affiliates(product_ids):
+        AffiliateProduct.objects.filter(
+            product_id__in=product_ids,
+        ).update(
+            stock=Subquery(
+                Product.objects.filter(
+                    id=OuterRef('product_id'),
+                ).values('stock')[:1]
+            ),
+        )
+
+    @staticmethod
+    def _lock(product_ids):
+        """Locks the product rows in id order. Returns {product_id: stock}."""
+        return dict(
+            Product.objects.select_for_update().filter(
+                id__in=product_ids,
+            ).order_by('id').values_list('id', 'stock')
+        )
+
+    @staticmethod
+    def _add_stock(quantities, sign):
+        if not quantities:
+            return
+        Product.objects.filter(id__in=quantities).update(
+            stock=Case(
+                *[
+                    When(id=product_id, then=F('stock') + sign * quantity)
+                    for product_id, quantity in quantities.items()
+                ],
+                default=F('stock'),
+                output_field=Product._meta.get_field('stock'),
+            ),
+        )
+
+    @classmethod
+    def _take(cls, quantities):
+        """Decrements stock of every product, or raises OutOfStock."""
+        stock = cls._lock(quantities)
+        short = [
+            product_id for product_id in sorted(quantities)
+            if stock.get(product_id, 0) < quantities[product_id]
+        ]
+        if short:
+            raise OutOfStock(short)
+
+        cls._add_stock(quantities, -1)
+
+    @classmethod
+    def _give_back(cls, reservations):
+        """Releases locked (id, product_id, quantity) rows."""
+        if not reservations:
+            return 0
+
+        quantities = defaultdict(int)
+        for _, product_id, quantity in reservations:
+            quantities[product_id] += quantity
+
+        StockReservation.objects.filter(
+            id__in=[reservation_id for reservation_id, _, _ in reservations],
+        ).update(status=StockReservation.RELEASED)
+
+        cls._lock(quantities)
+        cls._add_stock(quantities, 1)
+
+        cls._sync_affiliates(quantities)
+        return len(reservations)
+
+    @classmethod
+    def reserve(cls, order, status=StockReservation.HELD):
+        """
+        Holds the stock for the current items of order, replacing what it
+        held before. Raises OutOfStock with the ids of short products.
+        """
+        expires_at = timezone.now() + timedelta(
+            minutes=settings.STOCK_RESERVATION_MINUTES,
+        )
+
+        with transaction.atomic():
+            cls.release(order)
+
+            quantities = cls._quantities(order)
+            cls._take(quantities)
+
+            StockReservation.objects.bulk_create([
+                StockReservation(
+                    order=order,
+                    product_id=product_id,
+                    quantity=quantity,
+                    status=status,
+                    expires_at=expires_at,
+                )
+                for product_id, quantity in quantities.items()
+            ])
+            cls._sync_affiliates(quantities)
+
+    @classmethod
+    def release(cls, order):
+        """Gives back the stock order holds. Returns the number of reservations."""
+        with transaction.atomic():
+            reservations = list(
+                StockReservation.objects.select_for_update().filter(
+                    order=order,
+                    status=StockReservation.HELD,
+                ).values_list('id', 'product_id', 'quantity')
+            )
+            return cls._give_back(reservations)
+
+    @classmethod
+    def commit(cls, order):
+        """
+        Turns the held stock of a paid order into a sale. When the hold has
+        already expired the stock is taken again, which raises OutOfStock
+        if it is gone.
+        """
+        with transaction.atomic():
+            committed = StockReservation.objects.filter(
+                order=order,
+                status=StockReservation.HELD,
+            ).update(status=StockReservation.COMMITTED)
+
+            if committed:
+                return
+
+            if not order.reservations.filter(status=StockReservation.COMMITTED).exists():
+                cls.reserve(order, status=StockReservation.COMMITTED)
+
+    @classmethod
+    def release_expired(cls, limit=RELEASE_BATCH):
+        """Releases up to limit expired holds. Returns how many were released."""
+        with transaction.atomic():
+            # skip_locked: holds being committed right now are left alone
+            reservations = list(
+                StockReservation.objects.select_for_update(
+                    skip_locked=True,
+                ).filter(
+                    status=StockReservation.HELD,
+                    expires_at__lt=timezone.now(),
+                ).order_by('expires_at').values_list(
+                    'id', 'product_id', 'quantity',
+                )[:limit]
+            )
+            return cls._give_back(reservations)
+
+
+class OrderTotals:
+    """
+    Order totals computed in the database.
+
+    subtotal is at list price (main_price, or the affiliate price); total is
+    at what the buyer pays, their ProductUserPrice or else the product's
+    effective_price (see EffectivePrice). When an order is placed both are
+    stored on it, with the unit price of every item, so history never
+    recomputes them. Until then they are live subqueries, and changing the
+    cart clears the snapshot.
+    """
+    PRICE = DecimalField(max_digits=14, decimal_places=3)
+
+    @classmethod
+    def list_price(cls):
+        """Unit list price of an OrderItem row."""
+        return Coalesce(
+            F('product__main_price'),
+            F('affiliate__price'),
+            output_field=cls.PRICE,
+        )
+
+    @classmethod
+    def unit_price(cls, stored=True):
+        """
+        Unit price the buyer pays for an OrderItem row; the stored one of a
+        placed order unless stored is False.
+        """
+        user_price = ProductUserPrice.objects.filter(
+            product=OuterRef('product'),
+            user=OuterRef('order__user'),
+        ).values('price')[:1]
+
+        prices = [F('unit_price')] if stored else []
+        return Coalesce(
+            *prices,
+            Subquery(user_price),
+            F('product__effective_price'),
+            F('product__main_price'),
+            F('affiliate__price'),
+            output_field=cls.PRICE,
+        )
+
+    @classmethod
+    def _line(cls, price):
+        return ExpressionWrapper(F('quantity') * price, output_field=cls.PRICE)
+
+    @classmethod
+    def _items_sum(cls, expression, output_field):
+        return Coalesce(
+            Subquery(
+                OrderItem.objects.filter(
+                    order=OuterRef('pk'),
+                ).order_by().values('order').annotate(
+                    value=Sum(expression),
+                ).values('value'),
+                output_field=output_field,
+            ),
+            Value(0),
+            output_field=output_field,
+        )
+
+    @classmethod
+    def annotate(cls, queryset):
+        """Adds current_subtotal, current_total and current_item_count to orders."""
+        return queryset.annotate(
+            current_subtotal=Coalesce(
+                F('subtotal'),
+                cls._items_sum(cls._line(cls.list_price()), cls.PRICE),
+            ),
+            current_total=Coalesce(
+                F('total'),
+                cls._items_sum(cls._line(cls.unit_price()), cls.PRICE),
+            ),
+            current_item_count=Coalesce(
+                F('item_count'),
+                cls._items_sum(F('quantity'), IntegerField()),
+            ),
+        )
+
+    @classmethod
+    def items(cls):
+        """Prefetch of order items with their products and current_unit_price."""
+        return Prefetch(
+            'items',
+            queryset=OrderItem.objects.select_related(
+                'product',
+                'affiliate',
+            ).annotate(current_unit_price=cls.unit_price()),
+        )
+
+    @classmethod
+    def live(cls, order):
+        """Returns the subtotal, total and item_count of order, in one query."""
+        return OrderItem.objects.filter(order=order).aggregate(
+            subtotal=Coalesce(Sum(cls._line(cls.list_price())), Value(0), output_field=cls.PRICE),
+            total=Coalesce(Sum(cls._line(cls.unit_price())), Value(0), output_field=cls.PRICE),
+            item_count=Coalesce(Sum('quantity'), Value(0)),
+        )
+
+    @classmethod
+    def snapshot(cls, order):
+        """Stores the totals and unit prices of a placed order."""
+        with transaction.atomic():
+            items = list(
+                OrderItem.objects.filter(order=order).annotate(
+                    current_unit_price=cls.unit_price(stored=False),
+                    current_list_price=cls.list_price(),
+                ).only('id', 'quantity')
+            )
+
+            for item in items:
+                item.unit_price = item.current_unit_price
+            OrderItem.objects.bulk_update(items, ['unit_price'])
+
+            order.subtotal = sum(
+                (item.quantity * (item.current_list_price or 0) for item in items), 0,
+            )
+            order.total = sum(
+                (item.quantity * (item.unit_price or 0) for item in items), 0,
+            )
+            order.item_count = sum(item.quantity for item in items)
+            order.save(update_fields=['subtotal', 'total', 'item_count', 'updated_at'])
+
+    @classmethod
+    def clear(cls, order):
+        """Drops the snapshot of an order whose items changed."""
+        OrderItem.objects.filter(order=order).update(unit_price=None)
+        Order.objects.filter(id=order.id).update(subtotal=None, total=None, item_count=None)
+        order.subtotal = order.total = order.item_count = None
+
+
+class CartLine:
+    """One line of a hot cart: a product or affiliate product and its quantity."""
+
+    def __init__(self, item_type, item, quantity, unit_price):
+        self.item_type = item_type
+        self.item = item
+        self.quantity = quantity
+        self.unit_price = unit_price
+
+    @property
+    def id(self):
+        return self.item.id
+
+    @property
+    def total_price(self):
+        return self.quantity * (self.unit_price or 0)
+
+
+class Cart:
+    def __init__(self, order_id, items, created_at, updated_at):
+        self.id = order_id
+        self.items = items
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    @property
+    def total_price(self):
+        return sum((line.total_price for line in self.items), 0)
+
+    @property
+    def total_items(self):
+        return sum(line.quantity for line in self.items)
+
+
+class CartStore:
+    """
+    The active cart of every user, kept in redis so that adding, updating
+    and removing items costs no database round trip.
+
+    cart:<user id> is a hash of 'product:<id>' / 'affiliate:<id>' ->
+    quantity, next to the id and timestamps of the user's pending Order. It
+    is loaded from that order on first use. Adds are merged with HINCRBY,
+    so concurrent requests never lose a quantity. Changed carts go to a
+    dirty set and are written behind into OrderItem rows by flush (the
+    flush_carts command), or at once by persist at checkout. Writing a
+    changed cart releases the stock hold and stored totals of its order.
+
+    Carts of orders that leave the pending state are dropped by the
+    signals in apps.cart.signals, and so are carts whose order items
+    OrderCreateSerializer replaces directly; they reload on next use. A
+    cart dropped between load and a change is not recreated by the change:
+    the changes are scripts that only run on a loaded cart (one that has
+    its _order), and are retried after a reload.
+    """
+    DIRTY_KEY = 'cart:dirty'
+    PROCESSING_KEY = 'cart:dirty:processing'
+    ORDER = '_order'
+    CREATED = '_created'
+    UPDATED = '_updated'
+    KINDS = ('product', 'affiliate')
+    MAX_QUANTITY = 32767
+    BATCH_SIZE = 500
+    ATTEMPTS = 3
+
+    # KEYS: cart, dirty set. ARGV: _order, _updated, now, ttl, user id, then
+    # the arguments of the change. Returns nil when the cart is not loaded.
+    _LOADED = """
+    if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+        return nil
+    end
+    """
+    _TOUCH = """
+    redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    redis.call('SADD', KEYS[2], ARGV[5])
+    """
+    # ARGV[6] field, ARGV[7] quantity, ARGV[8] max: the new quantity
+    _ADD = _LOADED + """
+    local quantity = redis.call('HINCRBY', KEYS[1], ARGV[6], ARGV[7])
+    if quantity > tonumber(ARGV[8]) then
+        quantity = tonumber(ARGV[8])
+        redis.call('HSET', KEYS[1], ARGV[6], quantity)
+    end
+    """ + _TOUCH + """
+    return quantity
+    """
+    # ARGV[6] quantity, ARGV[7:] fields of the line: 1 if set, 0 if absent
+    _UPDATE = _LOADED + """
+    for i = 7, #ARGV do
+        if redis.call('HEXISTS', KEYS[1], ARGV[i]) == 1 then
+            redis.call('HSET', KEYS[1], ARGV[i], ARGV[6])
+    """ + _TOUCH + """
+            return 1
+        end
+    end
+    return 0
+    """
+    # ARGV[6:] fields of the line: the number removed
+    _REMOVE = _LOADED + """
+    local removed = redis.call('HDEL', KEYS[1], unpack(ARGV, 6))
+    """ + _TOUCH + """
+    return removed
+    """
+
+    @staticmethod
+    def _key(user_id):
+        return f'cart:{user_id}'
+
+    @staticmethod
+    def _time(value):
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+
+    @classmethod
+    def _parse(cls, raw):
+        """Returns (order_id, {(kind, item_id): quantity}) of a cart hash."""
+        lines = {}
+        for field, quantity in raw.items():
+            kind, _, item_id = field.partition(':')
+            if kind in cls.KINDS:
+                lines[kind, item_id] = int(quantity)
+        return raw.get(cls.ORDER), lines
+
+    @classmethod
+    def load(cls, user):
+        """Fills the cart of user from its pending order, unless it is loaded."""
+        conn = get_redis_connection()
+        key = cls._key(user.id)
+        if conn.exists(key):
+            return
+
+        order = Order.get_or_create_order(user)
+        mapping = {
+            cls.ORDER: str(order.id),
+            cls.CREATED: order.created_at.timestamp(),
+            cls.UPDATED: order.updated_at.timestamp(),
+        }
+        rows = order.items.values_list('product_id', 'affiliate_id', 'quantity')
+        for product_id, affiliate_id, quantity in rows:
+            field = f'product:{product_id}' if product_id else f'affiliate:{affiliate_id}'
+            mapping[field] = mapping.get(field, 0) + quantity
+
+        with conn.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.exists(key):
+                    return
+                pipe.multi()
+                pipe.hset(key, mapping=mapping)
+                pipe.expire(key, settings.CART_TTL)
+                pipe.execute()
+            except redis.WatchError:
+                # loaded by a concurrent request
+                pass
+
+    @classmethod
+    def _change(cls, user, script, *args):
+        """Runs a change script on the loaded cart of user, see _LOADED."""
+        conn = get_redis_connection()
+        keys = [cls._key(user.id), cls.DIRTY_KEY]
+        for _ in range(cls.ATTEMPTS):
+            cls.load(user)
+            result = conn.register_script(script)(
+                keys=keys,
+                args=[cls.ORDER, cls.UPDATED, time.time(), settings.CART_TTL, str(user.id), *args],
+            )
+            if result is not None:
+                return result
+        raise redis.RedisError('cart was dropped while it changed')
+
+    @classmethod
+    def add(cls, user, kind, item_id, quantity):
+        """Adds quantity of a product or affiliate product. Returns the new quantity."""
+        return cls._change(user, cls._ADD, f'{kind}:{item_id}', quantity, cls.MAX_QUANTITY)
+
+    @classmethod
+    def update(cls, user, item_id, quantity):
+        """Sets the quantity of a line. Returns False if it is not in the cart."""
+        fields = [f'{kind}:{item_id}' for kind in cls.KINDS]
+        return bool(cls._change(user, cls._UPDATE, quantity, *fields))
+
+    @classmethod
+    def remove(cls, user, item_id):
+        """Removes a line. Returns False if it is not in the cart."""
+        fields = [f'{kind}:{item_id}' for kind in cls.KINDS]
+        return bool(cls._change(user, cls._REMOVE, *fields))
+
+    @classmethod
+    def discard(cls, user_id, order_id=None):
+        """Drops the cart of user_id, if it belongs to order_id when given."""
+        conn = get_redis_connection()
+        key = cls._key(user_id)
+        if order_id is not None and conn.hget(key, cls.ORDER) != str(order_id):
+            return
+        conn.delete(key)
+
+    @classmethod
+    def get(cls, user, item_ids=None):
+        """Returns the Cart of user, with only the lines of item_ids when given."""
+        for _ in range(cls.ATTEMPTS):
+            cls.load(user)
+            raw = get_redis_connection().hgetall(cls._key(user.id))
+            # dropped again since load(), or only partly there
+            if cls.ORDER in raw and cls.CREATED in raw:
+                break
+        else:
+            raise redis.RedisError('cart was dropped while it was read')
+        order_id, lines = cls._parse(raw)
+        if item_ids is not None:
+            item_ids = {str(item_id) for item_id in item_ids}
+            lines = {line: q for line, q in lines.items() if line[1] in item_ids}
+
+        ids = defaultdict(list)
+        for kind, item_id in lines:
+            ids[kind].append(item_id)
+
+        items = []
+        if ids['product']:
+            products = EffectivePrice.annotate(
+                Product.objects.filter(id__in=ids['product']),
+                user,
+            ).only('id', 'name', 'main_price', 'effective_price')
+            items += [
+                CartLine('product', product, lines['product', str(product.id)], product.final_price)
+                for product in products
+            ]
+        if ids['affiliate']:
+            affiliates = AffiliateProduct.objects.filter(
+                id__in=ids['affiliate'],
+            ).only('id', 'name', 'price')
+            items += [
+                CartLine('affiliate', affiliate, lines['affiliate', str(affiliate.id)], affiliate.price)
+                for affiliate in affiliates
+            ]
+        items.sort(key=lambda line: (line.item.name, str(line.id)))
+
+        return Cart(
+            order_id,
+            items,
+            cls._time(raw[cls.CREATED]),
+            cls._time(raw[cls.UPDATED]),
+        )
+
+    @classmethod
+    def _existing(cls, carts):
+        """
+        {kind: {id: market_id}} of the products and affiliate products in
+        carts that still exist.
+        """
+        ids = defaultdict(set)
+        for _, lines in carts.values():
+            for kind, item_id in lines:
+                ids[kind].add(item_id)
+
+        return {
+            'product': {
+                str(item_id): market_id for item_id, market_id in Product.objects.filter(
+                    id__in=ids['product'],
+                ).values_list('id', 'market_id')
+            },
+            'affiliate': {
+                str(item_id): market_id for item_id, market_id in AffiliateProduct.objects.filter(
+                    id__in=ids['affiliate'],
+                ).values_list('id', 'market_id')
+            },
+        }
+
+    @classmethod
+    def _write(cls, user_ids):
+        """
+        Writes the carts of user_ids into their orders. Returns
+        {user id: order}; carts whose order is no longer pending are dropped.
+        """
+        conn = get_redis_connection()
+        pipe = conn.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hgetall(cls._key(user_id))
+
+        carts = {
+            str(user_id): cls._parse(raw)
+            for user_id, raw in zip(user_ids, pipe.execute())
+            if raw
+        }
+        if not carts:
+            return {}
+
+        existing = cls._existing(carts)
+        create, update, delete, changed = [], [], [], []
+
+        with transaction.atomic():
+            orders = {
+                str(order.id): order for order in Order.objects.select_for_update().filter(
+                    id__in=[order_id for order_id, _ in carts.values()],
+                    status=Order.PENDING,
+                )
+            }
+
+            current = defaultdict(dict)
+            rows = OrderItem.objects.filter(
+                order__in=list(orders.values()),
+            ).values_list('id', 'order_id', 'product_id', 'affiliate_id', 'quantity')
+            for item_id, order_id, product_id, affiliate_id, quantity in rows:
+                line = ('product', str(product_id)) if product_id else ('affiliate', str(affiliate_id))
+                if line in current[str(order_id)]:
+                    delete.append(item_id)
+                else:
+                    current[str(order_id)][line] = (item_id, quantity)
+
+            for order_id, lines in carts.values():
+                if order_id not in orders:
+                    continue
+
+                wanted = {
+                    line: min(quantity, cls.MAX_QUANTITY)
+                    for line, quantity in lines.items()
+                    if quantity > 0 and line[1] in existing[line[0]]
+                }
+                have = current[order_id]
+                before = len(create) + len(update) + len(delete)
+
+                for line, (item_id, quantity) in have.items():
+                    if line not in wanted:
+                        delete.append(item_id)
+                    elif wanted[line] != quantity:
+                        update.append(OrderItem(id=item_id, quantity=wanted[line]))
+
+                create += [
+                    OrderItem(
+                        order=orders[order_id],
+                        quantity=quantity,
+                        market_id=existing[kind][item_id],
+                        **{f'{kind}_id': item_id},
+                    )
+                    for (kind, item_id), quantity in wanted.items()
+                    if (kind, item_id) not in have
+                ]
+
+                if len(create) + len(update) + len(delete) != before:
+                    changed.append(orders[order_id])
+
+            OrderItem.objects.filter(id__in=delete).delete()
+            OrderItem.objects.bulk_update(update, ['quantity'], batch_size=cls.BATCH_SIZE)
+            OrderItem.objects.bulk_create(create, batch_size=cls.BATCH_SIZE)
+            OrderInbox.assign_markets([order.id for order in changed])
+
+            for order in changed:
+                # a changed cart has to be checked out again
+                StockReservationCore.release(order)
+                OrderTotals.clear(order)
+
+        stale = [user_id for user_id, (order_id, _) in carts.items() if order_id not in orders]
+        if stale:
+            conn.delete(*[cls._key(user_id) for user_id in stale])
+
+        return {
+            user_id: orders[order_id] for user_id, (order_id, _) in carts.items()
+            if order_id in orders
+        }
+
+    @classmethod
+    def persist(cls, user):
+        """Writes the cart of user into its pending order now. Returns the order."""
+        cls.load(user)
+        order = cls._write([user.id]).get(str(user.id))
+        if order is None:
+            # the order was placed or removed meanwhile, start a new cart
+            cls.load(user)
+            order = Order.get_or_create_order(user)
+        return order
+
+    @classmethod
+    def flush(cls):
+        """
+        Writes the carts changed since the last flush. Returns their number.
+        The dirty set is renamed first, so carts changed during the flush
+        are written next time; a processing set left over by a crashed
+        flush is written before the new one.
+        """
+        conn = get_redis_connection()
+
+        if not conn.exists(cls.PROCESSING_KEY):
+            try:
+                conn.rename(cls.DIRTY_KEY, cls.PROCESSING_KEY)
+            except redis.ResponseError:
+                # no changed carts
+                return 0
+
+        user_ids = sorted(conn.smembers(cls.PROCESSING_KEY))
+        for start in range(0, len(user_ids), cls.BATCH_SIZE):
+            cls._write(user_ids[start:start + cls.BATCH_SIZE])
+
+        conn.delete(cls.PROCESSING_KEY)
+        return len(user_ids)
+
+
+class OrderInbox:
+    """
+    The orders placed with a user's markets, newest first, one keyset page
+    at a time.
+
+    Order.market and OrderItem.market are copied from the products when the
+    items are written, so a page is a range scan on (market, status,
+    created_at) whatever the size of the order table. Orders spanning
+    markets have no Order.market; they are read through the items'
+    (market, created_at) index and merged into the same stream, as
+    ProductListStream does with affiliate products.
+    """
+    DEFAULT_LIMIT = 20
+    MAX_LIMIT = 100
+    CURSOR = DATETIME_CURSOR  # (created_at, id)
+
+    @staticmethod
+    def sort_key(order):
+        return order.created_at, order.id
+
+    @staticmethod
+    def assign_markets(order_ids):
+        """Sets Order.market of the orders from the markets of their items."""
+        if not order_ids:
+            return
+
+        rows = OrderItem.objects.filter(
+            order_id__in=order_ids,
+        ).values('order_id').annotate(
+            markets=ArrayAgg('market_id', distinct=True),
+        ).values_list('order_id', 'markets')
+        markets = dict(rows)
+
+        orders = [
+            Order(
+                id=order_id,
+                market_id=markets[order_id][0] if len(markets.get(order_id, [])) == 1 else None,
+            )
+            for order_id in order_ids
+        ]
+        Order.objects.bulk_update(orders, ['market'])
+
+    @classmethod
+    def _page(cls, queryset, limit, cursor):
+        queryset = queryset.order_by('-created_at', '-id')
+
+        if cursor:
+            created_at, order_id = cls.CURSOR.decode(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at)
+                | Q(created_at=created_at, id__lt=order_id)
+            )
+
+        return list(
+            OrderTotals.annotate(queryset).prefetch_related(
+                OrderTotals.items(),
+            )[:limit + 1]
+        )
+
+    @classmethod
+    def page(cls, user, status=None, since=None, until=None, limit=DEFAULT_LIMIT, cursor=None):
+        """
+        Returns (orders, next_cursor) for the markets of user, optionally
+        with one status and created in [since, until).
+        """
+        limit = min(limit, cls.MAX_LIMIT)
+        market_ids = list(Market.objects.filter(user=user).values_list('id', flat=True))
+        if not market_ids:
+            return [], None
+
+        filters = Q()
+        if status:
+            filters &= Q(status=status)
+        if since:
+            filters &= Q(created_at__gte=since)
+        if until:
+            filters &= Q(created_at__lt=until)
+
+        orders = cls._page(
+            Order.objects.filter(filters, market_id__in=market_ids),
+            limit,
+            cursor,
+        )
+        mixed = cls._page(
+            Order.objects.filter(
+                filters,
+                market__isnull=True,
+                id__in=OrderItem.objects.filter(
+                    market_id__in=market_ids,
+                ).values('order_id'),
+            ),
+            limit,
+            cursor,
+        )
+        orders = list(heapq.merge(orders, mixed, key=cls.sort_key, reverse=True))
+
+        next_cursor = None
+        if len(orders) > limit:
+            orders = orders[:limit]
+            next_cursor = cls.CURSOR.encode(orders[-1].created_at, orders[-1].id)
+
+        return orders, next_cursor
+
+    @classmethod
+    def backfill(cls, batch_size=1000):
+        """Fills the market of orders and items written before it existed."""
+        OrderItem.objects.filter(market__isnull=True).update(
+            market_id=Coalesce(
+                Subquery(Product.objects.filter(id=OuterRef('product_id')).values('market_id')[:1]),
+                Subquery(AffiliateProduct.objects.filter(id=OuterRef('affiliate_id')).values('market_id')[:1]),
+            ),
+        )
+
+        order_ids = list(
+            Order.objects.filter(market__isnull=True).values_list('id', flat=True)
+        )
+        for start in range(0, len(order_ids), batch_size):
+            cls.assign_markets(order_ids[start:start + batch_size])
+        return len(order_ids)
+
+
+class SalesRollup:
+    """
+    Daily sales per market and per product, so the owner dashboard reads a
+    row per day instead of aggregating orders.
+
+    A sale is an item of a completed order, or of a cash order its owner
+    verified, counted for the market of the item on the local day that
+    happened (Order.completed_at); paid orders are the online ones, settled
+    through the gateway or a wallet.
+
+    When an order becomes a sale, refresh_order adds its items to the rows
+    with F() increments, and takes them back out if it stops being one.
+    Order.sales_day records the day the rows count it on, so saving an
+    order again changes nothing. The market rows of the order's buckets
+    are locked while they change, so writers of a bucket queue up. Edits
+    to the items of a counted order are not followed.
+
+    The rebuild_sales_rollups command recomputes days from the orders,
+    CHUNK_DAYS at a time, to backfill history or repair the rows.
+    """
+    CHUNK_DAYS = 7
+    BATCH_SIZE = 1000
+
+    @staticmethod
+    def _start(day):
+        return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+    @staticmethod
+    def sold(prefix=''):
+        """Q of the orders that count as sales."""
+        return (
+            Q(**{f'{prefix}status': Order.COMPLETED})
+            | Q(**{f'{prefix}status': Order.VERIFIED, f'{prefix}type': Order.CASH})
+        )
+
+    @staticmethod
+    def is_sold(order):
+        return order.status == Order.COMPLETED or (
+            order.status == Order.VERIFIED and order.type == Order.CASH
+        )
+
+    @classmethod
+    def _rebuild(cls, first_day, last_day):
+        """Recomputes every market's buckets in [first_day, last_day]."""
+        start = cls._start(first_day)
+        end = cls._start(last_day + timedelta(days=1))
+        items = OrderItem.objects.filter(
+            cls.sold('order__'),
+            market__isnull=False,
+            order__completed_at__gte=start,
+            order__completed_at__lt=end,
+        ).annotate(
+            day=TruncDate('order__completed_at'),
+        ).order_by()
+        rows = MarketDailySales.objects.filter(day__gte=first_day, day__lte=last_day)
+        product_rows = ProductDailySales.objects.filter(day__gte=first_day, day__lte=last_day)
+
+        line = OrderTotals._line(OrderTotals.unit_price())
+        paid = Q(order__type=Order.ONLINE)
+        cash = Q(order__type=Order.CASH)
+
+        with transaction.atomic():
+            # the orders first, in the order refresh_order locks rows in
+            completed = Q(completed_at__gte=start, completed_at__lt=end)
+            Order.objects.filter(
+                completed | Q(sales_day__gte=first_day, sales_day__lte=last_day),
+            ).update(
+                sales_day=Case(
+                    When(completed & cls.sold(), then=TruncDate('completed_at')),
+                    default=None,
+                ),
+            )
+
+            buckets = set(items.values_list('market_id', 'day').distinct())
+            MarketDailySales.objects.bulk_create(
+                [MarketDailySales(market_id=market_id, day=day) for market_id, day in buckets],
+                ignore_conflicts=True,
+                batch_size=cls.BATCH_SIZE,
+            )
+            # rebuilds of the same buckets wait here for each other, and the
+            # aggregates below are read once the lock is held
+            locked = list(rows.select_for_update().order_by('market_id', 'day'))
+
+            totals = {
+                (row.pop('market_id'), row.pop('day')): row
+                for row in items.values('market_id', 'day').annotate(
+                    revenue=Sum(line),
+                    paid_revenue=Sum(line, filter=paid),
+                    cash_revenue=Sum(line, filter=cash),
+                    units=Sum('quantity'),
+                    order_count=Count('order', distinct=True),
+                    paid_order_count=Count('order', distinct=True, filter=paid),
+                    cash_order_count=Count('order', distinct=True, filter=cash),
+                )
+            }
+
+            kept, empty = [], []
+            for row in locked:
+                values = totals.get((row.market_id, row.day))
+                if values is None:
+                    # no completed orders left on that day
+                    empty.append(row.id)
+                    continue
+                for field, value in values.items():
+                    setattr(row, field, value or 0)
+                kept.append(row)
+
+            MarketDailySales.objects.filter(id__in=empty).delete()
+            MarketDailySales.objects.bulk_update(
+                kept,
+                [
+                    'revenue',
+                    'paid_revenue',
+                    'cash_revenue',
+                    'units',
+                    'order_count',
+                    'paid_order_count',
+                    'cash_order_count',
+                ],
+                batch_size=cls.BATCH_SIZE,
+            )
+
+            product_rows.delete()
+            ProductDailySales.objects.bulk_create(
+                [
+                    ProductDailySales(**row)
+                    for row in items.values(
+                        'market_id', 'day', 'product_id', 'affiliate_id',
+                    ).annotate(
+                        revenue=Sum(line),
+                        units=Sum('quantity'),
+                        order_count=Count('order', distinct=True),
+                    )
+                ],
+                batch_size=cls.BATCH_SIZE,
+            )
+
+        return len(kept)
+
+    @classmethod
+    def _add(cls, order, day, sign):
+        """Adds (sign 1) or takes back (sign -1) the items of order on day."""
+        items = OrderItem.objects.filter(order=order, market__isnull=False).order_by()
+        line = OrderTotals._line(OrderTotals.unit_price())
+        markets = {
+            row.pop('market_id'): row
+            for row in items.values('market_id').annotate(
+                revenue=Sum(line),
+                units=Sum('quantity'),
+            )
+        }
+        if not markets:
+            return
+
+        MarketDailySales.objects.bulk_create(
+            [MarketDailySales(market_id=market_id, day=day) for market_id in markets],
+            ignore_conflicts=True,
+        )
+        # also guards the product rows of the buckets, which have no
+        # unique key to upsert on
+        list(
+            MarketDailySales.objects.select_for_update().filter(
+                market_id__in=markets,
+                day=day,
+            ).order_by('market_id').values_list('id', flat=True)
+        )
+
+        paid = sign if order.type == Order.ONLINE else 0
+        cash = sign if order.type == Order.CASH else 0
+        for market_id, values in markets.items():
+            revenue = values['revenue'] or 0
+            MarketDailySales.objects.filter(market_id=market_id, day=day).update(
+                revenue=F('revenue') + sign * revenue,
+                paid_revenue=F('paid_revenue') + paid * revenue,
+                cash_revenue=F('cash_revenue') + cash * revenue,
+                units=F('units') + sign * values['units'],
+                order_count=F('order_count') + sign,
+                paid_order_count=F('paid_order_count') + paid,
+                cash_order_count=F('cash_order_count') + cash,
+            )
+
+        for row in items.values('market_id', 'product_id', 'affiliate_id').annotate(
+            revenue=Sum(line),
+            units=Sum('quantity'),
+        ):
+            revenue = row.pop('revenue') or 0
+            units = row.pop('units')
+            updated = ProductDailySales.objects.filter(day=day, **row).update(
+                revenue=F('revenue') + sign * revenue,
+                units=F('units') + sign * units,
+                order_count=F('order_count') + sign,
+            )
+            if not updated and sign > 0:
+                ProductDailySales.objects.create(
+                    day=day,
+                    revenue=revenue,
+                    units=units,
+                    order_count=1,
+                    **row,
+                )
+
+        if sign < 0:
+            MarketDailySales.objects.filter(
+                market_id__in=markets, day=day, order_count=0,
+            ).delete()
+            ProductDailySales.objects.filter(
+                market_id__in=markets, day=day, order_count=0,
+            ).delete()
+
+    @classmethod
+    def refresh_order(cls, order):
+        """
+        Counts order on the day it became a sale, or takes it back out once
+        it no longer is one.
+        """
+        day = None
+        if order.completed_at is not None and cls.is_sold(order):
+            day = timezone.localdate(order.completed_at)
+
+        with transaction.atomic():
+            # the locked sales_day is what the rows hold for this order
+            counted = Order.objects.select_for_update().filter(
+                id=order.id,
+            ).values_list('sales_day', flat=True).first()
+            if counted == day:
+                return
+
+            if counted is not None:
+                cls._add(order, counted, -1)
+            if day is not None:
+                cls._add(order, day, 1)
+            Order.objects.filter(id=order.id).update(sales_day=day)
+        order.sales_day = day
+
+    @classmethod
+    def rebuild(cls, since=None, until=None, chunk_days=CHUNK_DAYS):
+        """
+        Rebuilds every market's days from since to until (both included),
+        defaulting to the first completed order and today. Yields
+        (first_day, last_day, buckets) per chunk.
+        """
+        # orders sold before completed_at existed
+        Order.objects.filter(
+            cls.sold(),
+            completed_at__isnull=True,
+        ).update(completed_at=Coalesce('updated_at', 'created_at'))
+
+        if since is None:
+            first = Order.objects.filter(
+                completed_at__isnull=False,
+            ).order_by('completed_at').values_list('completed_at', flat=True).first()
+            if first is None:
+                return
+            since = timezone.localdate(first)
+        until = until or timezone.localdate()
+
+        day = since
+        while day <= until:
+            last_day = min(day + timedelta(days=chunk_days - 1), until)
+            yield day, last_day, cls._rebuild(day, last_day)
+            day = last_day + timedelta(days=1)
+
+    @staticmethod
+    def daily(market, since, until):
+        return MarketDailySales.objects.filter(
+            market=market,
+            day__gte=since,
+            day__lte=until,
+        ).order_by('day')
+
+    @staticmethod
+    def summary(market, since, until):
+        """Totals of the daily rows of market from since to until."""
+        fields = [
+            'revenue',
+            'paid_revenue',
+            'cash_revenue',
+            'units',
+            'order_count',
+            'paid_order_count',
+            'cash_order_count',
+        ]
+        totals = SalesRollup.daily(market, since, until).order_by().aggregate(
+            **{field: Sum(field) for field in fields}
+        )
+        return {field: value or 0 for field, value in totals.items()}
+
+    @staticmethod
+    def top_products(market, since, until, limit):
+        return ProductDailySales.objects.filter(
+            market=market,
+            day__gte=since,
+            day__lte=until,
+        ).values('product', 'product__name', 'affiliate', 'affiliate__name').annotate(
+            revenue=Sum('revenue'),
+            units=Sum('units'),
+            order_count=Sum('order_count'),
+        ).order_by('-revenue')[:limit]
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.cart.core import OrderInbox
+
+
+class Command(BaseCommand):
+    help = 'Fill Order.market and OrderItem.market for orders placed before they existed'
+
+    def handle(self, *args, **options):
+        count = OrderInbox.backfill()
+        self.stdout.write(f'{count} orders backfilled')
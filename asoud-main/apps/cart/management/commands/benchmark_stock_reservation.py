@@ -0,0 +1,131 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.cart.core import StockReservationCore, OutOfStock
+from apps.cart.models import Order, OrderItem, StockReservation
+from apps.category.models import SubCategory
+from apps.market.models import Market
+from apps.product.models import Product
+from apps.users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Run many parallel checkouts against one product and check that no '
+        'stock is oversold. Creates throwaway rows and deletes them after.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stock', type=int, default=100)
+        parser.add_argument('--checkouts', type=int, default=300)
+        parser.add_argument('--quantity', type=int, default=1)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=50,
+            help='Parallel database connections, keep below max_connections',
+        )
+
+    def setup(self, options):
+        sub_category = SubCategory.objects.first()
+        if sub_category is None:
+            raise CommandError('At least one sub category is needed')
+
+        tag = uuid.uuid4().hex[:10]
+        user = User.objects.create(mobile_number=f'bench{tag}')
+        market = Market.objects.create(
+            user=user,
+            type=Market.SHOP,
+            business_id=f'bench{tag}',
+            name='stock benchmark',
+            sub_category=sub_category,
+        )
+        product = Product.objects.create(
+            market=market,
+            type=Product.GOOD,
+            name='stock benchmark',
+            sub_category=sub_category,
+            main_price=1,
+            stock=options['stock'],
+            ship_cost_pay_type=Product.FREE,
+        )
+
+        orders = Order.objects.bulk_create([
+            Order(user=user, type=Order.ONLINE)
+            for _ in range(options['checkouts'])
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=options['quantity'])
+            for order in orders
+        ])
+
+        return user, product, orders
+
+    def run(self, orders, workers):
+        """Checks out every order in parallel, returns (outcomes, elapsed)."""
+        start = threading.Event()
+
+        def checkout(order):
+            try:
+                # connect first so latencies only cover the reservation
+                connection.ensure_connection()
+                start.wait()
+
+                started = time.monotonic()
+                try:
+                    StockReservationCore.reserve(order)
+                    outcome = 'reserved'
+                except OutOfStock:
+                    outcome = 'out_of_stock'
+                return outcome, time.monotonic() - started
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(checkout, order) for order in orders]
+            started = time.monotonic()
+            start.set()
+            outcomes = [future.result() for future in futures]
+            elapsed = time.monotonic() - started
+
+        return outcomes, elapsed
+
+    def handle(self, *args, **options):
+        user, product, orders = self.setup(options)
+
+        try:
+            outcomes, elapsed = self.run(orders, options['workers'])
+
+            reserved = sum(1 for outcome, _ in outcomes if outcome == 'reserved')
+            held = sum(StockReservation.objects.filter(
+                product=product,
+                status=StockReservation.HELD,
+            ).values_list('quantity', flat=True))
+            stock = Product.objects.get(id=product.id).stock
+            latencies = sorted(latency for _, latency in outcomes)
+
+            self.stdout.write(
+                f'{len(orders)} checkouts in {elapsed:.2f}s, '
+                f'{reserved} reserved, {len(orders) - reserved} out of stock, '
+                f'p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, '
+                f'max {latencies[-1] * 1000:.1f}ms'
+            )
+
+            expected = min(options['stock'] // options['quantity'], len(orders))
+            oversold = held + stock != options['stock'] or stock < 0
+            if oversold or reserved != expected:
+                raise CommandError(
+                    f'Inconsistent stock: {stock} left, {held} held, '
+                    f'{reserved} reserved (expected {expected})'
+                )
+
+            self.stdout.write(f'OK: {stock} left, {held} held, no oversell')
+
+        finally:
+            # deleting the user cascades to the orders, market and product
+            user.delete()
@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.cart.core import CartStore
+
+
+class Command(BaseCommand):
+    help = 'Write the hot carts changed in redis into Order/OrderItem'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep flushing every CART_FLUSH_INTERVAL seconds',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = CartStore.flush()
+            self.stdout.write(f'{flushed} carts flushed')
+
+            if not options['loop']:
+                break
+
+            time.sleep(settings.CART_FLUSH_INTERVAL)
@@ -0,0 +1,39 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from apps.cart.core import SalesRollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily market and product sales rollups from completed orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            type=date.fromisoformat,
+            help='First day to rebuild (YYYY-MM-DD), defaults to the first completed order',
+        )
+        parser.add_argument(
+            '--until',
+            type=date.fromisoformat,
+            help='Last day to rebuild (YYYY-MM-DD), defaults to today',
+        )
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=SalesRollup.CHUNK_DAYS,
+            help='Days rebuilt per transaction',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for first_day, last_day, buckets in SalesRollup.rebuild(
+            since=options['since'],
+            until=options['until'],
+            chunk_days=options['chunk_days'],
+        ):
+            total += buckets
+            self.stdout.write(f'{first_day} - {last_day}: {buckets} market days')
+
+        self.stdout.write(f'{total} market days rebuilt')
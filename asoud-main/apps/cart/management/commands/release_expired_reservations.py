@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.cart.core import StockReservationCore
+
+INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = 'Give the stock of expired checkout reservations back to products'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help=f'Keep releasing every {INTERVAL} seconds',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released = total = StockReservationCore.release_expired()
+            while released == StockReservationCore.RELEASE_BATCH:
+                released = StockReservationCore.release_expired()
+                total += released
+
+            self.stdout.write(f'{total} expired reservations released')
+
+            if not options['loop']:
+                break
+
+            time.sleep(INTERVAL)
@@ -1,7 +1,9 @@
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from apps.base.models import models, BaseModel
 from apps.users.models import User
+from apps.market.models import Market
 from apps.product.models import Product
 from apps.affiliate.models import AffiliateProduct
 
@@ -67,21 +69,108 @@ class Order(BaseModel):
         default=False,
         verbose_name=_('Is Paid')
     )
+    # paid after its stock hold expired and the stock was gone: the owner
+    # has to restock or refund it
+    oversold = models.BooleanField(
+        default=False,
+        verbose_name=_('Oversold')
+    )
+    # snapshot taken when the order is placed, see OrderTotals
+    subtotal = models.DecimalField(
+        max_digits=14,
+        decimal_places=3,
+        blank=True,
+        null=True,
+        verbose_name=_('Subtotal'),
+    )
+    total = models.DecimalField(
+        max_digits=14,
+        decimal_places=3,
+        blank=True,
+        null=True,
+        verbose_name=_('Total'),
+    )
+    item_count = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        verbose_name=_('Item count'),
+    )
+    # when the order became a sale: it completed, or the owner verified it
+    # as a cash order; see SalesRollup
+    completed_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_('Completed at'),
+    )
+    # day whose sales rows count this order, null while they do not
+    sales_day = models.DateField(
+        blank=True,
+        null=True,
+        verbose_name=_('Sales day'),
+    )
+    # market of all the items; null while empty or when they span markets
+    market = models.ForeignKey(
+        Market,
+        related_name='orders',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        verbose_name=_('Market'),
+    )
     
     class Meta:
         ordering = ['-created_at']
         db_table = 'order'
         verbose_name = _('Order')
         verbose_name_plural = _('Orders')
+        indexes = [
+            # keyset pages of the owner order inbox, see OrderInbox
+            models.Index(
+                fields=['market', 'status', '-created_at', '-id'],
+                name='order_market_status_idx',
+            ),
+            models.Index(
+                fields=['market', '-created_at', '-id'],
+                name='order_market_created_idx',
+            ),
+            # days rebuilt by SalesRollup
+            models.Index(
+                fields=['completed_at'],
+                name='order_completed_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Order {str(self.id)[:6]}"
 
+    def save(self, *args, **kwargs):
+        if self.status == self.COMPLETED and self.completed_at is None:
+            self.completed_at = timezone.now()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'completed_at'}
+        if not self._state.adding:
+            # sales_day is written by SalesRollup alone, a stale copy of the
+            # order must not reset it
+            fields = kwargs.get('update_fields')
+            if fields is None:
+                fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key
+                ]
+            kwargs['update_fields'] = [name for name in fields if name != 'sales_day']
+        super().save(*args, **kwargs)
+
     def total_price(self):
-        return sum(item.total_price() for item in self.items.all())
+        if self.total is not None:
+            return self.total
+        from apps.cart.core import OrderTotals
+        return OrderTotals.live(self)['total']
     
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        if self.item_count is not None:
+            return self.item_count
+        from apps.cart.core import OrderTotals
+        return OrderTotals.live(self)['item_count']
     
     @classmethod
     def get_or_create_order(cls, user):
@@ -121,12 +210,41 @@ class OrderItem(BaseModel):
         default=1,
         verbose_name=_('Quantity'),
     )
+    # price paid per unit, stored with the order totals
+    unit_price = models.DecimalField(
+        max_digits=14,
+        decimal_places=3,
+        blank=True,
+        null=True,
+        verbose_name=_('Unit price'),
+    )
+    # copied from the product or affiliate product
+    market = models.ForeignKey(
+        Market,
+        related_name='order_items',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        verbose_name=_('Market'),
+    )
 
     class Meta:
         ordering = ['-created_at']
         db_table = 'order_item'
         verbose_name = _('Order item')
         verbose_name_plural = _('Order items')
+        indexes = [
+            # orders spanning markets in the owner inbox, see OrderInbox
+            models.Index(
+                fields=['market', '-created_at'],
+                name='order_item_market_idx',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.market_id is None and (self.product_id or self.affiliate_id):
+            self.market_id = (self.product or self.affiliate).market_id
+        super().save(*args, **kwargs)
 
     def __str__(self):
         if self.product:
@@ -138,7 +256,12 @@ class OrderItem(BaseModel):
         return f"{self.quantity} x {name}"
 
     def total_price(self):
-        if self.product:
+        # current_unit_price is annotated by OrderTotals.items()
+        if self.unit_price is not None:
+            price = self.unit_price
+        elif getattr(self, 'current_unit_price', None) is not None:
+            price = self.current_unit_price
+        elif self.product:
             price = self.product.main_price
         elif self.affiliate:
             price = self.affiliate.price
@@ -147,3 +270,175 @@ class OrderItem(BaseModel):
         return price * self.quantity
 
 
+
+
+class StockReservation(BaseModel):
+    """Stock taken from a product for an order, see StockReservationCore."""
+    HELD = "held"
+    COMMITTED = "committed"
+    RELEASED = "released"
+
+    STATUS_CHOICES = (
+        (HELD, _("Held")),
+        (COMMITTED, _("Committed")),
+        (RELEASED, _("Released")),
+    )
+
+    order = models.ForeignKey(
+        Order,
+        related_name="reservations",
+        on_delete=models.CASCADE,
+        verbose_name=_('Order'),
+    )
+    product = models.ForeignKey(
+        Product,
+        related_name="reservations",
+        on_delete=models.CASCADE,
+        verbose_name=_('Product'),
+    )
+    quantity = models.PositiveIntegerField(
+        verbose_name=_('Quantity'),
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=HELD,
+        verbose_name=_('Status'),
+    )
+    expires_at = models.DateTimeField(
+        verbose_name=_('Expires at'),
+    )
+
+    class Meta:
+        db_table = 'stock_reservation'
+        verbose_name = _('Stock reservation')
+        verbose_name_plural = _('Stock reservations')
+        indexes = [
+            # the expiry sweep only looks at held rows
+            models.Index(
+                fields=['expires_at'],
+                condition=models.Q(status='held'),
+                name='stock_reservation_held_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} ({self.status})"
+
+
+class MarketDailySales(BaseModel):
+    """Sales of a market on one day, kept by SalesRollup."""
+    market = models.ForeignKey(
+        Market,
+        related_name="daily_sales",
+        on_delete=models.CASCADE,
+        verbose_name=_('Market'),
+    )
+    day = models.DateField(
+        verbose_name=_('Day'),
+    )
+    revenue = models.DecimalField(
+        max_digits=16,
+        decimal_places=3,
+        default=0,
+        verbose_name=_('Revenue'),
+    )
+    paid_revenue = models.DecimalField(
+        max_digits=16,
+        decimal_places=3,
+        default=0,
+        verbose_name=_('Paid revenue'),
+    )
+    cash_revenue = models.DecimalField(
+        max_digits=16,
+        decimal_places=3,
+        default=0,
+        verbose_name=_('Cash revenue'),
+    )
+    units = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Units'),
+    )
+    order_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Order count'),
+    )
+    paid_order_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Paid order count'),
+    )
+    cash_order_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Cash order count'),
+    )
+
+    class Meta:
+        ordering = ['-day']
+        db_table = 'market_daily_sales'
+        verbose_name = _('Market daily sales')
+        verbose_name_plural = _('Market daily sales')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['market', 'day'],
+                name='market_daily_sales_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.market_id} {self.day}"
+
+
+class ProductDailySales(BaseModel):
+    """Sales of a product or affiliate product of a market on one day."""
+    market = models.ForeignKey(
+        Market,
+        related_name="product_daily_sales",
+        on_delete=models.CASCADE,
+        verbose_name=_('Market'),
+    )
+    day = models.DateField(
+        verbose_name=_('Day'),
+    )
+    product = models.ForeignKey(
+        Product,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name=_('Product'),
+    )
+    affiliate = models.ForeignKey(
+        AffiliateProduct,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name=_('Affiliate Product'),
+    )
+    revenue = models.DecimalField(
+        max_digits=16,
+        decimal_places=3,
+        default=0,
+        verbose_name=_('Revenue'),
+    )
+    units = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Units'),
+    )
+    order_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('Order count'),
+    )
+
+    class Meta:
+        ordering = ['-day']
+        db_table = 'product_daily_sales'
+        verbose_name = _('Product daily sales')
+        verbose_name_plural = _('Product daily sales')
+        indexes = [
+            models.Index(
+                fields=['market', 'day'],
+                name='product_daily_sales_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id or self.affiliate_id} {self.day}"
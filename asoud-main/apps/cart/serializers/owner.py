@@ -1,10 +1,15 @@
+from datetime import timedelta
+from django.utils import timezone
 from rest_framework import serializers
 from apps.cart.models import (
+    MarketDailySales,
     Order,
     OrderItem
 )
 from apps.product.models import Product
 from apps.affiliate.models import AffiliateProduct
+from apps.cart.core import OrderInbox
+from utils.cursor import CursorField
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -24,6 +29,27 @@ class OrderItemSerializer(serializers.ModelSerializer):
         return "unknown"
     
 
+class OrderInboxQuerySerializer(serializers.Serializer):
+    cursor = CursorField(OrderInbox.CURSOR, required=False)
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=OrderInbox.MAX_LIMIT,
+        default=OrderInbox.DEFAULT_LIMIT,
+    )
+    status = serializers.ChoiceField(
+        choices=[
+            Order.PENDING,
+            Order.VERIFIED,
+            Order.REJECTED,
+            Order.COMPLETED,
+            Order.FAILED,
+        ],
+        required=False,
+    )
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+
 class OrderListSerializer(serializers.ModelSerializer):
     total = serializers.SerializerMethodField()
     class Meta:
@@ -33,10 +59,16 @@ class OrderListSerializer(serializers.ModelSerializer):
             'description', 
             'created_at', 
             'is_paid',
+            'oversold',
+            'status',
+            'market',
             'total'
         ]
 
     def get_total(self, obj):
+        # annotated by OrderTotals.annotate in the order views
+        if hasattr(obj, 'current_total'):
+            return obj.current_total
         return obj.total_price()
 
 
@@ -51,6 +83,7 @@ class OrderSerializer(serializers.ModelSerializer):
             'description', 
             'created_at', 
             'is_paid',
+            'oversold',
             'total',
             'status',
             'owner_description',
@@ -64,9 +97,49 @@ class OrderSerializer(serializers.ModelSerializer):
         ]
 
     def get_total(self, obj):
+        # annotated by OrderTotals.annotate in the order views
+        if hasattr(obj, 'current_total'):
+            return obj.current_total
         return obj.total_price()
     
 class OrderVerifySerializer(serializers.Serializer):
     id = serializers.UUIDField()
     verified = serializers.BooleanField()
-    description = serializers.CharField()
\ No newline at end of file
+    description = serializers.CharField()
+
+
+class SalesQuerySerializer(serializers.Serializer):
+    DEFAULT_DAYS = 30
+    MAX_DAYS = 366
+
+    since = serializers.DateField(required=False)
+    until = serializers.DateField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+    def validate(self, attrs):
+        until = attrs.get('until') or timezone.localdate()
+        since = attrs.get('since') or until - timedelta(days=self.DEFAULT_DAYS - 1)
+
+        if since > until:
+            raise serializers.ValidationError("since is after until")
+        if (until - since).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"at most {self.MAX_DAYS} days")
+
+        attrs['since'] = since
+        attrs['until'] = until
+        return attrs
+
+
+class MarketDailySalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MarketDailySales
+        fields = [
+            'day',
+            'revenue',
+            'paid_revenue',
+            'cash_revenue',
+            'units',
+            'order_count',
+            'paid_order_count',
+            'cash_order_count',
+        ]
@@ -1,3 +1,5 @@
+import functools
+
 from rest_framework import serializers
 from apps.cart.models import (
     Order, 
@@ -6,12 +8,17 @@ from apps.cart.models import (
 from apps.product.models import Product, ProductImage
 from apps.affiliate.models import AffiliateProduct, AffiliateProductImage
 from django.db import transaction
+from apps.cart.signals import discard_cart
+from utils.images import ImageVariantField
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    image_thumb = ImageVariantField(source='image', variant='thumb')
+    image_webp = ImageVariantField(source='image', variant='webp')
+
     class Meta:
         model = ProductImage
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'image_thumb', 'image_webp')
 
 
 class ProductSimpleSerializer(serializers.ModelSerializer):
@@ -23,9 +30,12 @@ class ProductSimpleSerializer(serializers.ModelSerializer):
 
 
 class AffiliateImageSerializer(serializers.ModelSerializer):
+    image_thumb = ImageVariantField(source='image', variant='thumb')
+    image_webp = ImageVariantField(source='image', variant='webp')
+
     class Meta:
         model = AffiliateProductImage
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'image_thumb', 'image_webp')
 
 
 class AffiliateSimpleSerializer(serializers.ModelSerializer):
@@ -201,12 +211,38 @@ class Order2Serializer(serializers.ModelSerializer):
         fields = ['id', 'items', 'total_price', 'total_items', 'created_at', 'updated_at']
     
     def get_total_price(self, obj):
+        if hasattr(obj, 'current_total'):
+            return obj.current_total
         return obj.total_price()
     
     def get_total_items(self, obj):
+        if hasattr(obj, 'current_item_count'):
+            return obj.current_item_count
         return obj.total_items()
     
 
+class CartItemSerializer(serializers.Serializer):
+    """A CartLine of the hot cart, in the shape of OrderItem1Serializer."""
+    id = serializers.UUIDField(read_only=True)
+    quantity = serializers.IntegerField(read_only=True)
+    total_price = serializers.ReadOnlyField()
+    item = serializers.SerializerMethodField()
+    item_type = serializers.CharField(read_only=True)
+
+    def get_item(self, obj):
+        return {'id': str(obj.item.id), 'name': obj.item.name}
+
+
+class CartSerializer(serializers.Serializer):
+    """A hot Cart, in the shape of Order2Serializer."""
+    id = serializers.UUIDField(read_only=True)
+    items = CartItemSerializer(many=True, read_only=True)
+    total_price = serializers.ReadOnlyField()
+    total_items = serializers.ReadOnlyField()
+    created_at = serializers.DateTimeField(read_only=True)
+    updated_at = serializers.DateTimeField(read_only=True)
+
+
 class OrderCheckOutSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
@@ -254,6 +290,9 @@ class OrderListSerializer(serializers.ModelSerializer):
         ]
 
     def get_total(self, obj):
+        # annotated by OrderTotals.annotate in the order views
+        if hasattr(obj, 'current_total'):
+            return obj.current_total
         return obj.total_price()
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -281,6 +320,9 @@ class OrderSerializer(serializers.ModelSerializer):
         ]
 
     def get_total(self, obj):
+        # annotated by OrderTotals.annotate in the order views
+        if hasattr(obj, 'current_total'):
+            return obj.current_total
         return obj.total_price()
     
 class OrderCreateSerializer(serializers.ModelSerializer):
@@ -296,39 +338,69 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             'items'
         ]
 
+    def validate_items(self, items):
+        """
+        Resolves every item id to a product or affiliate product with two
+        id__in queries, so a 50 line order costs the same as a single one.
+        """
+        ids = {item['product_id'] for item in items}
+        products = Product.objects.select_related('market').in_bulk(ids)
+        affiliates = AffiliateProduct.objects.select_related('market').in_bulk(
+            ids - set(products)
+        )
+
+        missing = [str(item_id) for item_id in ids if item_id not in products and item_id not in affiliates]
+        if missing:
+            raise serializers.ValidationError(
+                f"Neither product nor affiliate found for id {', '.join(sorted(missing))}."
+            )
+
+        for item in items:
+            item['product'] = products.get(item['product_id'])
+            item['affiliate'] = affiliates.get(item['product_id'])
+        return items
+
+    @property
+    def market_owner_ids(self):
+        """Users owning the markets of the validated items, to be notified."""
+        return list(dict.fromkeys(
+            (item['product'] or item['affiliate']).market.user_id
+            for item in self.validated_data.get('items', [])
+        ))
+
+    @staticmethod
+    def create_items(order, items_data):
+        items = OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=item_data['product'],
+                affiliate=item_data['affiliate'],
+                market_id=(item_data['product'] or item_data['affiliate']).market_id,
+                quantity=item_data['quantity'],
+            )
+            for item_data in items_data
+        ])
+
+        markets = {item.market_id for item in items}
+        order.market_id = markets.pop() if len(markets) == 1 else None
+        order.save(update_fields=['market', 'updated_at'])
+
+        if order.status == Order.PENDING:
+            # the redis cart of the order would write its old lines back over
+            # these, it is reloaded from them on next use
+            transaction.on_commit(functools.partial(discard_cart, order))
+
     def create(self, validated_data):
         items_data = validated_data.pop('items')
-        
-        order = Order.objects.create(**validated_data)
-        
-        # add items
-        for item_data in items_data:
-            
-            try:
-                product = Product.objects.get(id=item_data['product_id'])
-            except:
-                product = None
-            try:
-                affiliate = AffiliateProduct.objects.get(id=item_data['product_id'])
-            except:
-                affiliate = None
-            
-            if not product and not affiliate:
-                order.delete()
-                raise Exception('One or More Products were Not Found')
-            
-            OrderItem.objects.create(
-                order=order, 
-                product=product, 
-                affiliate=affiliate,
-                quantity=item_data['quantity'], 
-            )
-        
+
+        with transaction.atomic():
+            order = Order.objects.create(**validated_data)
+            self.create_items(order, items_data)
+
         return order
-    
 
     def update(self, instance, validated_data):
-        items_data = validated_data.pop('items')
+        items_data = validated_data.pop('items', None)
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -336,42 +408,9 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         with transaction.atomic():
             # If new items are provided, replace the old ones
             if items_data is not None:
-                # Delete existing items
                 instance.items.all().delete()
+                self.create_items(instance, items_data)
 
-                # Add new items
-                for item_data in items_data:
-                    product_id = item_data.get('product_id')
-                    quantity = item_data.get('quantity')
-
-                    product = None
-                    affiliate = None
-
-                    # Fetch product or affiliate
-                    if product_id:
-                        try:
-                            product = Product.objects.get(id=product_id)
-                        except Product.DoesNotExist:
-                            pass
-
-                        try:
-                            affiliate = AffiliateProduct.objects.get(id=product_id)
-                        except AffiliateProduct.DoesNotExist:
-                            pass  
-
-                    if not product and not affiliate:
-                        raise serializers.ValidationError(f"Neither product nor affiliate found for id {product_id}.")
-
-                    # Create the OrderItem
-                    OrderItem.objects.create(
-                        order=instance,
-                        product=product,
-                        affiliate=affiliate,
-                        quantity=quantity
-                    )
-
-        # Save the updated Order instance
-        instance.save()
+            instance.save()
 
         return instance
-    
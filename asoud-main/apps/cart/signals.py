@@ -0,0 +1,35 @@
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from redis import RedisError
+from apps.cart.models import Order
+from apps.cart.core import CartStore, SalesRollup, StockReservationCore
+
+
+def discard_cart(order):
+    try:
+        CartStore.discard(order.user_id, order.id)
+    except RedisError:
+        # a stale cart is dropped by the next flush, which finds its order
+        # no longer pending
+        pass
+
+
+@receiver(pre_delete, sender=Order)
+def release_order_stock(sender, instance, **kwargs):
+    # the reservations cascade with the order, give their stock back first
+    StockReservationCore.release(instance)
+    discard_cart(instance)
+
+
+@receiver(post_save, sender=Order)
+def drop_placed_cart(sender, instance, **kwargs):
+    # once the order is paid, verified or rejected the user starts a new cart
+    if instance.status != Order.PENDING:
+        discard_cart(instance)
+
+
+@receiver(post_save, sender=Order)
+def refresh_sales_rollup(sender, instance, **kwargs):
+    # also after a counted order is reverted, to take it back out
+    if instance.completed_at is not None or instance.sales_day is not None:
+        SalesRollup.refresh_order(instance)
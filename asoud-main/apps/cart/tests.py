@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from apps.cart.core import CartStore
+from apps.cart.models import Order, OrderItem
+from apps.cart.serializers.user import OrderCreateSerializer
+from apps.category.models import Category, Group, SubCategory
+from apps.market.models import Market
+from apps.product.models import Product
+from apps.users.models import User
+from utils.redis_client import get_redis_connection
+
+
+class CartStoreDirectWriteTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(mobile_number='09120000001')
+        group = Group.objects.create(title='group', market_fee=0)
+        category = Category.objects.create(group=group, title='category', market_fee=0)
+        sub_category = SubCategory.objects.create(category=category, title='sub', market_fee=0)
+        market = Market.objects.create(
+            user=self.user,
+            type=Market.SHOP,
+            business_id='carttest',
+            name='cart test',
+            sub_category=sub_category,
+        )
+        self.old, self.new = [
+            Product.objects.create(
+                market=market,
+                type=Product.GOOD,
+                name=name,
+                sub_category=sub_category,
+                main_price=1000,
+                stock=10,
+                ship_cost_pay_type=Product.FREE,
+            )
+            for name in ('old', 'new')
+        ]
+        self.addCleanup(get_redis_connection().delete, CartStore._key(self.user.id))
+
+    def test_update_of_pending_order_discards_its_cart(self):
+        order = Order.get_or_create_order(self.user)
+        OrderItem.objects.create(order=order, product=self.old, quantity=1)
+        CartStore.load(self.user)
+        conn = get_redis_connection()
+        self.assertTrue(conn.exists(CartStore._key(self.user.id)))
+
+        serializer = OrderCreateSerializer(
+            order,
+            data={'items': [{'product_id': str(self.new.id), 'quantity': 2}]},
+            partial=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save(user=self.user)
+
+        self.assertFalse(conn.exists(CartStore._key(self.user.id)))
+
+        # the write-behind flush no longer brings the old line back
+        CartStore.flush()
+        self.assertEqual(
+            list(order.items.values_list('product_id', 'quantity')),
+            [(self.new.id, 2)],
+        )
+        # and the cart reloads from the new items
+        self.assertEqual(
+            [(line.id, line.quantity) for line in CartStore.get(self.user).items],
+            [(self.new.id, 2)],
+        )
+
+    def test_add_after_a_concurrent_discard_reloads_the_cart(self):
+        order = Order.get_or_create_order(self.user)
+        load = CartStore.load.__func__
+        calls = []
+
+        def load_then_discard(cls, user):
+            load(cls, user)
+            if not calls:
+                # the order is placed by another request right after load()
+                CartStore.discard(user.id)
+            calls.append(user)
+
+        with mock.patch.object(CartStore, 'load', classmethod(load_then_discard)):
+            self.assertEqual(CartStore.add(self.user, 'product', self.new.id, 2), 2)
+
+        self.assertEqual(len(calls), 2)
+        cart = CartStore.get(self.user)
+        self.assertEqual(cart.id, str(order.id))
+        self.assertEqual([(line.id, line.quantity) for line in cart.items], [(self.new.id, 2)])
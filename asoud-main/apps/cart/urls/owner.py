@@ -3,6 +3,8 @@ from apps.cart.views.owner import (
     OrderVerifyView,
     OrderListView,
     OrderDetailView,
+    SalesDailyView,
+    SalesProductsView,
 )
 app_name = 'owner_order'
 
@@ -15,6 +17,14 @@ urlpatterns = [
          OrderListView.as_view(), 
          name='order-create'
     ),
+    path('sales/<str:pk>/daily',
+         SalesDailyView.as_view(),
+         name='sales-daily'
+    ),
+    path('sales/<str:pk>/products',
+         SalesProductsView.as_view(),
+         name='sales-products'
+    ),
     path('<str:pk>', 
          OrderDetailView.as_view(), 
          name='order-detail'
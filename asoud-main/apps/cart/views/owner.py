@@ -1,18 +1,30 @@
 from rest_framework import views, status, permissions
 from rest_framework.response import Response
+from django.db import transaction
+from django.utils import timezone
 from utils.response import ApiResponse
-from django.db.models import Q
 from apps.cart.models import (
     Order,
     OrderItem
 )
+from apps.cart.core import (
+    OrderInbox,
+    OrderTotals,
+    OutOfStock,
+    SalesRollup,
+    StockReservationCore,
+)
 from apps.cart.serializers.owner import (
+    MarketDailySalesSerializer,
+    OrderInboxQuerySerializer,
     OrderSerializer,
     OrderListSerializer,
-    OrderVerifySerializer
+    OrderVerifySerializer,
+    SalesQuerySerializer,
 )
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from apps.cart.views.user import out_of_stock
+from apps.notification.core import NotificationOutbox
+from apps.product.views.owner_views import get_owned_market
 
 
 class OrderVerifyView(views.APIView):
@@ -31,30 +43,35 @@ class OrderVerifyView(views.APIView):
                     )
                 )
 
-            if serializer.validated_data['verified']:
+            verified = serializer.validated_data['verified']
+            if verified:
                 order.status = Order.VERIFIED
+                if order.type == Order.CASH:
+                    # a verified cash order is a sale, counted by SalesRollup
+                    order.completed_at = timezone.now()
             else:
                 order.status = Order.REJECTED
             
             order.owner_description = serializer.validated_data['description']
-            order.save()
-
-            user_id = order.user.id
 
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"user_{user_id}",
-                {
-                    "type": "send_notification",
-                    "data": {
+            with transaction.atomic():
+                # a verified order keeps its stock, a rejected one gives it back
+                if verified:
+                    StockReservationCore.commit(order)
+                else:
+                    StockReservationCore.release(order)
+                # with completed_at set, saving refreshes the sales rollup
+                order.save()
+                NotificationOutbox.enqueue(
+                    f"user_{order.user_id}",
+                    {
                         "type": "order",
                         "message": "Order Status Updated By Owner",
                         "order": {
                             "id": str(order.id),
                         },
-                    }
-                }
-            )
+                    },
+                )
 
             serializer = OrderSerializer(order)
 
@@ -66,6 +83,8 @@ class OrderVerifyView(views.APIView):
                 )
             )
 
+        except OutOfStock as e:
+            return out_of_stock(e)
         except Exception as e:
             return Response(
                 ApiResponse(
@@ -78,25 +97,38 @@ class OrderVerifyView(views.APIView):
 
 class OrderListView(views.APIView):
     def get(self, request):
-        market_owner_orders = Order.objects.filter(
-            Q( items__product__market__user=request.user ) | 
-            Q( items__affiliate__market__user=request.user )
-        ).distinct()
+        query = OrderInboxQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
 
-        serializer = OrderListSerializer(market_owner_orders, many=True)
+        orders, next_cursor = OrderInbox.page(
+            request.user,
+            status=params.get('status'),
+            since=params.get('since'),
+            until=params.get('until'),
+            limit=params['limit'],
+            cursor=params.get('cursor'),
+        )
+
+        serializer = OrderListSerializer(orders, many=True)
 
         return Response(
             ApiResponse(
                 success=True,
                 code=200,
-                data=serializer.data
+                data={
+                    'results': serializer.data,
+                    'next': next_cursor,
+                },
             )
         )
     
 class OrderDetailView(views.APIView):
     def get(self, request, pk:str):
         try:
-            order = Order.objects.get(id=pk)
+            order = OrderTotals.annotate(
+                Order.objects.all(),
+            ).prefetch_related(OrderTotals.items()).get(id=pk)
             
             serializer = OrderSerializer(order)
             return Response(
@@ -115,3 +147,56 @@ class OrderDetailView(views.APIView):
                     error=str(e)
                 )
             )
+
+
+class SalesDailyView(views.APIView):
+    def get(self, request, pk):
+        market, error = get_owned_market(request, pk)
+        if error:
+            return error
+
+        query = SalesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        since = query.validated_data['since']
+        until = query.validated_data['until']
+
+        days = MarketDailySalesSerializer(
+            SalesRollup.daily(market, since, until),
+            many=True,
+        )
+
+        return Response(
+            ApiResponse(
+                success=True,
+                code=200,
+                data={
+                    'summary': SalesRollup.summary(market, since, until),
+                    'days': days.data,
+                },
+            )
+        )
+
+
+class SalesProductsView(views.APIView):
+    def get(self, request, pk):
+        market, error = get_owned_market(request, pk)
+        if error:
+            return error
+
+        query = SalesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        products = SalesRollup.top_products(
+            market,
+            query.validated_data['since'],
+            query.validated_data['until'],
+            query.validated_data['limit'],
+        )
+
+        return Response(
+            ApiResponse(
+                success=True,
+                code=200,
+                data=list(products),
+            )
+        )
@@ -1,12 +1,19 @@
 from rest_framework import views, viewsets, status, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from django.db import transaction
+from django.db.models.functions import Coalesce
 from utils.response import ApiResponse
+from utils.idempotency import idempotent
 from apps.cart.models import (
     Order,
     OrderItem
 )
+from apps.affiliate.models import AffiliateProduct
+from apps.cart.core import StockReservationCore, OutOfStock, OrderTotals, CartStore
 from apps.cart.serializers.user import(
+    CartSerializer,
+    CartItemSerializer,
     OrderSerializer,
     Order2Serializer,
     OrderItem2Serializer,
@@ -15,103 +22,132 @@ from apps.cart.serializers.user import(
     OrderItemSerializer,
     OrderItemUpdateSerializer
 )
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from apps.product.models import Product
+from apps.notification.core import NotificationOutbox
+
+
+def out_of_stock(error):
+    return Response(
+        ApiResponse(
+            success=False,
+            code=409,
+            error="Out of stock",
+            data={'products': error.product_ids},
+        ),
+        status=status.HTTP_409_CONFLICT
+    )
+
+
+def with_items(order):
+    """order re-read with its totals and items, in two queries"""
+    return OrderTotals.annotate(
+        Order.objects.filter(id=order.id),
+    ).prefetch_related(OrderTotals.items()).get()
+
+
+def notify_market_owners(user_ids, order, message):
+    NotificationOutbox.enqueue_many(
+        [f"user_{user_id}" for user_id in user_ids],
+        {
+            "type": "order",
+            "message": message,
+            "order": {
+                "id": str(order.id),
+            },
+        },
+    )
 
 
 class CartViewSet(viewsets.ViewSet):
+    """
+    The hot cart of the user, kept in redis by CartStore. Its lines are
+    addressed by product or affiliate product id and reach the database at
+    checkout or on the next flush_carts run.
+    """
     permission_classes = [permissions.IsAuthenticated]
-    
-    def get_order(self, request):
-        """Helper method to get or create order"""
-        return Order.get_or_create_order(request.user)
+
+    def serialize(self, order):
+        return Order2Serializer(with_items(order)).data
+
+    def not_found(self):
+        return Response(
+            {"error": "Item not found in order"}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    def line(self, request, item_id):
+        cart = CartStore.get(request.user, [item_id])
+        if not cart.items:
+            return None
+        return CartItemSerializer(cart.items[0]).data
     
     def list(self, request):
         """Get order contents"""
-        order = self.get_order(request)
-        print('order', order)
-        serializer = Order2Serializer(order)
-        return Response(serializer.data)
+        return Response(CartSerializer(CartStore.get(request.user)).data)
     
     def add_item(self, request):
         """Add item to cart"""
-        order = self.get_order(request)
         serializer = OrderItem2Serializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         product = serializer.validated_data.get('product', None)
         product_name = serializer.validated_data.get('product_name', None)
         affiliate = serializer.validated_data.get('affiliate', None)
         affiliate_name = serializer.validated_data.get('affiliate_name', None)
-        quantity = serializer.validated_data.get('quantity', None)
+        quantity = serializer.validated_data.get('quantity', 1)
+
         if product:
-            if existing_product := order.items.filter(product=product).first():
-                existing_product.quantity += quantity
-                existing_product.save()
-                serializer = OrderItem2Serializer(existing_product)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            serializer.save(order=order)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            kind, item_id = 'product', product.id
         elif product_name:
-            if existing_product := order.items.filter(product__name=product_name).first():
-                existing_product.quantity += quantity
-                existing_product.save()
-                serializer = OrderItem2Serializer(existing_product)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            return Response(serializer.save(order=order), status=status.HTTP_201_CREATED)
-        if affiliate:
-            if existing_affiliate := order.items.filter(affiliate=affiliate).first():
-                existing_affiliate.quantity += quantity
-                existing_affiliate.save()
-                serializer = OrderItem2Serializer(existing_affiliate) 
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            serializer.save(order=order)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            kind = 'product'
+            item_id = Product.objects.filter(name=product_name).values_list('id', flat=True).first()
+        elif affiliate:
+            kind, item_id = 'affiliate', affiliate.id
         elif affiliate_name:
-            if existing_affiliate := order.items.filter(affiliate__name=affiliate_name).first():
-                existing_affiliate.quantity += quantity
-                existing_affiliate.save()
-                serializer = OrderItem2Serializer(existing_affiliate)
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            return Response(serializer.save(order=order), status=status.HTTP_201_CREATED)
-           
-    def update_item(self, request, pk=None):
-        """Update item quantity in cart"""
-        order = self.get_order(request)
-        try:
-            item = order.items.get(pk=pk)
-        except OrderItem.DoesNotExist:
+            kind = 'affiliate'
+            item_id = AffiliateProduct.objects.filter(
+                name=affiliate_name,
+            ).values_list('id', flat=True).first()
+        else:
             return Response(
-                {"error": "Item not found in order"}, 
+                {"error": "product or affiliate is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if item_id is None:
+            return Response(
+                {"error": "Product not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
-    
+
+        CartStore.add(request.user, kind, item_id, quantity)
+        return Response(self.line(request, item_id), status=status.HTTP_201_CREATED)
+           
+    def update_item(self, request, pk=None):
+        """Update item quantity in cart"""
         serializer = OrderItemUpdateSerializer(
-            item, 
             data=request.data, 
             partial=True,
             context={'request': request}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()  # No need to pass order since it's already set
-    
-        return Response(serializer.data)
+        quantity = serializer.validated_data.get('quantity')
+
+        if quantity is not None and not CartStore.update(request.user, pk, quantity):
+            return self.not_found()
+
+        data = self.line(request, pk)
+        if data is None:
+            return self.not_found()
+        return Response(data)
     
     def remove_item(self, request, pk=None):
         """Remove item from order"""
-        order = self.get_order(request)
-        try:
-            item = order.items.get(pk=pk)
-            item.delete()
-            serializer = Order2Serializer(order)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except OrderItem.DoesNotExist:
-            return Response(
-                {"error": "Item not found in order"}, 
-                status=status.HTTP_404_NOT_FOUND
-            )
+        if not CartStore.remove(request.user, pk):
+            return self.not_found()
+        return Response(CartSerializer(CartStore.get(request.user)).data, status=status.HTTP_200_OK)
         
     def checkout(self, request):
-        order = self.get_order(request)
+        order = CartStore.persist(request.user)
         serializer = OrderCheckOutSerializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         
@@ -122,45 +158,39 @@ class CartViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        try:
+            StockReservationCore.reserve(order)
+        except OutOfStock as e:
+            return out_of_stock(e)
+
+        OrderTotals.snapshot(order)
+
         order.status = Order.PENDING 
         order.description = serializer.validated_data.get('description', 'Order placed')
         order.type = serializer.validated_data.get('type', Order.ONLINE)
         order.save()
 
-        serializer = Order2Serializer(order)
         return Response(
-            {"message": "Order placed successfully", "order": serializer.data},
+            {"message": "Order placed successfully", "order": self.serialize(order)},
             status=status.HTTP_200_OK
         )
 
 class OrderCreateView(views.APIView):
+    @idempotent('order-create')
     def post(self, request):
         serializer = OrderCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        obj = serializer.save(user=request.user)
-        
-        if obj.items.first().product:
-            user_id = obj.items.first().product.market.user.id
-        else:
-            user_id = obj.items.first().affiliate.market.user.id
-
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"user_{user_id}",
-            {
-                "type": "send_notification",
-                "data": {
-                    "type": "order",
-                    "message": "New Order Added",
-                    "order": {
-                        "id": str(obj.id),
-                    },
-                }
-            }
-        )
+        try:
+            with transaction.atomic():
+                obj = serializer.save(user=request.user)
+                StockReservationCore.reserve(obj)
+                OrderTotals.snapshot(obj)
+                notify_market_owners(serializer.market_owner_ids, obj, "New Order Added")
+        except OutOfStock as e:
+            return out_of_stock(e)
 
-        serialized_data = OrderSerializer(obj).data
+        serialized_data = OrderSerializer(with_items(obj)).data
 
         return Response(
             ApiResponse(
@@ -172,7 +202,9 @@ class OrderCreateView(views.APIView):
 
 class OrderListView(views.APIView):
     def get(self, request):
-        orders = Order.objects.filter(user=request.user)
+        orders = OrderTotals.annotate(
+            Order.objects.filter(user=request.user),
+        ).prefetch_related(OrderTotals.items())
 
         serializer = OrderSerializer(orders, many=True)
         return Response(
@@ -186,7 +218,9 @@ class OrderListView(views.APIView):
 class OrderDetailView(views.APIView):
     def get(self, request, pk:str):
         try:
-            order = Order.objects.get(id=pk)
+            order = OrderTotals.annotate(
+                Order.objects.all(),
+            ).prefetch_related(OrderTotals.items()).get(id=pk)
 
             serializer = OrderSerializer(order)
             return Response(
@@ -209,34 +243,38 @@ class OrderDetailView(views.APIView):
 class OrderUpdateView(views.APIView):
     def put(self, request, pk:str):
         try:
-            order = Order.objects.get(id=pk)
+            with transaction.atomic():
+                # locked, so a payment can't complete it while it is edited
+                order = Order.objects.select_for_update().get(id=pk)
+                if order.status != Order.PENDING:
+                    # a placed order keeps its items, stock and totals
+                    return Response(
+                        ApiResponse(
+                            success=False,
+                            code=409,
+                            error="Order is Not Pending"
+                        ),
+                        status=status.HTTP_409_CONFLICT
+                    )
 
-            serializer = OrderCreateSerializer(order, data=request.data, partial=True)
-            serializer.is_valid(raise_exception=True)
-
-            obj = serializer.save(user=request.user)
-
-            if obj.items.first().product:
-                user_id = obj.items.first().product.market.user.id
-            else:
-                user_id = obj.items.first().affiliate.market.user.id
-
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"user_{user_id}",
-                {
-                    "type": "send_notification",
-                    "data": {
-                        "type": "order",
-                        "message": "An Order Updated",
-                        "order": {
-                            "id": str(obj.id),
-                        },
-                    }
-                }
-            )
+                serializer = OrderCreateSerializer(order, data=request.data, partial=True)
+                serializer.is_valid(raise_exception=True)
+                items_changed = 'items' in serializer.validated_data
+
+                obj = serializer.save(user=request.user)
+                if items_changed:
+                    StockReservationCore.reserve(obj)
+                    OrderTotals.snapshot(obj)
+
+                market_owner_ids = serializer.market_owner_ids
+                if not market_owner_ids:
+                    # items were kept, notify the owners of the current ones
+                    market_owner_ids = OrderItem.objects.filter(order=obj).annotate(
+                        owner=Coalesce('product__market__user', 'affiliate__market__user'),
+                    ).values_list('owner', flat=True).distinct()
+                notify_market_owners(market_owner_ids, obj, "An Order Updated")
 
-            serialized_data = OrderSerializer(obj).data
+            serialized_data = OrderSerializer(with_items(obj)).data
 
             return Response(
                 ApiResponse(
@@ -245,6 +283,8 @@ class OrderUpdateView(views.APIView):
                     data=serialized_data
                 )
             )
+        except OutOfStock as e:
+            return out_of_stock(e)
         except Exception as e:
             return Response(
                 ApiResponse(
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DiscountConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.discount'
+
+    def ready(self):
+        import apps.discount.signals
@@ -0,0 +1,213 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.discount.models import Discount, ProductUserPrice
+from apps.market.models import Market
+from apps.market_subdomain.cache import StorefrontCache
+from apps.product.models import Product, ProductDiscount
+from apps.users.models import User
+
+
+class EffectivePrice:
+    """
+    Precomputed final prices, so listings and carts can filter and sort on
+    them in SQL.
+
+    Product.effective_price is main_price after the best public discount: a
+    ProductDiscount without users, active for `duration` days from its
+    creation. Discounts aimed at users (a ProductDiscount with users, or a
+    Discount code with a `users` list, on the product or its market) become
+    ProductUserPrice rows, only where they beat the public price. Discounts
+    do not stack; the highest percentage wins.
+
+    Discount codes open to everyone and MarketDiscount codes are left out:
+    they only apply once the buyer enters the code.
+
+    Rows are refreshed by the signals in apps.discount.signals and, when a
+    discount runs out, by the refresh_effective_prices command. Prices show
+    on the storefront, so a refresh bumps its cache.
+    """
+    BATCH_SIZE = 500
+    PRICE_STEP = Decimal('0.001')
+
+    @classmethod
+    def apply(cls, price, percentage):
+        percentage = min(percentage, 100)
+        return (price * (100 - percentage) / 100).quantize(cls.PRICE_STEP)
+
+    @staticmethod
+    def annotate(queryset, user=None):
+        """Adds final_price to a Product queryset: what user pays, before codes."""
+        price = Coalesce(F('effective_price'), F('main_price'))
+
+        if user is not None and user.is_authenticated:
+            price = Coalesce(
+                Subquery(
+                    ProductUserPrice.objects.filter(
+                        product=OuterRef('pk'),
+                        user=user,
+                    ).values('price')[:1]
+                ),
+                price,
+            )
+
+        return queryset.annotate(final_price=price)
+
+    @classmethod
+    def refresh(cls, product_ids):
+        product_ids = list(dict.fromkeys(product_ids))
+        for start in range(0, len(product_ids), cls.BATCH_SIZE):
+            cls._refresh(product_ids[start:start + cls.BATCH_SIZE])
+
+    @classmethod
+    def refresh_market(cls, market_id):
+        cls.refresh(
+            Product.objects.filter(market_id=market_id).values_list('id', flat=True)
+        )
+
+    @classmethod
+    def refresh_expired(cls):
+        """Re-prices products whose best discount ran out. Returns their number."""
+        now = timezone.now()
+        product_ids = set(
+            Product.objects.filter(
+                effective_price_until__lte=now,
+            ).values_list('id', flat=True)
+        )
+        product_ids.update(
+            ProductUserPrice.objects.filter(
+                valid_until__lte=now,
+            ).values_list('product_id', flat=True)
+        )
+
+        cls.refresh(product_ids)
+        return len(product_ids)
+
+    @staticmethod
+    def _product_discounts(product_ids, now):
+        """Yields (product_id, percentage, until, user_id or None)."""
+        targets = defaultdict(list)
+        rows = ProductDiscount.users.through.objects.filter(
+            productdiscount__product_id__in=product_ids,
+        ).values_list('productdiscount_id', 'user_id')
+        for discount_id, user_id in rows:
+            targets[discount_id].append(user_id)
+
+        discounts = ProductDiscount.objects.filter(
+            product_id__in=product_ids,
+        ).values_list('id', 'product_id', 'percentage', 'created_at', 'duration')
+
+        for discount_id, product_id, percentage, created_at, duration in discounts:
+            until = created_at + timedelta(days=duration) if duration else None
+            if until is not None and until <= now:
+                continue
+
+            for user_id in targets.get(discount_id, [None]):
+                yield product_id, percentage, until, user_id
+
+    @staticmethod
+    def _targeted_codes(products, now):
+        """Yields (product_id, percentage, until, user_id) for targeted codes."""
+        by_market = defaultdict(list)
+        for product in products:
+            by_market[product.market_id].append(product.id)
+
+        content_types = ContentType.objects.get_for_models(Product, Market)
+        product_type = content_types[Product]
+        market_type = content_types[Market]
+
+        codes = list(
+            Discount.objects.filter(
+                Q(content_type=product_type, object_id__in=[p.id for p in products])
+                | Q(content_type=market_type, object_id__in=list(by_market)),
+                Q(expiry__isnull=True) | Q(expiry__gt=now),
+                Q(limitation=0) | Q(consumed__lt=F('limitation')),
+            ).exclude(
+                users=[],
+            ).values_list('content_type_id', 'object_id', 'percentage', 'expiry', 'users')
+        )
+        if not codes:
+            return
+
+        users = dict(
+            User.objects.filter(
+                mobile_number__in={mobile for *_, mobiles in codes for mobile in mobiles},
+            ).values_list('mobile_number', 'id')
+        )
+
+        for content_type_id, object_id, percentage, expiry, mobiles in codes:
+            if content_type_id == product_type.id:
+                product_ids = [object_id]
+            else:
+                product_ids = by_market[object_id]
+
+            for product_id in product_ids:
+                for mobile in mobiles:
+                    if mobile in users:
+                        yield product_id, percentage, expiry, users[mobile]
+
+    @classmethod
+    def _refresh(cls, product_ids):
+        now = timezone.now()
+        products = list(
+            Product.objects.filter(
+                id__in=product_ids,
+            ).only('id', 'market_id', 'main_price')
+        )
+
+        offers = defaultdict(list)
+        for product_id, percentage, until, user_id in cls._product_discounts(product_ids, now):
+            offers[product_id].append((percentage, until, user_id))
+        for product_id, percentage, until, user_id in cls._targeted_codes(products, now):
+            offers[product_id].append((percentage, until, user_id))
+
+        user_prices = []
+        for product in products:
+            public = [
+                (percentage, until) for percentage, until, user_id in offers[product.id]
+                if user_id is None
+            ]
+            percentage, until = max(public, key=lambda offer: offer[0], default=(0, None))
+
+            product.effective_price = cls.apply(product.main_price, percentage)
+            product.effective_price_until = until
+
+            best = {}
+            for user_percentage, user_until, user_id in offers[product.id]:
+                if user_id is None or user_percentage <= percentage:
+                    continue
+                if user_percentage > best.get(user_id, (0, None))[0]:
+                    best[user_id] = (user_percentage, user_until)
+
+            user_prices += [
+                ProductUserPrice(
+                    product_id=product.id,
+                    user_id=user_id,
+                    price=cls.apply(product.main_price, user_percentage),
+                    percentage=user_percentage,
+                    valid_until=user_until,
+                )
+                for user_id, (user_percentage, user_until) in best.items()
+            ]
+
+        with transaction.atomic():
+            Product.objects.bulk_update(
+                products,
+                ['effective_price', 'effective_price_until'],
+                batch_size=cls.BATCH_SIZE,
+            )
+            ProductUserPrice.objects.filter(product_id__in=product_ids).delete()
+            ProductUserPrice.objects.bulk_create(user_prices, batch_size=cls.BATCH_SIZE)
+
+            for market_id in {product.market_id for product in products}:
+                transaction.on_commit(
+                    lambda market_id=market_id: StorefrontCache.bump(market_id),
+                    robust=True,
+                )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from apps.discount.core import EffectivePrice
+from apps.product.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-price products whose discount ran out; run it periodically. '
+        'With --all, re-price every product (e.g. after deploying).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Re-price every product',
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            product_ids = Product.objects.values_list('id', flat=True).iterator(
+                chunk_size=EffectivePrice.BATCH_SIZE,
+            )
+            count = 0
+            batch = []
+            for product_id in product_ids:
+                batch.append(product_id)
+                if len(batch) == EffectivePrice.BATCH_SIZE:
+                    EffectivePrice.refresh(batch)
+                    count += len(batch)
+                    batch = []
+            EffectivePrice.refresh(batch)
+            count += len(batch)
+        else:
+            count = EffectivePrice.refresh_expired()
+
+        self.stdout.write(f'{count} products re-priced')
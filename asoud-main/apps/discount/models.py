@@ -105,3 +105,56 @@ class Discount(BaseModel):
 
     is_valid.boolean = True  # Display as a boolean icon in the admin
     is_valid.short_description = _("Is Valid")
+
+
+class ProductUserPrice(BaseModel):
+    """
+    A product's price for one user, when a discount aimed at that user beats
+    the public Product.effective_price. Kept by EffectivePrice.
+    """
+    product = models.ForeignKey(
+        Product,
+        related_name='user_prices',
+        on_delete=models.CASCADE,
+        verbose_name=_('Product'),
+    )
+    user = models.ForeignKey(
+        User,
+        related_name='product_prices',
+        on_delete=models.CASCADE,
+        verbose_name=_('User'),
+    )
+    price = models.DecimalField(
+        max_digits=14,
+        decimal_places=3,
+        verbose_name=_('Price'),
+    )
+    percentage = models.PositiveSmallIntegerField(
+        verbose_name=_('Percentage'),
+    )
+    valid_until = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name=_('Valid until'),
+    )
+
+    class Meta:
+        db_table = 'product_user_price'
+        verbose_name = _('Product user price')
+        verbose_name_plural = _('Product user prices')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'user'],
+                name='product_user_price_unique',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['valid_until'],
+                condition=models.Q(valid_until__isnull=False),
+                name='product_user_price_until_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} {self.user_id} {self.price}'
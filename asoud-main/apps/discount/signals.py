@@ -0,0 +1,56 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from apps.discount.core import EffectivePrice
+from apps.discount.models import Discount
+from apps.market.models import Market
+from apps.product.models import Product, ProductDiscount
+
+# EffectivePrice writes with bulk_update/update, so these never re-trigger
+# themselves.
+
+
+def _refresh(product_ids):
+    transaction.on_commit(lambda: EffectivePrice.refresh(product_ids))
+
+
+@receiver(post_save, sender=Product)
+def price_product(sender, instance, update_fields=None, **kwargs):
+    if update_fields and 'main_price' not in update_fields:
+        return
+    _refresh([instance.id])
+
+
+@receiver([post_save, post_delete], sender=ProductDiscount)
+def price_discounted_product(sender, instance, **kwargs):
+    _refresh([instance.product_id])
+
+
+@receiver(m2m_changed, sender=ProductDiscount.users.through)
+def price_discount_users(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if isinstance(instance, ProductDiscount):
+        _refresh([instance.product_id])
+    elif pk_set:
+        # changed from the user side: pk_set holds discount ids
+        _refresh(list(
+            ProductDiscount.objects.filter(
+                id__in=pk_set,
+            ).values_list('product_id', flat=True)
+        ))
+
+
+@receiver([post_save, post_delete], sender=Discount)
+def price_code_target(sender, instance, **kwargs):
+    content_type = ContentType.objects.get_for_id(instance.content_type_id)
+    model = content_type.model_class()
+
+    if model is Product:
+        _refresh([instance.object_id])
+    elif model is Market:
+        market_id = instance.object_id
+        transaction.on_commit(lambda: EffectivePrice.refresh_market(market_id))
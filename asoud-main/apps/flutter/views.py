@@ -1,8 +1,12 @@
+import uuid
+
 from rest_framework import views, status, permissions
 from rest_framework.response import Response
 from utils.response import ApiResponse
 
 from apps.market.models import Market
+from apps.market.core import MarketViewCounter, MarketHostResolver
+from apps.market_subdomain.cache import StorefrontCache
 from apps.market.serializers.user_serializers import (
     MarketListSerializer,
     MarketDetailSerializer
@@ -13,6 +17,48 @@ from apps.advertise.models import Advertisement
 from apps.advertise.serializers import AdvertiseSerializer
 from apps.users.models import UserBankInfo
 from apps.users.serializers import UserBankInfoListSerializer
+
+
+def is_uuid(value):
+    try:
+        uuid.UUID(str(value))
+    except ValueError:
+        return False
+    return True
+
+
+def market_not_found():
+    return Response(
+        ApiResponse(
+            success=False,
+            code=404,
+            error="Market Not Found"
+        ),
+        status=status.HTTP_404_NOT_FOUND
+    )
+
+
+def product_not_found():
+    return Response(
+        ApiResponse(
+            success=False,
+            code=404,
+            error="Product Not Found"
+        ),
+        status=status.HTTP_404_NOT_FOUND
+    )
+
+
+def record_view(market_id, response):
+    """
+    Counts a view of the market once its page was served: a 200, or a 304
+    for a cached 200, so ids of missing markets are not counted.
+    """
+    if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+        MarketViewCounter.record(market_id)
+    return response
+
+
 # Create your views here.
 
 
@@ -30,19 +76,27 @@ class MarketDetailView(views.APIView):
                 ),
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
+
+        if not is_uuid(market_id):
+            return market_not_found()
+
+        # one spelling per market, for the view counter and the cache
+        market_id = str(uuid.UUID(market_id))
+        if not StorefrontCache.market_exists(market_id):
+            return market_not_found()
+
+        return record_view(market_id, StorefrontCache.respond(
+            request,
+            market_id,
+            lambda: self.build(market_id),
+        ))
+
+    def build(self, market_id):
         try:
             market = Market.objects.get(id=market_id)
         except Market.DoesNotExist:
-            return Response(
-                ApiResponse(
-                    success=False,
-                    code=404,
-                    error="Market Not Found"
-                ),
-                status=status.HTTP_404_NOT_FOUND
-            )
-        
+            return market_not_found()
+
         serializer = MarketListSerializer(market)
         return Response(
             ApiResponse(
@@ -67,19 +121,26 @@ class ProductDetailView(views.APIView):
                 ),
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
+
+        market_id = None
+        if is_uuid(product_id):
+            market_id = StorefrontCache.product_market(product_id)
+
+        if not market_id:
+            return product_not_found()
+
+        return StorefrontCache.respond(
+            request,
+            market_id,
+            lambda: self.build(product_id),
+        )
+
+    def build(self, product_id):
         try:
             product = Product.objects.get(id=product_id)
         except Product.DoesNotExist:
-            return Response(
-                ApiResponse(
-                    success=False,
-                    code=404,
-                    error="Product Not Found"
-                ),
-                status=status.HTTP_404_NOT_FOUND
-            )
-        
+            return product_not_found()
+
         serializer = ProductDetailSerializer(product)
 
         return Response(
@@ -133,8 +194,19 @@ class VisitCardView(views.APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request, business_id):
+        market_id = MarketHostResolver.resolve(business_id)
+        if not market_id:
+            return market_not_found()
+
+        return record_view(market_id, StorefrontCache.respond(
+            request,
+            market_id,
+            lambda: self.build(market_id),
+        ))
+
+    def build(self, market_id):
         try:
-            market = Market.objects.get(business_id=business_id)
+            market = Market.objects.get(id=market_id)
 
             serializer = MarketDetailSerializer(market)
 
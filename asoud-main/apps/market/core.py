@@ -0,0 +1,572 @@
+import atexit
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+
+import redis
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.db.models import (
+    ExpressionWrapper,
+    F,
+    FloatField,
+    Func,
+    IntegerField,
+    Q,
+    Value,
+)
+from django.db.models.functions import (
+    ASin,
+    Cast,
+    Cos,
+    Least,
+    Power,
+    Radians,
+    Sin,
+    Sqrt,
+)
+
+from apps.market.models import Market, MarketLocation, MarketSchedule
+from apps.reserve.models import DayOff, ReserveTime
+from utils.redis_client import get_redis_connection, get_pubsub_connection
+from utils.cursor import NUMBER_CURSOR
+
+
+class MarketViewCounter:
+    """
+    Buffers market views and flushes them into Market.view_count in batches.
+
+    Views are added to a redis hash (market id -> pending hits). When redis
+    is unreachable they are kept in a per-process buffer instead, which is
+    written to the database once it is big or old enough. A flusher thread,
+    started with the first buffered view, also writes it every
+    MARKET_VIEW_FLUSH_INTERVAL, so an idle worker does not sit on its
+    counts, and an atexit hook writes what is left when the worker exits.
+    """
+    BUFFER_KEY = 'market:views:buffer'
+    PROCESSING_KEY = 'market:views:processing'
+
+    _lock = threading.Lock()
+    _buffer = Counter()
+    _last_flush = time.monotonic()
+    _flusher = None
+
+    @classmethod
+    def record(cls, market_id):
+        try:
+            get_redis_connection().hincrby(cls.BUFFER_KEY, str(market_id), 1)
+            return
+        except redis.RedisError:
+            pass
+
+        with cls._lock:
+            if cls._flusher is None:
+                cls._start_flusher()
+            cls._buffer[str(market_id)] += 1
+            due = (
+                sum(cls._buffer.values()) >= settings.MARKET_VIEW_FLUSH_THRESHOLD
+                or time.monotonic() - cls._last_flush >= settings.MARKET_VIEW_FLUSH_INTERVAL
+            )
+
+        if due:
+            cls.flush_memory()
+
+    @classmethod
+    def _start_flusher(cls):
+        # called with _lock held
+        cls._flusher = threading.Thread(
+            target=cls._flush_periodically,
+            name='market-view-flusher',
+            daemon=True,
+        )
+        cls._flusher.start()
+        atexit.register(cls.flush_memory)
+
+    @classmethod
+    def _flush_periodically(cls):
+        while True:
+            time.sleep(settings.MARKET_VIEW_FLUSH_INTERVAL)
+            try:
+                cls.flush_memory()
+            except Exception:
+                # kept in the buffer for the next round
+                pass
+            finally:
+                # this thread holds no connection between rounds
+                connection.close()
+
+    @classmethod
+    def flush_memory(cls):
+        with cls._lock:
+            pending = dict(cls._buffer)
+            cls._buffer.clear()
+            cls._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        try:
+            return cls._apply(pending)
+        except Exception:
+            with cls._lock:
+                cls._buffer.update(pending)
+            raise
+
+    @classmethod
+    def flush(cls):
+        """
+        Moves the redis buffer into the database. The hash is renamed first,
+        so views recorded during the flush go to a fresh buffer. A processing
+        key left over by a crashed flush is applied before the new one.
+        """
+        conn = get_redis_connection()
+        flushed = 0
+
+        if not conn.exists(cls.PROCESSING_KEY):
+            try:
+                conn.rename(cls.BUFFER_KEY, cls.PROCESSING_KEY)
+            except redis.ResponseError:
+                # nothing buffered
+                return flushed + cls.flush_memory()
+
+        pending = conn.hgetall(cls.PROCESSING_KEY)
+        flushed += cls._apply(pending)
+        conn.delete(cls.PROCESSING_KEY)
+
+        return flushed + cls.flush_memory()
+
+    @staticmethod
+    def _apply(pending):
+        # group markets by hit count so each distinct count is one UPDATE
+        by_count = defaultdict(list)
+        for market_id, count in pending.items():
+            count = int(count)
+            if count > 0:
+                by_count[count].append(market_id)
+
+        with transaction.atomic():
+            for count, market_ids in by_count.items():
+                Market.objects.filter(id__in=market_ids).update(
+                    view_count=F('view_count') + count
+                )
+
+        return sum(count * len(ids) for count, ids in by_count.items())
+
+
+class MarketHostResolver:
+    """
+    Maps market subdomains (business_id) to market ids for subdomain routing.
+
+    The table lives in a redis hash so every worker shares it. It is loaded
+    on first use and kept current by the Market save/delete signals, so a
+    storefront request costs one HGET instead of a business_id query.
+    """
+    HOSTS_KEY = 'market:hosts'
+    IDS_KEY = 'market:hosts:ids'
+    WARM_KEY = 'market:hosts:warm'
+
+    CHUNK_SIZE = 2000
+
+    @classmethod
+    def warm(cls):
+        conn = get_redis_connection()
+        hosts, ids = {}, {}
+
+        markets = Market.objects.exclude(
+            business_id='',
+        ).values_list('id', 'business_id').iterator(chunk_size=cls.CHUNK_SIZE)
+
+        for market_id, business_id in markets:
+            hosts[business_id.lower()] = str(market_id)
+            ids[str(market_id)] = business_id.lower()
+
+        # swap the whole table in one MULTI/EXEC so readers never see it half built
+        pipe = conn.pipeline()
+        pipe.delete(cls.HOSTS_KEY, cls.IDS_KEY)
+        if hosts:
+            pipe.hset(cls.HOSTS_KEY, mapping=hosts)
+            pipe.hset(cls.IDS_KEY, mapping=ids)
+        pipe.set(cls.WARM_KEY, 1)
+        pipe.execute()
+
+    @classmethod
+    def resolve(cls, business_id):
+        """Returns the market id (as str) for a subdomain, or None."""
+        try:
+            conn = get_redis_connection()
+            is_warm, market_id = conn.pipeline(transaction=False).exists(
+                cls.WARM_KEY,
+            ).hget(
+                cls.HOSTS_KEY, business_id.lower(),
+            ).execute()
+
+            if not is_warm:
+                cls.warm()
+                market_id = conn.hget(cls.HOSTS_KEY, business_id.lower())
+
+            return market_id
+
+        except redis.RedisError:
+            market_id = Market.objects.filter(
+                business_id=business_id,
+            ).values_list('id', flat=True).first()
+
+            return str(market_id) if market_id else None
+
+    @classmethod
+    def business_id(cls, market_id):
+        """The subdomain market_id is served on, as last stored, or None."""
+        return get_redis_connection().hget(cls.IDS_KEY, str(market_id))
+
+    @classmethod
+    def update(cls, market):
+        conn = get_redis_connection()
+        market_id = str(market.id)
+        business_id = (market.business_id or '').lower()
+
+        # drop the old subdomain when business_id changed
+        old_business_id = conn.hget(cls.IDS_KEY, market_id)
+
+        pipe = conn.pipeline()
+        if old_business_id and old_business_id != business_id:
+            pipe.hdel(cls.HOSTS_KEY, old_business_id)
+        if business_id:
+            pipe.hset(cls.HOSTS_KEY, business_id, market_id)
+            pipe.hset(cls.IDS_KEY, market_id, business_id)
+        else:
+            pipe.hdel(cls.IDS_KEY, market_id)
+        pipe.execute()
+
+    @classmethod
+    def remove(cls, market):
+        conn = get_redis_connection()
+        market_id = str(market.id)
+
+        business_id = conn.hget(cls.IDS_KEY, market_id)
+
+        pipe = conn.pipeline()
+        if business_id:
+            pipe.hdel(cls.HOSTS_KEY, business_id)
+        pipe.hdel(cls.IDS_KEY, market_id)
+        pipe.execute()
+
+
+class MarketHostRegistry:
+    """
+    Allowed hosts of published markets, shared by every worker.
+
+    The source of truth is a redis set. Each process keeps a local copy for
+    O(1) membership checks without network calls and follows changes over
+    a pub/sub channel, so publishing a market reaches all workers without a
+    restart. When redis is unavailable the copy is loaded from the database.
+    """
+    HOSTS_KEY = 'market:allowed_hosts'
+    CHANNEL = 'market:allowed_hosts:events'
+
+    _hosts = None
+    _lock = threading.Lock()
+    _listener = None
+
+    @staticmethod
+    def market_domain(business_id):
+        return f"{business_id.lower()}.{settings.MARKET_BASE_DOMAIN}"
+
+    @classmethod
+    def _published_domains(cls):
+        business_ids = Market.objects.filter(
+            status=Market.PUBLISHED,
+        ).exclude(
+            business_id='',
+        ).values_list('business_id', flat=True).iterator(chunk_size=2000)
+
+        return {cls.market_domain(business_id) for business_id in business_ids}
+
+    @classmethod
+    def rebuild(cls):
+        """Reloads the shared set from the published markets."""
+        domains = cls._published_domains()
+
+        pipe = get_redis_connection().pipeline()
+        pipe.delete(cls.HOSTS_KEY)
+        if domains:
+            pipe.sadd(cls.HOSTS_KEY, *domains)
+        pipe.publish(cls.CHANNEL, 'reload')
+        pipe.execute()
+
+        cls._hosts = frozenset(domains)
+
+    @classmethod
+    def _load(cls):
+        try:
+            hosts = get_redis_connection().smembers(cls.HOSTS_KEY)
+        except redis.RedisError:
+            hosts = cls._published_domains()
+
+        cls._hosts = frozenset(hosts)
+
+    @classmethod
+    def start(cls):
+        """Loads the local copy and starts the pub/sub listener (once per process)."""
+        with cls._lock:
+            if cls._listener is None:
+                cls._listener = threading.Thread(
+                    target=cls._listen,
+                    name='market-host-registry',
+                    daemon=True,
+                )
+                cls._listener.start()
+
+            if cls._hosts is None:
+                cls._load()
+
+    @classmethod
+    def _listen(cls):
+        while True:
+            try:
+                pubsub = get_pubsub_connection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(cls.CHANNEL)
+                # messages may have been missed while disconnected
+                cls._load()
+
+                for message in pubsub.listen():
+                    action, _, domain = message['data'].partition(' ')
+                    with cls._lock:
+                        if action == 'add':
+                            cls._hosts = cls._hosts | {domain}
+                        elif action == 'remove':
+                            cls._hosts = cls._hosts - {domain}
+                        else:
+                            cls._load()
+
+            except Exception:
+                time.sleep(5)
+
+    @classmethod
+    def is_allowed(cls, host):
+        if cls._hosts is None:
+            cls.start()
+
+        # hosts are case-insensitive and may end in the root dot
+        return host.lower().rstrip('.') in cls._hosts
+
+    @classmethod
+    def add(cls, business_id):
+        domain = cls.market_domain(business_id)
+
+        with cls._lock:
+            if cls._hosts is not None:
+                cls._hosts = cls._hosts | {domain}
+
+        pipe = get_redis_connection().pipeline()
+        pipe.sadd(cls.HOSTS_KEY, domain)
+        pipe.publish(cls.CHANNEL, f'add {domain}')
+        pipe.execute()
+
+    @classmethod
+    def remove(cls, business_id):
+        domain = cls.market_domain(business_id)
+
+        with cls._lock:
+            if cls._hosts is not None:
+                cls._hosts = cls._hosts - {domain}
+
+        pipe = get_redis_connection().pipeline()
+        pipe.srem(cls.HOSTS_KEY, domain)
+        pipe.publish(cls.CHANNEL, f'remove {domain}')
+        pipe.execute()
+
+
+class MarketNearbySearch:
+    """
+    Published markets within radius km of a point, nearest first.
+
+    MarketLocation.grid_cell (an indexed 0.1 degree grid) narrows the scan
+    to the cells covering the radius' bounding box; the exact haversine
+    distance is then computed in SQL over those rows only. Pages are keyed
+    on (distance, market_id), so a cursor is stable while markets are
+    added.
+    """
+    EARTH_RADIUS = 6371.0  # km
+    KM_PER_DEGREE = 111.32
+    MAX_RADIUS = 50  # km
+    CURSOR = NUMBER_CURSOR  # (distance, market_id)
+
+    @classmethod
+    def cells(cls, latitude, longitude, radius):
+        size = MarketLocation.GRID_SIZE
+        lat_delta = radius / cls.KM_PER_DEGREE
+        lng_delta = radius / (
+            cls.KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01)
+        )
+
+        first_row = MarketLocation.grid_row(max(latitude - lat_delta, -90))
+        last_row = MarketLocation.grid_row(min(latitude + lat_delta, 90 - size / 2))
+
+        first_column = int((longitude - lng_delta + 180) // size)
+        last_column = int((longitude + lng_delta + 180) // size)
+        columns = min(last_column - first_column + 1, MarketLocation.GRID_COLUMNS)
+
+        return [
+            row * MarketLocation.GRID_COLUMNS
+            + (first_column + i) % MarketLocation.GRID_COLUMNS
+            for row in range(first_row, last_row + 1)
+            for i in range(columns)
+        ]
+
+    @classmethod
+    def distance(cls, latitude, longitude):
+        """Haversine distance (km) from the point to each row, as an expression."""
+        lat1 = math.radians(latitude)
+        lat2 = Radians(Cast('latitude', FloatField()))
+        d_lat = lat2 - lat1
+        d_lng = Radians(Cast('longitude', FloatField())) - math.radians(longitude)
+
+        a = (
+            Power(Sin(d_lat / 2), 2)
+            + math.cos(lat1) * Cos(lat2) * Power(Sin(d_lng / 2), 2)
+        )
+
+        return ExpressionWrapper(
+            2 * cls.EARTH_RADIUS * ASin(Sqrt(Least(a, Value(1.0)))),
+            output_field=FloatField(),
+        )
+
+    @classmethod
+    def search(cls, latitude, longitude, radius, limit, cursor=None, open_at=None):
+        """
+        Returns (locations, next_cursor). Each location has .distance (km)
+        and its market (with sub_category) already loaded. With open_at only
+        markets open at that time are returned.
+        """
+        locations = MarketLocation.objects.filter(
+            grid_cell__in=cls.cells(latitude, longitude, radius),
+            market__status=Market.PUBLISHED,
+        ).annotate(
+            distance=cls.distance(latitude, longitude),
+        ).filter(
+            distance__lte=radius,
+        ).select_related(
+            'market__sub_category',
+        ).order_by('distance', 'market_id')
+
+        if open_at is not None:
+            locations = MarketOpenHours.filter_open(locations, open_at, 'market__')
+
+        if cursor:
+            distance, market_id = cls.CURSOR.decode(cursor)
+            locations = locations.filter(
+                Q(distance__gt=distance)
+                | Q(distance=distance, market_id__gt=market_id)
+            )
+
+        locations = list(locations[:limit + 1])
+
+        next_cursor = None
+        if len(locations) > limit:
+            locations = locations[:limit]
+            next_cursor = cls.CURSOR.encode(locations[-1].distance, locations[-1].market_id)
+
+        return locations, next_cursor
+
+
+class MarketOpenHours:
+    """
+    Weekly opening hours as a 7 x 96 quarter-hour bitmap on Market.open_hours.
+
+    Bit (day * 96 + quarter) is set when the market is open in that slot,
+    days counted from Saturday. The bitmap merges MarketSchedule rows and
+    the ReserveTime rows of the market's hours service (see
+    MarketScheduleAPIView). Upcoming DayOff dates are copied to
+    Market.closed_dates, so "open at" is a get_bit() plus an array check on
+    the market row itself.
+    """
+    SERVICE_NAME = '-'
+    SLOT_MINUTES = 15
+    SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+    SLOTS = 7 * SLOTS_PER_DAY
+
+    @classmethod
+    def slot(cls, day, time_of_day, round_up=False):
+        minutes = time_of_day.hour * 60 + time_of_day.minute
+        if round_up:
+            # the slot an end time falls into is still open
+            return day * cls.SLOTS_PER_DAY - (-minutes // cls.SLOT_MINUTES)
+        return day * cls.SLOTS_PER_DAY + minutes // cls.SLOT_MINUTES
+
+    @classmethod
+    def slot_at(cls, moment):
+        moment = timezone.localtime(moment)
+        # python weekday() is 0 for monday, the week here starts on saturday
+        return cls.slot((moment.weekday() + 2) % 7, moment.time())
+
+    @classmethod
+    def build(cls, ranges):
+        """ranges: (day, start, end) with day 0 = Saturday; end may be None."""
+        bitmap = bytearray(cls.SLOTS // 8)
+
+        for day, start, end in ranges:
+            first = cls.slot(day, start)
+            if end is None:
+                last = first + 1
+            else:
+                last = cls.slot(day, end, round_up=True)
+                # ranges ending at or after midnight run into the next day
+                if end <= start:
+                    last += cls.SLOTS_PER_DAY
+
+            for slot in range(first, last):
+                slot %= cls.SLOTS
+                bitmap[slot // 8] |= 1 << (slot % 8)
+
+        return bytes(bitmap)
+
+    @classmethod
+    def ranges(cls, market_id):
+        schedules = MarketSchedule.objects.filter(
+            market_id=market_id,
+        ).values_list('day_of_week', 'start_time', 'end_time')
+
+        reserve_times = ReserveTime.objects.filter(
+            service__market_id=market_id,
+            service__name=cls.SERVICE_NAME,
+        ).values_list('day', 'start', 'end')
+
+        # ReserveTime days are '1' (saturday) to '7'
+        return [*schedules, *((int(day) - 1, start, end) for day, start, end in reserve_times)]
+
+    @classmethod
+    def refresh(cls, market_id):
+        ranges = cls.ranges(market_id)
+
+        Market.objects.filter(id=market_id).update(
+            open_hours=cls.build(ranges) if ranges else None,
+        )
+
+    @classmethod
+    def refresh_closed_dates(cls, market_id):
+        dates = DayOff.objects.filter(
+            market_id=market_id,
+            date__gte=timezone.localdate(),
+        ).order_by('date').values_list('date', flat=True).distinct()
+
+        Market.objects.filter(id=market_id).update(closed_dates=list(dates))
+
+    @classmethod
+    def filter_open(cls, queryset, moment, prefix=''):
+        """Keeps the markets of queryset that are open at moment."""
+        open_hours = f'{prefix}open_hours'
+
+        return queryset.alias(
+            open_bit=Func(
+                F(open_hours),
+                Value(cls.slot_at(moment)),
+                function='get_bit',
+                output_field=IntegerField(),
+            ),
+        ).filter(
+            **{f'{open_hours}__isnull': False, 'open_bit': 1},
+        ).exclude(
+            **{f'{prefix}closed_dates__contains': [timezone.localdate(moment)]},
+        )
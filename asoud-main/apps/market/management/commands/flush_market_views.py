@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.market.core import MarketViewCounter
+
+
+class Command(BaseCommand):
+    help = 'Flush buffered market views into Market.view_count'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep flushing every MARKET_VIEW_FLUSH_INTERVAL seconds',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = MarketViewCounter.flush()
+            self.stdout.write(f'{flushed} market views flushed')
+
+            if not options['loop']:
+                break
+
+            time.sleep(settings.MARKET_VIEW_FLUSH_INTERVAL)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from apps.market.models import MarketLocation
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Fill MarketLocation.grid_cell for rows saved before it existed'
+
+    def handle(self, *args, **options):
+        locations = MarketLocation.objects.filter(
+            grid_cell__isnull=True,
+        ).only('id', 'latitude', 'longitude').iterator(chunk_size=BATCH_SIZE)
+
+        batch = []
+        updated = 0
+        for location in locations:
+            location.grid_cell = MarketLocation.get_grid_cell(
+                location.latitude,
+                location.longitude,
+            )
+            batch.append(location)
+
+            if len(batch) == BATCH_SIZE:
+                updated += MarketLocation.objects.bulk_update(batch, ['grid_cell'])
+                batch = []
+
+        if batch:
+            updated += MarketLocation.objects.bulk_update(batch, ['grid_cell'])
+
+        self.stdout.write(f'{updated} market locations indexed')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apps.market.core import MarketOpenHours
+from apps.market.models import Market
+
+
+class Command(BaseCommand):
+    help = 'Rebuild Market.open_hours and Market.closed_dates from the schedules'
+
+    def handle(self, *args, **options):
+        market_ids = Market.objects.values_list('id', flat=True).iterator()
+
+        count = 0
+        for market_id in market_ids:
+            MarketOpenHours.refresh(market_id)
+            MarketOpenHours.refresh_closed_dates(market_id)
+            count += 1
+
+        self.stdout.write(f'{count} markets refreshed')
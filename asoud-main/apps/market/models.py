@@ -1,7 +1,10 @@
 from django.utils.translation import gettext_lazy as _
 from django.contrib.contenttypes.fields import GenericRelation
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
-from apps.base.models import models, BaseModel
+from apps.base.models import models, BaseModel, DerivedImagesModel
 
 from apps.users.models import User
 from apps.category.models import SubCategory
@@ -17,7 +20,7 @@ from apps.market.upload import (
 
 
 # old images are not removed, fix it later
-class Market(BaseModel):
+class Market(DerivedImagesModel):
     COMPANY = "company"
     SHOP = "shop"
 
@@ -81,6 +84,7 @@ class Market(BaseModel):
 
     business_id = models.CharField(
         max_length=20,
+        db_index=True,
         verbose_name=_('Business id'),
     )
 
@@ -134,6 +138,23 @@ class Market(BaseModel):
         verbose_name=_('View count'),
     )
 
+    # weekly quarter-hour bitmap of the opening hours, see MarketOpenHours
+    open_hours = models.BinaryField(
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name=_('Open hours'),
+    )
+
+    # upcoming DayOff dates, kept in sync by signals
+    closed_dates = ArrayField(
+        models.DateField(),
+        default=list,
+        blank=True,
+        editable=False,
+        verbose_name=_('Closed dates'),
+    )
+
     comments = GenericRelation(
         Comment,
         related_query_name='market_comments',
@@ -147,10 +168,36 @@ class Market(BaseModel):
         help_text=_('The image is not visible to the market owner.')
     )
 
+    # kept in sync by apps.search.signals
+    search_name = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name=_('Search name'),
+    )
+    search_vector = SearchVectorField(
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name=_('Search vector'),
+    )
+
     class Meta:
         db_table = 'market'
         verbose_name = _('Market')
         verbose_name_plural = _('Markets')
+        indexes = [
+            GinIndex(
+                fields=['search_vector'],
+                name='market_search_vector_idx',
+            ),
+            GinIndex(
+                fields=['search_name'],
+                name='market_search_name_trgm_idx',
+                opclasses=['gin_trgm_ops'],
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -189,6 +236,18 @@ class MarketLocation(BaseModel):
         decimal_places=6,
     )
 
+    # 0.1 degree cell of (latitude, longitude), used to prefilter geo search
+    grid_cell = models.IntegerField(
+        blank=True,
+        null=True,
+        db_index=True,
+        editable=False,
+        verbose_name=_('Grid cell'),
+    )
+
+    GRID_SIZE = 0.1
+    GRID_COLUMNS = 3600  # 360 / GRID_SIZE
+
     class Meta:
         db_table = 'market_location'
         verbose_name = _('Market location')
@@ -197,6 +256,27 @@ class MarketLocation(BaseModel):
     def __str__(self):
         return self.market.name
 
+    @classmethod
+    def grid_row(cls, latitude):
+        return int((float(latitude) + 90) // cls.GRID_SIZE)
+
+    @classmethod
+    def grid_column(cls, longitude):
+        return int((float(longitude) + 180) // cls.GRID_SIZE) % cls.GRID_COLUMNS
+
+    @classmethod
+    def get_grid_cell(cls, latitude, longitude):
+        return cls.grid_row(latitude) * cls.GRID_COLUMNS + cls.grid_column(longitude)
+
+    def save(self, *args, **kwargs):
+        self.grid_cell = self.get_grid_cell(self.latitude, self.longitude)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'grid_cell'}
+
+        super().save(*args, **kwargs)
+
 
 class MarketContact(BaseModel):
     market = models.OneToOneField(
@@ -261,7 +341,7 @@ class MarketContact(BaseModel):
         return self.market.name
 
 
-class MarketSlider(BaseModel):
+class MarketSlider(DerivedImagesModel):
     market = models.ForeignKey(
         Market,
         on_delete=models.CASCADE,
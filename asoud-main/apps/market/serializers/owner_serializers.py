@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from utils.images import ImageVariantField
 from django.urls import reverse
 import jdatetime
 
@@ -105,7 +106,11 @@ class MarketListSerializer(serializers.ModelSerializer):
     inactive_url = serializers.SerializerMethodField()
     queue_url = serializers.SerializerMethodField()
     sub_category_title = serializers.SerializerMethodField()
-    view_count = serializers.SerializerMethodField()
+    view_count = serializers.IntegerField(read_only=True)
+    logo_img_thumb = ImageVariantField(source='logo_img', variant='thumb')
+    logo_img_webp = ImageVariantField(source='logo_img', variant='webp')
+    background_img_thumb = ImageVariantField(source='background_img', variant='thumb')
+    background_img_webp = ImageVariantField(source='background_img', variant='webp')
 
     theme = MarketThemeCreateSerializer()
 
@@ -123,7 +128,11 @@ class MarketListSerializer(serializers.ModelSerializer):
             'inactive_url',
             'queue_url',
             'logo_img',
+            'logo_img_thumb',
+            'logo_img_webp',
             'background_img',
+            'background_img_thumb',
+            'background_img_webp',
             'theme',
             'view_count',
         ]
@@ -154,16 +163,17 @@ class MarketListSerializer(serializers.ModelSerializer):
     def get_sub_category_title(self, obj):
         return obj.sub_category.title if obj.sub_category else None
 
-    def get_view_count(self, obj):
-        market_viewed_by = obj.viewed_by.all()
-        return market_viewed_by.count()
-
 
 class MarketSliderListSerializer(serializers.ModelSerializer):
+    image_thumb = ImageVariantField(source='image', variant='thumb')
+    image_webp = ImageVariantField(source='image', variant='webp')
+
     class Meta:
         model = MarketSlider
         fields = [
             'id',
             'image',
+            'image_thumb',
+            'image_webp',
             'url',
         ]
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.urls import reverse
 import jdatetime
+from utils.images import ImageVariantField
+from utils.cursor import CursorField
 
 from apps.market.models import (
     Market,
@@ -8,12 +10,18 @@ from apps.market.models import (
     MarketContact,
     MarketLocation
 )
+from django.utils import timezone
+from apps.market.core import MarketNearbySearch
 
 
 class MarketListSerializer(serializers.ModelSerializer):
     created_at = serializers.SerializerMethodField()
     sub_category_title = serializers.SerializerMethodField()
-    view_count = serializers.SerializerMethodField()
+    view_count = serializers.IntegerField(read_only=True)
+    logo_img_thumb = ImageVariantField(source='logo_img', variant='thumb')
+    logo_img_webp = ImageVariantField(source='logo_img', variant='webp')
+    background_img_thumb = ImageVariantField(source='background_img', variant='thumb')
+    background_img_webp = ImageVariantField(source='background_img', variant='webp')
 
     # theme = MarketThemeCreateSerializer()
 
@@ -29,7 +37,11 @@ class MarketListSerializer(serializers.ModelSerializer):
             'is_paid',
             'created_at',
             'logo_img',
+            'logo_img_thumb',
+            'logo_img_webp',
             'background_img',
+            'background_img_thumb',
+            'background_img_webp',
             # 'theme',
             'view_count',
         ]
@@ -42,10 +54,6 @@ class MarketListSerializer(serializers.ModelSerializer):
     def get_sub_category_title(self, obj):
         return obj.sub_category.title if obj.sub_category else None
 
-    def get_view_count(self, obj):
-        market_viewed_by = obj.viewed_by.all()
-        return market_viewed_by.count()
-
 
 class MarketReportCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -82,4 +90,39 @@ class MarketDetailSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Market
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class MarketOpenFilterSerializer(serializers.Serializer):
+    open_now = serializers.BooleanField(default=False)
+    open_at = serializers.DateTimeField(required=False)
+
+    def get_moment(self):
+        """The time markets must be open at, or None for no filter."""
+        if 'open_at' in self.validated_data:
+            return self.validated_data['open_at']
+        if self.validated_data['open_now']:
+            return timezone.now()
+        return None
+
+
+class MarketNearbyQuerySerializer(MarketOpenFilterSerializer):
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    radius = serializers.FloatField(
+        min_value=0.1,
+        max_value=MarketNearbySearch.MAX_RADIUS,
+        default=5,
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=20)
+    cursor = CursorField(MarketNearbySearch.CURSOR, required=False)
+
+
+class MarketNearbySerializer(MarketListSerializer):
+    distance = serializers.SerializerMethodField()
+
+    class Meta(MarketListSerializer.Meta):
+        fields = MarketListSerializer.Meta.fields + ['distance']
+
+    def get_distance(self, obj):
+        # km, set by MarketNearbySearch
+        return round(obj.location.distance, 3)
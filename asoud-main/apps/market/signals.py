@@ -1,24 +1,92 @@
-import json
-import os
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.conf import settings
-from apps.market.models import Market
+from redis import RedisError
+from apps.market.models import Market, MarketSchedule
+from apps.market.core import (
+    MarketHostResolver,
+    MarketHostRegistry,
+    MarketOpenHours,
+)
+from apps.reserve.models import Service, ReserveTime, DayOff
 
-@receiver(post_save, sender=Market)
-def add_market_url_to_allowed_hosts(sender, instance, created, **kwargs):
-    if created:
+
+def _safe_host_update(func, *args):
+    # a redis outage must not fail the save; workers re-warm the tables on startup
+    try:
+        func(*args)
+    except RedisError:
         pass
-    elif not created and instance.status == 'published':
-        if not instance.business_id:
-            return
-        domain = (instance.business_id).lower() + '.' + 'asoud.ir'
-        if domain in settings.ALLOWED_HOSTS:
-            return
-        
-        new_allowed_hosts = settings.ALLOWED_HOSTS + [domain]
-        
-        settings.ALLOWED_HOSTS = new_allowed_hosts
-        ALLOWED_HOSTS_FILE = os.path.join(settings.BASE_DIR, 'allowed_hosts.json')
-        with open(ALLOWED_HOSTS_FILE, 'w') as f:
-            json.dump(new_allowed_hosts, f)
+
+
+def _update_hosts(market):
+    business_id = (market.business_id or '').lower()
+
+    # the subdomain it had, read before MarketHostResolver.update replaces it
+    old_business_id = MarketHostResolver.business_id(market.id)
+    if old_business_id and old_business_id != business_id:
+        MarketHostRegistry.remove(old_business_id)
+
+    if business_id:
+        # an unpublished or deactivated market stops being served on its subdomain
+        if market.status == Market.PUBLISHED:
+            MarketHostRegistry.add(business_id)
+        else:
+            MarketHostRegistry.remove(business_id)
+
+    MarketHostResolver.update(market)
+
+
+@receiver(post_save, sender=Market)
+def update_market_hosts(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: _safe_host_update(_update_hosts, instance)
+    )
+
+
+@receiver(post_delete, sender=Market)
+def remove_market_url_from_allowed_hosts(sender, instance, **kwargs):
+    if not instance.business_id:
+        return
+
+    transaction.on_commit(
+        lambda: _safe_host_update(MarketHostRegistry.remove, instance.business_id)
+    )
+
+
+@receiver(post_delete, sender=Market)
+def remove_market_host(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: _safe_host_update(MarketHostResolver.remove, instance)
+    )
+
+
+@receiver([post_save, post_delete], sender=MarketSchedule)
+def refresh_open_hours(sender, instance, **kwargs):
+    transaction.on_commit(lambda: MarketOpenHours.refresh(instance.market_id))
+
+
+@receiver(post_delete, sender=Service)
+def refresh_open_hours_from_service(sender, instance, **kwargs):
+    if instance.name == MarketOpenHours.SERVICE_NAME:
+        transaction.on_commit(lambda: MarketOpenHours.refresh(instance.market_id))
+
+
+@receiver([post_save, post_delete], sender=ReserveTime)
+def refresh_open_hours_from_reserve_time(sender, instance, **kwargs):
+    # on a cascading service delete the service is gone, and its own
+    # post_delete refreshes the market
+    market_id = Service.objects.filter(
+        id=instance.service_id,
+        name=MarketOpenHours.SERVICE_NAME,
+    ).values_list('market_id', flat=True).first()
+
+    if market_id:
+        transaction.on_commit(lambda: MarketOpenHours.refresh(market_id))
+
+
+@receiver([post_save, post_delete], sender=DayOff)
+def refresh_closed_dates(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: MarketOpenHours.refresh_closed_dates(instance.market_id)
+    )
@@ -4,6 +4,7 @@ from apps.market.views.user_views import (
     MarketListAPIView,
     MarketReportAPIView,
     MarketBookmarkAPIView,
+    MarketNearbyAPIView,
 )
 from apps.market.views.market_schedule import MarketScheduleUserListView
 
@@ -15,6 +16,11 @@ urlpatterns = [
         MarketListAPIView.as_view(),
         name='list',
     ),
+    path(
+        'nearby/',
+        MarketNearbyAPIView.as_view(),
+        name='nearby',
+    ),
     path(
         'report/<str:pk>/',
         MarketReportAPIView.as_view(),
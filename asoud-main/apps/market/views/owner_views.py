@@ -124,7 +124,7 @@ class MarketListAPIView(views.APIView):
 
         market_list = Market.objects.filter(
             user=user_obj,
-        )
+        ).select_related('sub_category', 'theme')
 
         serializer = MarketListSerializer(
             market_list,
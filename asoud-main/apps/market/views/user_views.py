@@ -9,9 +9,13 @@ from apps.market.models import (
     MarketBookmark,
 )
 
+from apps.market.core import MarketNearbySearch, MarketOpenHours
 from apps.market.serializers.user_serializers import (
     MarketListSerializer,
     MarketReportCreateSerializer,
+    MarketNearbyQuerySerializer,
+    MarketOpenFilterSerializer,
+    MarketNearbySerializer,
 )
 
 
@@ -19,9 +23,16 @@ class MarketListAPIView(views.APIView):
     def get(self, request, format=None):
         user_obj = self.request.user
 
+        open_filter = MarketOpenFilterSerializer(data=request.query_params)
+        open_filter.is_valid(raise_exception=True)
+
         market_list = Market.objects.filter(
             user=user_obj,
-        )
+        ).select_related('sub_category')
+
+        moment = open_filter.get_moment()
+        if moment is not None:
+            market_list = MarketOpenHours.filter_open(market_list, moment)
 
         serializer = MarketListSerializer(
             market_list,
@@ -147,11 +158,22 @@ class MarketBookmarkAPIView(views.APIView):
     def get(self, request):
         user = self.request.user
 
+        open_filter = MarketOpenFilterSerializer(data=request.query_params)
+        open_filter.is_valid(raise_exception=True)
+
         market_bookmark_list = MarketBookmark.objects.filter(
             user=user,
             is_active=True,
         ).select_related('market')
 
+        moment = open_filter.get_moment()
+        if moment is not None:
+            market_bookmark_list = MarketOpenHours.filter_open(
+                market_bookmark_list,
+                moment,
+                'market__',
+            )
+
         market_list = [book_mark.market for book_mark in market_bookmark_list]
 
         serializer = MarketListSerializer(
@@ -168,3 +190,43 @@ class MarketBookmarkAPIView(views.APIView):
         )
 
         return Response(success_response)
+
+
+class MarketNearbyAPIView(views.APIView):
+    def get(self, request):
+        query = MarketNearbyQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        locations, next_cursor = MarketNearbySearch.search(
+            latitude=params['lat'],
+            longitude=params['lng'],
+            radius=params['radius'],
+            limit=params['limit'],
+            cursor=params.get('cursor'),
+            open_at=query.get_moment(),
+        )
+
+        markets = []
+        for location in locations:
+            # reuse the loaded location, it carries the distance
+            location.market.location = location
+            markets.append(location.market)
+
+        serializer = MarketNearbySerializer(
+            markets,
+            many=True,
+            context={"request": request},
+        )
+
+        success_response = ApiResponse(
+            success=True,
+            code=200,
+            data={
+                'results': serializer.data,
+                'next': next_cursor,
+            },
+            message='Data retrieved successfully'
+        )
+
+        return Response(success_response)
@@ -4,3 +4,5 @@ from django.apps import AppConfig
 class MarketSubdomainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.market_subdomain'
+    def ready(self):
+        import apps.market_subdomain.signals
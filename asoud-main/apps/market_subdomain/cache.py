@@ -0,0 +1,147 @@
+import hashlib
+import time
+import uuid
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+from apps.market.models import Market
+from apps.product.models import Product
+
+
+class StorefrontCache:
+    """
+    Versioned cache of the rendered JSON of public storefront endpoints.
+
+    Cache keys embed the market's current version, which the signals in
+    apps.market_subdomain.signals replace whenever the market, its theme or
+    its products change. Old entries are never read again and just expire.
+    Versions expire too, after VERSION_TIMEOUT; a lost version only drops
+    that market's entries.
+    The version also drives the ETag, so clients revalidate with a single
+    cache read. Misses are single-flighted: one request renders the body
+    while concurrent requests for the same key wait for it.
+    """
+    TIMEOUT = 60 * 60
+    VERSION_TIMEOUT = 60 * 60 * 24
+    LOCK_TIMEOUT = 10
+    WAIT_STEP = 0.05
+    WAIT_STEPS = 40
+
+    @staticmethod
+    def _version_key(market_id):
+        return f'storefront:version:{market_id}'
+
+    @classmethod
+    def get_version(cls, market_id):
+        key = cls._version_key(market_id)
+        version = cache.get(key)
+
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, cls.VERSION_TIMEOUT)
+            version = cache.get(key)
+
+        return version
+
+    @classmethod
+    def bump(cls, market_id):
+        # a random version (not a counter) can't collide with a version
+        # that was evicted and then recreated
+        cache.set(cls._version_key(market_id), uuid.uuid4().hex, cls.VERSION_TIMEOUT)
+
+    @classmethod
+    def market_exists(cls, market_id):
+        """
+        Whether the market exists. Only a yes is cached, so ids of unknown
+        markets leave nothing behind.
+        """
+        key = f'storefront:market:{market_id}'
+        if cache.get(key):
+            return True
+
+        exists = Market.objects.filter(id=market_id).exists()
+        if exists:
+            cache.set(key, 1, cls.TIMEOUT)
+        return exists
+
+    @classmethod
+    def product_market(cls, product_id):
+        """
+        Returns the market id of a product, or None if it does not exist.
+        A product never moves between markets, so the mapping is cached
+        without a version.
+        """
+        key = f'storefront:product-market:{product_id}'
+        market_id = cache.get(key)
+
+        if market_id is None:
+            market_id = Product.objects.filter(
+                id=product_id,
+            ).values_list('market_id', flat=True).first()
+            if market_id is None:
+                return None
+
+            market_id = str(market_id)
+            cache.set(key, market_id, cls.TIMEOUT)
+
+        return market_id
+
+    @classmethod
+    def respond(cls, request, market_id, build):
+        """
+        Returns the cached response for this request, calling build() (a
+        view body returning a DRF Response) on a miss. Only 200 responses
+        are cached.
+        """
+        version = cls.get_version(market_id)
+        # the storefront and the flutter app serve the same market on
+        # different hosts, so the host is part of the key
+        url = request.get_host() + request.get_full_path()
+        path = hashlib.md5(url.encode()).hexdigest()
+        key = f'storefront:{market_id}:{version}:{path}'
+        etag = '"%s"' % hashlib.md5(key.encode()).hexdigest()
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        body = cache.get(key)
+        if body is None:
+            body, response = cls._fill(key, build)
+            if body is None:
+                return response
+
+        response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    @classmethod
+    def _fill(cls, key, build):
+        lock_key = f'{key}:lock'
+        is_owner = cache.add(lock_key, 1, cls.LOCK_TIMEOUT)
+
+        if not is_owner:
+            for _ in range(cls.WAIT_STEPS):
+                time.sleep(cls.WAIT_STEP)
+                body = cache.get(key)
+                if body is not None:
+                    return body, None
+                # the owner finished without caching (e.g. a 404)
+                if cache.get(lock_key) is None:
+                    break
+
+        try:
+            response = build()
+            if response.status_code != 200:
+                return None, response
+
+            body = JSONRenderer().render(response.data)
+            cache.set(key, body, cls.TIMEOUT)
+            return body, None
+
+        finally:
+            if is_owner:
+                cache.delete(lock_key)
@@ -0,0 +1,10 @@
+from apps.market.core import MarketHostResolver
+
+
+def resolve_market(request, market_id):
+    """
+    Host callback for market subdomains. The host pattern captures the
+    subdomain (the market business_id); the resolved market id is kept on
+    the request so the views don't query Market by business_id again.
+    """
+    request.market_id = MarketHostResolver.resolve(market_id)
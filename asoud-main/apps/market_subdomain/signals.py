@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.market.models import (
+    Market,
+    MarketTheme,
+    MarketLocation,
+    MarketContact,
+)
+from apps.product.models import Product, ProductImage, ProductTheme
+from apps.affiliate.models import (
+    AffiliateProduct,
+    AffiliateProductImage,
+    AffiliateProductTheme,
+)
+from apps.market_subdomain.cache import StorefrontCache
+
+
+def _bump(market_id):
+    # robust: a cache outage is logged instead of failing the request
+    transaction.on_commit(lambda: StorefrontCache.bump(market_id), robust=True)
+
+
+@receiver([post_save, post_delete], sender=Market)
+def bump_market_version(sender, instance, **kwargs):
+    _bump(instance.id)
+
+
+@receiver([post_save, post_delete], sender=MarketTheme)
+@receiver([post_save, post_delete], sender=MarketLocation)
+@receiver([post_save, post_delete], sender=MarketContact)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=AffiliateProduct)
+@receiver([post_save, post_delete], sender=ProductTheme)
+@receiver([post_save, post_delete], sender=AffiliateProductTheme)
+def bump_market_version_from_related(sender, instance, **kwargs):
+    _bump(instance.market_id)
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+@receiver([post_save, post_delete], sender=AffiliateProductImage)
+def bump_market_version_from_image(sender, instance, **kwargs):
+    product_model = sender.product.field.related_model
+
+    if sender.product.is_cached(instance):
+        market_id = instance.product.market_id
+    else:
+        # on a cascading product delete the product row is already gone and
+        # the product's own signal has bumped the version
+        market_id = product_model.objects.filter(
+            id=instance.product_id,
+        ).values_list('market_id', flat=True).first()
+
+    if market_id:
+        _bump(market_id)
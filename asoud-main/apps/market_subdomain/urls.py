@@ -3,6 +3,7 @@ from apps.market_subdomain.views import (
     MarketDetailView,
     ProductListView,
     ProductDetailView,
+    ThemeLayoutView,
 )
 
 
@@ -17,6 +18,10 @@ urlpatterns = [
         'products',
         ProductListView.as_view()
     ),
+    path(
+        'themes',
+        ThemeLayoutView.as_view()
+    ),
     path(
         'products/<str:pk>',
         ProductDetailView.as_view()
@@ -2,33 +2,57 @@ from rest_framework import views, status, permissions
 from rest_framework.response import Response
 from utils.response import ApiResponse
 from apps.market.models import Market
+from apps.market.core import MarketViewCounter
+from apps.market_subdomain.cache import StorefrontCache
 from apps.market.serializers.user_serializers import MarketListSerializer
 from apps.product.models import Product
+from apps.product.core import ProductListStream, ThemeLayout
 from apps.product.serializers.owner_serializers import (
     ProductDetailSerializer,
-    ProductListSerializer    
+    ProductThemeListSerializer,
 )
+from apps.affiliate.serializers.user import AffiliateProductThemeListSerializer
+from apps.product.serializers.stream_serializers import (
+    ProductListQuerySerializer,
+    ProductStreamSerializer,
+)
+
+
+def market_not_found():
+    return Response(
+        ApiResponse(
+            success=False,
+            code=404,
+            error="Market Not Found"
+        ),
+        status=status.HTTP_404_NOT_FOUND
+    )
+
 
 # Create your views here.
+# request.market_id is set by the market host callback (config/hosts.py)
 class MarketDetailView(views.APIView):
     permission_classes = [permissions.AllowAny]
 
-    def get(self, request): 
-        host = request.get_host()
-        market_identifier = host.split('.')[0]
-        
+    def get(self, request):
+        market_id = getattr(request, 'market_id', None)
+        if not market_id:
+            return market_not_found()
+
+        MarketViewCounter.record(market_id)
+
+        return StorefrontCache.respond(
+            request,
+            market_id,
+            lambda: self.build(market_id),
+        )
+
+    def build(self, market_id):
         try:
-            market = Market.objects.get(business_id=market_identifier)
+            market = Market.objects.select_related('sub_category').get(id=market_id)
         except Market.DoesNotExist:
-            return Response(
-                ApiResponse(
-                    success=False,
-                    code=404,
-                    error="Market Not Found"
-                ),
-                status=status.HTTP_404_NOT_FOUND
-            )
-        
+            return market_not_found()
+
         serializer = MarketListSerializer(market)
 
         return Response(
@@ -38,36 +62,79 @@ class MarketDetailView(views.APIView):
                 data=serializer.data
             )
         )
-        
+
 
 class ProductListView(views.APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
-        host = request.get_host()
-        market_identifier = host.split('.')[0]
+        market_id = getattr(request, 'market_id', None)
+        if not market_id:
+            return market_not_found()
 
-        try:
-            market = Market.objects.get(business_id=market_identifier)
-        except Market.DoesNotExist:
-            return Response(
-                ApiResponse(
-                    success=False,
-                    code=404,
-                    error="Market Not Found"
-                ),
-                status=status.HTTP_404_NOT_FOUND
+        query = ProductListQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        return StorefrontCache.respond(
+            request,
+            market_id,
+            lambda: self.build(market_id, query.validated_data),
+        )
+
+    def build(self, market_id, params):
+        products, next_cursor = ProductListStream.page(
+            market_id=market_id,
+            limit=params['limit'],
+            cursor=params.get('cursor'),
+            with_affiliate=params['affiliate'],
+        )
+
+        serializer = ProductStreamSerializer(products, many=True)
+
+        return Response(
+            ApiResponse(
+                success=True,
+                code=200,
+                data={
+                    'results': serializer.data,
+                    'next': next_cursor,
+                }
             )
-        
-        products = Product.objects.filter(market=market)
-        
-        serializer = ProductListSerializer(products, many=True)
+        )
+
+
+class ThemeLayoutView(views.APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        market_id = getattr(request, 'market_id', None)
+        if not market_id:
+            return market_not_found()
+
+        return StorefrontCache.respond(
+            request,
+            market_id,
+            lambda: self.build(market_id),
+        )
+
+    def build(self, market_id):
+        themes = ProductThemeListSerializer(
+            ThemeLayout.product_themes(market_id),
+            many=True,
+        )
+        affiliate_themes = AffiliateProductThemeListSerializer(
+            ThemeLayout.affiliate_themes(market_id),
+            many=True,
+        )
 
         return Response(
             ApiResponse(
                 success=True,
                 code=200,
-                data=serializer.data
+                data={
+                    'themes': themes.data,
+                    'affiliate_themes': affiliate_themes.data,
+                }
             )
         )
 
@@ -76,9 +143,17 @@ class ProductDetailView(views.APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request, pk):
-        host = request.get_host()
-        market_identifier = host.split('.')[0]
-        
+        market_id = getattr(request, 'market_id', None)
+        if not market_id:
+            return market_not_found()
+
+        return StorefrontCache.respond(
+            request,
+            market_id,
+            lambda: self.build(market_id, pk),
+        )
+
+    def build(self, market_id, pk):
         try:
             product = Product.objects.get(id=pk)
         except Product.DoesNotExist:
@@ -91,19 +166,7 @@ class ProductDetailView(views.APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        try:
-            market = Market.objects.get(business_id=market_identifier)
-        except Market.DoesNotExist:
-            return Response(
-                ApiResponse(
-                    success=False,
-                    code=404,
-                    error="Market Not Found"
-                ),
-                status=status.HTTP_404_NOT_FOUND
-            )
-        
-        if product.market != market:
+        if str(product.market_id) != market_id:
             return Response(
                 ApiResponse(
                     success=False,
@@ -112,7 +175,7 @@ class ProductDetailView(views.APIView):
                 ),
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
+
         serializer = ProductDetailSerializer(product)
 
         return Response(
@@ -122,4 +185,4 @@ class ProductDetailView(views.APIView):
                 data=serializer.data
             )
         )
-        
\ No newline at end of file
+
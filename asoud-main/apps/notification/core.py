@@ -0,0 +1,160 @@
+import asyncio
+from collections import defaultdict
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from apps.notification.models import OutboxMessage
+
+
+class NotificationOutbox:
+    """
+    Channel-layer notifications sent after the transaction that caused them
+    commits, and only then.
+
+    Views enqueue messages as OutboxMessage rows in their own transaction,
+    which costs an INSERT instead of a redis round trip, and a rolled back
+    change takes its notification with it. The dispatch_notifications
+    command claims due messages in batches and sends them concurrently;
+    a failed send is retried with exponential backoff until MAX_ATTEMPTS,
+    after which the message is kept for inspection but no longer sent.
+
+    A claimed message is leased for LEASE seconds, so several dispatchers
+    can run side by side and one that dies mid-batch only delays its
+    messages. Delivery is at least once.
+    """
+    BATCH_SIZE = 500
+    LEASE = 30  # seconds
+    SEND_TIMEOUT = 5  # seconds
+    BACKOFF = 2  # seconds, doubled per attempt
+    MAX_BACKOFF = 300  # seconds
+    MAX_ATTEMPTS = 8
+
+    @staticmethod
+    def event(data):
+        return {
+            "type": "send_notification",
+            "data": data,
+        }
+
+    @classmethod
+    def enqueue(cls, group, data):
+        cls.enqueue_many([group], data)
+
+    @classmethod
+    def enqueue_many(cls, groups, data):
+        """Queues one notification with data for each of groups."""
+        now = timezone.now()
+        OutboxMessage.objects.bulk_create([
+            OutboxMessage(
+                group=group,
+                message=cls.event(data),
+                available_at=now,
+            )
+            for group in groups
+        ])
+
+    @classmethod
+    def backoff(cls, attempts):
+        return min(cls.BACKOFF * 2 ** (attempts - 1), cls.MAX_BACKOFF)
+
+    @classmethod
+    def claim(cls, limit=BATCH_SIZE):
+        """
+        Leases up to limit due messages and returns them. Rows locked by
+        another dispatcher are skipped rather than waited for.
+        """
+        now = timezone.now()
+
+        with transaction.atomic():
+            messages = list(
+                OutboxMessage.objects.select_for_update(
+                    skip_locked=True,
+                ).filter(
+                    available_at__lte=now,
+                    attempts__lt=cls.MAX_ATTEMPTS,
+                ).order_by('available_at')[:limit]
+            )
+            OutboxMessage.objects.filter(
+                id__in=[message.id for message in messages],
+            ).update(
+                attempts=F('attempts') + 1,
+                available_at=now + timedelta(seconds=cls.LEASE),
+            )
+
+        for message in messages:
+            message.attempts += 1
+        return messages
+
+    @classmethod
+    def settle(cls, sent, failed):
+        """
+        Deletes the sent messages and reschedules the failed ones, given as
+        {message: error}.
+        """
+        now = timezone.now()
+        # one UPDATE per (attempts, error) instead of one per message
+        retries = defaultdict(list)
+        for message, error in failed.items():
+            retries[message.attempts, error].append(message.id)
+
+        with transaction.atomic():
+            OutboxMessage.objects.filter(
+                id__in=[message.id for message in sent],
+            ).delete()
+
+            for (attempts, error), ids in retries.items():
+                OutboxMessage.objects.filter(id__in=ids).update(
+                    available_at=now + timedelta(seconds=cls.backoff(attempts)),
+                    last_error=error,
+                )
+
+    @classmethod
+    async def dispatch(cls, channel_layer=None):
+        """
+        Sends one batch of due messages, returns (sent, failed) counts.
+        """
+        channel_layer = channel_layer or get_channel_layer()
+        messages = await database_sync_to_async(cls.claim)()
+        if not messages:
+            return 0, 0
+
+        results = await asyncio.gather(
+            *(
+                asyncio.wait_for(
+                    channel_layer.group_send(message.group, message.message),
+                    cls.SEND_TIMEOUT,
+                )
+                for message in messages
+            ),
+            return_exceptions=True,
+        )
+
+        sent = []
+        failed = {}
+        for message, result in zip(messages, results):
+            if isinstance(result, BaseException):
+                failed[message] = repr(result)
+            else:
+                sent.append(message)
+
+        await database_sync_to_async(cls.settle)(sent, failed)
+        return len(sent), len(failed)
+
+    @classmethod
+    def stats(cls):
+        """Queue depth: pending, due now and dead messages, oldest pending age."""
+        now = timezone.now()
+        live = OutboxMessage.objects.filter(attempts__lt=cls.MAX_ATTEMPTS)
+        oldest = live.aggregate(oldest=Min('created_at'))['oldest']
+
+        return {
+            'pending': live.count(),
+            'due': live.filter(available_at__lte=now).count(),
+            'dead': OutboxMessage.objects.filter(attempts__gte=cls.MAX_ATTEMPTS).count(),
+            'oldest_age': (now - oldest).total_seconds() if oldest else 0,
+        }
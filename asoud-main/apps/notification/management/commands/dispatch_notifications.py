@@ -0,0 +1,59 @@
+import asyncio
+import json
+import time
+
+from channels.db import database_sync_to_async
+from django.core.management.base import BaseCommand
+
+from apps.notification.core import NotificationOutbox
+
+INTERVAL = 1
+STATS_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbox notifications through the channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help=f'Keep dispatching, polling every {INTERVAL} seconds when idle',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Print the outbox queue depth as json and exit',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(NotificationOutbox.stats()))
+            return
+
+        asyncio.run(self.dispatch(options['loop']))
+
+    async def dispatch(self, loop):
+        last_stats = time.monotonic()
+
+        while True:
+            sent = failed = 0
+            while True:
+                batch_sent, batch_failed = await NotificationOutbox.dispatch()
+                sent += batch_sent
+                failed += batch_failed
+                if batch_sent + batch_failed < NotificationOutbox.BATCH_SIZE:
+                    break
+
+            if sent or failed or not loop:
+                self.stdout.write(f'{sent} notifications sent, {failed} failed')
+
+            if not loop:
+                break
+
+            if time.monotonic() - last_stats >= STATS_INTERVAL:
+                stats = await database_sync_to_async(NotificationOutbox.stats)()
+                self.stdout.write(f'outbox {json.dumps(stats)}')
+                last_stats = time.monotonic()
+
+            await asyncio.sleep(INTERVAL)
@@ -1,3 +1,45 @@
 from django.db import models
+from django.utils.translation import gettext_lazy as _
 
-# Create your models here.
+from apps.base.models import BaseModel
+
+
+class OutboxMessage(BaseModel):
+    """
+    A channel-layer message written in the transaction of the change it
+    announces and sent by the dispatch_notifications command.
+    """
+    group = models.CharField(
+        max_length=255,
+        verbose_name=_('Group'),
+    )
+    message = models.JSONField(
+        verbose_name=_('Message'),
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name=_('Attempts'),
+    )
+    available_at = models.DateTimeField(
+        verbose_name=_('Available at'),
+    )
+    last_error = models.TextField(
+        blank=True,
+        default='',
+        verbose_name=_('Last error'),
+    )
+
+    class Meta:
+        db_table = 'notification_outbox'
+        verbose_name = _('Outbox message')
+        verbose_name_plural = _('Outbox messages')
+        indexes = [
+            # due messages, see NotificationOutbox.claim
+            models.Index(
+                fields=['available_at'],
+                name='notification_outbox_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.group} ({self.attempts})"
@@ -1,13 +1,19 @@
-import requests, os
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from uuid import UUID
-from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 from apps.payment.models import Payment, Zarinpal
 from apps.advertise.models import Advertisement
 from apps.wallet.models import Wallet
 from apps.wallet.core import WalletCore
 from apps.cart.models import Order
+from apps.cart.core import OutOfStock, StockReservationCore
+from apps.market.models import Market
+from apps.payment.gateway import GatewayError, get_zarinpal_client
 
 class PaymentCore:
     def pay(self, user, data):
@@ -52,19 +58,17 @@ class PaymentCore:
         except:
             return False, 'Payment Creation Failed'
 
-        data = {
-            'merchant_id': os.environ.get("ZARINPAL_MERCHANT_ID"),
-            'amount': int(payment.amount),
-            'currency': 'IRT',
-            'description': 'text',
-            'callback_url': ["http://asoud.ir/api/v1/user/payments/verify/",'https://google.com'][0], 
-            'meta_data': {'payment': str(payment.id)}
-        }
-
-        url = f'https://{settings.ZARINPAL_URL}.zarinpal.com/pg/v4/payment/request.json'
-        response = requests.post(url=url, json=data)
+        try:
+            jsonRes = get_zarinpal_client().pay_request(
+                merchant_id=os.environ.get("ZARINPAL_MERCHANT_ID"),
+                amount=int(payment.amount),
+                callback_url=["http://asoud.ir/api/v1/user/payments/verify/",'https://google.com'][0],
+                description='text',
+                metadata={'payment': str(payment.id)},
+            )
+        except GatewayError:
+            return False, 'an error occured during connecting to zarinpal'
 
-        jsonRes = response.json()
         try:
             authority = jsonRes['data']['authority']
         except:
@@ -98,35 +102,52 @@ class PaymentCore:
         if zarin.payment.status != Payment.PENDING:
             return False, 'Payment already processed'
         
-        data = {
-            'merchant_id': os.environ.get("ZARINPAL_MERCHANT_ID"),
-            'amount': int(zarin.payment.amount),
-            'authority': authority,
-        }
+        try:
+            jsonRes = get_zarinpal_client().verify(
+                merchant_id=os.environ.get("ZARINPAL_MERCHANT_ID"),
+                amount=int(zarin.payment.amount),
+                authority=authority,
+            )
+        except GatewayError:
+            # still pending, the payment can be verified again later
+            return False, 'Gateway Unavailable'
 
-        url = f'https://{settings.ZARINPAL_URL}.zarinpal.com/pg/v4/payment/verify.json'
-        response = requests.post(url=url, json=data)
-        jsonRes = response.json()
+        return self.settle(zarin.payment_id, jsonRes)
 
+    def settle(self, payment_id, jsonRes):
+        """
+        Completes or fails a pending payment from the gateway's verify
+        answer, running its post payment process exactly once.
+        """
         with transaction.atomic():
+            # the callback and reconcile_payments can settle a payment at the
+            # same time, the second one waits here and finds it processed
+            payment = Payment.objects.select_for_update().get(id=payment_id)
+            if payment.status != Payment.PENDING:
+                return False, 'Payment already processed'
+            zarin = payment.zarinpal_data
+
             try:
-                print(jsonRes['data'])
                 code = jsonRes['data']['code']
                 ref_id = jsonRes['data']['ref_id']
             except:
-                zarin.payment.status = Payment.FAILED
-                zarin.payment.save()
+                payment.status = Payment.FAILED
+                payment.save()
                 return False, "Verification Failed From Gateway"
             
-            if code != 100:
-                zarin.payment.status = Payment.FAILED
-                zarin.payment.save()
+            # 101: already verified, e.g. by a retried call whose answer was lost
+            if code not in (100, 101):
+                payment.status = Payment.FAILED
+                payment.save()
                 return False, "Verification Failed"
                 
             # go for post payment processes
-            post_payment = PostPaymentCore(zarin.payment.user)
+            post_payment = PostPaymentCore(payment.user)
             try:
-                post_payment.payment_process(zarin.payment)
+                # a failed process is rolled back whole, so the payment
+                # stays pending and is processed again later, not twice
+                with transaction.atomic():
+                    post_payment.payment_process(payment)
             except Exception as e:
                 return False, str(e)
             
@@ -135,8 +156,8 @@ class PaymentCore:
             zarin.verification_data = jsonRes
             zarin.save()
 
-            zarin.payment.status = Payment.COMPLETE
-            zarin.payment.save()
+            payment.status = Payment.COMPLETE
+            payment.save()
 
         return True, "Payment Successfull"
     
@@ -218,7 +239,104 @@ class PostPaymentCore:
 
     def complete_order(self, pk:str):
         order = Order.objects.get(id=pk)
+        try:
+            StockReservationCore.commit(order)
+        except OutOfStock:
+            # the buyer is already charged, so the order completes anyway
+            # instead of leaving the payment pending
+            order.oversold = True
         order.status = Order.COMPLETED
         order.is_paid = True
         order.save()
 
+
+class PaymentReconciler:
+    """
+    Settles payments left pending because the user never came back to
+    PaymentVerifyView.
+
+    Pending payments older than GRACE (long enough for the callback to have
+    happened) are read in keyset batches on (created_at, id) and verified
+    against the gateway by up to `workers` threads at once. The answers are
+    settled one by one through PaymentCore.settle, which locks the payment,
+    so a payment verified by its callback meanwhile is skipped and the post
+    payment process runs exactly once. An unreachable gateway leaves the
+    payment pending for the next run; a payment that never got an amount
+    or an authority is failed.
+    """
+    BATCH_SIZE = 200
+    WORKERS = 8
+    GRACE = timedelta(minutes=30)
+
+    def __init__(self, workers=WORKERS, grace=GRACE, client=None):
+        self.workers = workers
+        self.grace = grace
+        self.client = client or get_zarinpal_client()
+        self.core = PaymentCore()
+
+    def batches(self):
+        queryset = Payment.objects.filter(
+            status=Payment.PENDING,
+            created_at__lt=timezone.now() - self.grace,
+        ).select_related('zarinpal_data').order_by('created_at', 'id')
+
+        last = None
+        while True:
+            batch = queryset
+            if last is not None:
+                batch = batch.filter(
+                    Q(created_at__gt=last.created_at)
+                    | Q(created_at=last.created_at, id__gt=last.id)
+                )
+            batch = list(batch[:self.BATCH_SIZE])
+            if not batch:
+                return
+
+            yield batch
+            last = batch[-1]
+
+    def _verify(self, payment):
+        """Returns the gateway's answer for payment, or None if it can't tell."""
+        try:
+            return self.client.verify(
+                merchant_id=os.environ.get("ZARINPAL_MERCHANT_ID"),
+                amount=int(payment.amount),
+                authority=payment.zarinpal_data.authority,
+            )
+        except GatewayError:
+            return None
+
+    def run(self):
+        """Returns {'completed': n, 'failed': n, 'pending': n}."""
+        counts = {'completed': 0, 'failed': 0, 'pending': 0}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for batch in self.batches():
+                unsent = [
+                    payment for payment in batch
+                    if payment.amount is None
+                    or not getattr(payment, 'zarinpal_data', None)
+                    or not payment.zarinpal_data.authority
+                ]
+                Payment.objects.filter(
+                    id__in=[payment.id for payment in unsent],
+                    status=Payment.PENDING,
+                ).update(status=Payment.FAILED)
+                counts['failed'] += len(unsent)
+
+                sent = [payment for payment in batch if payment not in unsent]
+                for payment, answer in zip(sent, executor.map(self._verify, sent)):
+                    if answer is None:
+                        counts['pending'] += 1
+                        continue
+
+                    success, _ = self.core.settle(payment.id, answer)
+                    payment.refresh_from_db(fields=['status'])
+                    if success:
+                        counts['completed'] += 1
+                    elif payment.status == Payment.FAILED:
+                        counts['failed'] += 1
+                    elif payment.status == Payment.PENDING:
+                        counts['pending'] += 1
+
+        return counts
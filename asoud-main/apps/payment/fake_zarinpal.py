@@ -0,0 +1,159 @@
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode
+
+
+class FakeZarinpal:
+    """
+    A local stand-in for the parts of the Zarinpal v4 API that PaymentCore
+    uses: payment request, StartPay and verify. Point ZARINPAL_BASE_URL at
+    its url to run the payment flow, tests or load benchmarks without the
+    real gateway.
+
+    StartPay redirects straight back to the callback with Status=OK. Every
+    answer waits `latency` seconds first, and `fail_rate` of them are 503s,
+    to exercise timeouts and retries.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, fail_rate=0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.payments = {}  # authority -> {amount, callback_url, ref_id}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def log_message(self, format, *args):
+                pass
+
+            def answer(self, status, body=None, headers=None):
+                payload = json.dumps(body).encode() if body is not None else b''
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def delay(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if fake.fail_rate and random.random() < fake.fail_rate:
+                    self.answer(503, {'data': [], 'errors': {'code': -1, 'message': 'unavailable'}})
+                    return True
+                return False
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    data = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    return self.answer(400, fake.error(-9, 'invalid json'))
+
+                if self.delay():
+                    return
+
+                if self.path == '/pg/v4/payment/request.json':
+                    return self.answer(200, fake.request(data))
+                if self.path == '/pg/v4/payment/verify.json':
+                    return self.answer(200, fake.verify(data))
+                self.answer(404, fake.error(-9, 'not found'))
+
+            def do_GET(self):
+                prefix = '/pg/StartPay/'
+                if not self.path.startswith(prefix):
+                    return self.answer(404, fake.error(-9, 'not found'))
+
+                authority = self.path[len(prefix):]
+                with fake.lock:
+                    payment = fake.payments.get(authority)
+                if payment is None:
+                    return self.answer(404, fake.error(-51, 'unknown authority'))
+
+                query = urlencode({'Authority': authority, 'Status': 'OK'})
+                self.answer(302, headers={'Location': f"{payment['callback_url']}?{query}"})
+
+        return Handler
+
+    @staticmethod
+    def error(code, message):
+        return {'data': [], 'errors': {'code': code, 'message': message, 'validations': []}}
+
+    def request(self, data):
+        if not data.get('merchant_id') or not data.get('callback_url'):
+            return self.error(-9, 'merchant_id and callback_url are required')
+        if not isinstance(data.get('amount'), int) or data['amount'] < 1000:
+            return self.error(-9, 'invalid amount')
+
+        authority = 'A' + secrets.token_hex(18)[:35]
+        with self.lock:
+            self.payments[authority] = {
+                'amount': data['amount'],
+                'callback_url': data['callback_url'],
+                'ref_id': None,
+            }
+
+        return {
+            'data': {'code': 100, 'message': 'Success', 'authority': authority, 'fee_type': 'Merchant', 'fee': 0},
+            'errors': [],
+        }
+
+    def verify(self, data):
+        with self.lock:
+            payment = self.payments.get(data.get('authority'))
+            if payment is None:
+                return self.error(-51, 'unknown authority')
+            if payment['amount'] != data.get('amount'):
+                return self.error(-50, 'amount mismatch')
+
+            code = 101 if payment['ref_id'] else 100
+            if payment['ref_id'] is None:
+                payment['ref_id'] = random.randint(10 ** 9, 10 ** 10 - 1)
+
+        return {
+            'data': {
+                'code': code,
+                'message': 'Verified' if code == 100 else 'Already verified',
+                'ref_id': payment['ref_id'],
+                'card_pan': '502229******5995',
+                'fee_type': 'Merchant',
+                'fee': 0,
+            },
+            'errors': [],
+        }
+
+    def start(self):
+        """Serves in a daemon thread, returns self."""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,120 @@
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class GatewayError(Exception):
+    """The gateway could not be reached or did not answer in time."""
+
+
+class ZarinpalClient:
+    """
+    Zarinpal v4 API over one pooled, keep-alive session.
+
+    Every call is bounded by the connect and read timeouts, so a slow
+    gateway fails the request instead of holding a worker. A payment
+    request creates a new authority, so it is only retried when it never
+    reached the gateway (connect errors); verify is idempotent (an already
+    verified authority answers code 101) and is also retried after read
+    errors and 5xx answers, with backoff.
+
+    The session is thread-safe for this use and shared through
+    get_zarinpal_client.
+    """
+    REQUEST_PATH = '/pg/v4/payment/request.json'
+    VERIFY_PATH = '/pg/v4/payment/verify.json'
+    START_PAY_PATH = '/pg/StartPay/{authority}'
+
+    REQUEST_RETRIES = 1
+    VERIFY_RETRIES = 2
+    BACKOFF = 0.3  # seconds, doubled per retry
+
+    def __init__(self, base_url=None, connect_timeout=None, read_timeout=None, pool_size=None):
+        self.base_url = (
+            base_url
+            or settings.ZARINPAL_BASE_URL
+            or f'https://{settings.ZARINPAL_URL}.zarinpal.com'
+        ).rstrip('/')
+        self.timeout = (
+            connect_timeout or settings.ZARINPAL_CONNECT_TIMEOUT,
+            read_timeout or settings.ZARINPAL_READ_TIMEOUT,
+        )
+        pool_size = pool_size or settings.ZARINPAL_POOL_SIZE
+
+        self.session = requests.Session()
+        self.session.mount(self.base_url, HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=self.REQUEST_RETRIES,
+                connect=self.REQUEST_RETRIES,
+                read=0,
+                status=0,
+                other=0,
+                backoff_factor=self.BACKOFF,
+            ),
+        ))
+        # the longest mounted prefix wins
+        self.session.mount(self.base_url + self.VERIFY_PATH, HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=self.VERIFY_RETRIES,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=None,
+                backoff_factor=self.BACKOFF,
+                raise_on_status=False,
+            ),
+        ))
+
+    def _post(self, path, payload):
+        try:
+            response = self.session.post(
+                self.base_url + path,
+                json=payload,
+                timeout=self.timeout,
+            )
+            # 5xx is the gateway failing, not an answer about the payment
+            if response.status_code >= 500:
+                raise GatewayError(f'gateway answered {response.status_code}')
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise GatewayError(str(e)) from e
+
+    def pay_request(self, merchant_id, amount, callback_url, description, metadata=None):
+        """Returns the gateway's answer, with data.authority on success."""
+        return self._post(self.REQUEST_PATH, {
+            'merchant_id': merchant_id,
+            'amount': amount,
+            'currency': 'IRT',
+            'description': description,
+            'callback_url': callback_url,
+            'meta_data': metadata or {},
+        })
+
+    def verify(self, merchant_id, amount, authority):
+        """Returns the gateway's answer, with data.code and data.ref_id."""
+        return self._post(self.VERIFY_PATH, {
+            'merchant_id': merchant_id,
+            'amount': amount,
+            'authority': authority,
+        })
+
+    def start_pay_url(self, authority):
+        return self.base_url + self.START_PAY_PATH.format(authority=authority)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+
+
+def get_zarinpal_client():
+    global _client
+
+    if _client is None:
+        _client = ZarinpalClient()
+
+    return _client
@@ -0,0 +1,89 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.payment.fake_zarinpal import FakeZarinpal
+from apps.payment.gateway import GatewayError, ZarinpalClient
+
+
+class Command(BaseCommand):
+    help = (
+        'Run parallel payment request + verify round trips through '
+        'ZarinpalClient, against a fake Zarinpal started in-process unless '
+        '--url is given. --no-pool sends them with bare requests.post instead.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Gateway base url, defaults to an in-process FakeZarinpal')
+        parser.add_argument('--payments', type=int, default=500)
+        parser.add_argument('--workers', type=int, default=20)
+        parser.add_argument('--latency', type=float, default=0.01, help='Latency of the in-process fake')
+        parser.add_argument('--fail-rate', type=float, default=0, help='503 rate of the in-process fake')
+        parser.add_argument('--no-pool', action='store_true', help='One connection per call, as before')
+
+    def round_trip(self, client, pooled):
+        started = time.monotonic()
+        payload = {
+            'merchant_id': 'benchmark',
+            'amount': 10000,
+            'callback_url': 'http://localhost/verify',
+            'description': 'benchmark',
+        }
+
+        try:
+            if pooled:
+                answer = client.pay_request(**payload)
+                authority = answer['data']['authority']
+                answer = client.verify('benchmark', 10000, authority)
+            else:
+                answer = requests.post(client.base_url + client.REQUEST_PATH, json=payload).json()
+                authority = answer['data']['authority']
+                answer = requests.post(client.base_url + client.VERIFY_PATH, json={
+                    'merchant_id': 'benchmark',
+                    'amount': 10000,
+                    'authority': authority,
+                }).json()
+            ok = answer['data']['code'] in (100, 101)
+        except (GatewayError, requests.RequestException, KeyError, TypeError, ValueError):
+            ok = False
+
+        return ok, time.monotonic() - started
+
+    def handle(self, *args, **options):
+        fake = None
+        url = options['url']
+        if url is None:
+            fake = FakeZarinpal(latency=options['latency'], fail_rate=options['fail_rate']).start()
+            url = fake.url
+
+        client = ZarinpalClient(base_url=url, pool_size=options['workers'])
+        pooled = not options['no_pool']
+
+        try:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                started = time.monotonic()
+                outcomes = list(executor.map(
+                    lambda _: self.round_trip(client, pooled),
+                    range(options['payments']),
+                ))
+                elapsed = time.monotonic() - started
+        finally:
+            client.close()
+            if fake is not None:
+                fake.stop()
+
+        succeeded = sum(1 for ok, _ in outcomes if ok)
+        latencies = sorted(latency for _, latency in outcomes)
+        if not latencies:
+            raise CommandError('No payments were run')
+
+        self.stdout.write(
+            f'{len(outcomes)} payments in {elapsed:.2f}s '
+            f'({len(outcomes) / elapsed:.0f}/s, {"pooled" if pooled else "no pool"}), '
+            f'{succeeded} verified, '
+            f'p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, '
+            f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms, '
+            f'max {latencies[-1] * 1000:.1f}ms'
+        )
@@ -0,0 +1,49 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.payment.core import PaymentReconciler
+
+INTERVAL = 300
+
+
+class Command(BaseCommand):
+    help = 'Verify payments left pending against the gateway and settle them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=PaymentReconciler.WORKERS,
+            help='Gateway calls in flight at once',
+        )
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=int(PaymentReconciler.GRACE.total_seconds() // 60),
+            help='Minutes a payment is left to its callback first',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help=f'Keep reconciling every {INTERVAL} seconds',
+        )
+
+    def handle(self, *args, **options):
+        reconciler = PaymentReconciler(
+            workers=options['workers'],
+            grace=timedelta(minutes=options['grace']),
+        )
+
+        while True:
+            counts = reconciler.run()
+            self.stdout.write(
+                f"{counts['completed']} payments completed, "
+                f"{counts['failed']} failed, {counts['pending']} still pending"
+            )
+
+            if not options['loop']:
+                break
+
+            time.sleep(INTERVAL)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from apps.payment.fake_zarinpal import FakeZarinpal
+
+
+class Command(BaseCommand):
+    help = 'Serve a local stand-in for the Zarinpal API, see FakeZarinpal'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8990)
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0,
+            help='Seconds to wait before every answer',
+        )
+        parser.add_argument(
+            '--fail-rate',
+            type=float,
+            default=0,
+            help='Share of answers that are 503s, between 0 and 1',
+        )
+
+    def handle(self, *args, **options):
+        fake = FakeZarinpal(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'],
+            fail_rate=options['fail_rate'],
+        )
+        self.stdout.write(f'Fake Zarinpal on {fake.url}, set ZARINPAL_BASE_URL={fake.url}')
+
+        try:
+            fake.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            fake.server.server_close()
@@ -78,7 +78,12 @@ class Payment(BaseModel):
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['user'])
+            models.Index(fields=['user']),
+            # pending payments, see PaymentReconciler
+            models.Index(
+                fields=['status', 'created_at', 'id'],
+                name='payment_status_created_idx',
+            ),
         ]
 
     def __str__(self):
@@ -1,9 +1,10 @@
 from rest_framework import views, status, permissions
 from rest_framework.response import Response
 from django.shortcuts import redirect
-from django.conf import settings
 from utils.response import ApiResponse
+from utils.idempotency import idempotent
 from apps.payment.core import PaymentCore
+from apps.payment.gateway import get_zarinpal_client
 from apps.payment.models import Payment, Zarinpal
 from apps.payment.serializers.user import (
     PaymentCreateSerializer,
@@ -15,6 +16,7 @@ payment = PaymentCore()
 
 # Create your views here.
 class PaymentCreateView(views.APIView):
+    @idempotent('payment-create')
     def post(self, request):
         serializer = PaymentCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -57,7 +59,7 @@ class PaymentRedirectView(views.APIView):
     def get(self, request):
         try:
             zarinpal = Zarinpal.objects.get(id=request.GET.get('id'))
-            url = f'https://{settings.ZARINPAL_URL}.zarinpal.com/pg/StartPay/{zarinpal.authority}'
+            url = get_zarinpal_client().start_pay_url(zarinpal.authority)
 
             return redirect(url)
         
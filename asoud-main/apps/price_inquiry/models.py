@@ -1,6 +1,6 @@
 import os
 import uuid
-from apps.base.models import models, BaseModel
+from apps.base.models import models, BaseModel, DerivedImagesModel
 from apps.users.models import User
 from django.utils.translation import gettext_lazy as _
 # Create your models here.
@@ -92,7 +92,7 @@ class Inquiry(BaseModel):
     def __str__(self):
         return self.name
 
-class InquiryImage(BaseModel):
+class InquiryImage(DerivedImagesModel):
     inquiry = models.ForeignKey(
         Inquiry,
         related_name="images",
@@ -151,7 +151,7 @@ class InquiryAnswer(BaseModel):
     def __str__(self):
         return str(self.id)[:4]
     
-class InquiryAnswerImage(BaseModel):
+class InquiryAnswerImage(DerivedImagesModel):
     answer = models.ForeignKey(
         InquiryAnswer,
         related_name="images",
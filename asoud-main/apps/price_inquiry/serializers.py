@@ -7,16 +7,21 @@ from apps.price_inquiry.models import (
 )
 from apps.users.serializers import UserSerializer
 from jdatetime import datetime as jdatetime
+from utils.images import ImageVariantField
 
 
 class InquiryImageSerializer(serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
+    image_thumb = ImageVariantField(source='image', variant='thumb')
+    image_webp = ImageVariantField(source='image', variant='webp')
 
     class Meta:
         model = InquiryImage
         fields = [
             'id',
-            'image'
+            'image',
+            'image_thumb',
+            'image_webp',
         ]
 
 class InquiryImageListSerializer(serializers.Serializer):
@@ -126,11 +131,16 @@ class InquiryExpireSetSerializer(serializers.ModelSerializer):
 
 class InquiryAnswerImageSerializer(serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
+    image_thumb = ImageVariantField(source='image', variant='thumb')
+    image_webp = ImageVariantField(source='image', variant='webp')
+
     class Meta:
         model = InquiryAnswerImage
         fields = [
             'id',
-            'image'
+            'image',
+            'image_thumb',
+            'image_webp',
         ]
 
 class InquiryAnswerSerializer(serializers.ModelSerializer):
@@ -1,5 +1,6 @@
 from rest_framework import views, status
 from rest_framework.response import Response
+from django.db import transaction
 from utils.response import ApiResponse
 from apps.price_inquiry.models import (
     Inquiry,
@@ -10,8 +11,7 @@ from apps.price_inquiry.serializers import (
     InquiryAnswerSerializer,
     InquiryAnswerCreateSerializer,
 )
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from apps.notification.core import NotificationOutbox
 
 # use websocket
 class InquiryListView(views.APIView):
@@ -19,7 +19,7 @@ class InquiryListView(views.APIView):
         inquiries = Inquiry.objects.all()
 
         if name := request.GET.get('name'):
-            inquiries = inquiries.filter(name__icontain=name)
+            inquiries = inquiries.filter(name__icontains=name)
         
         if type := request.GET.get('type'):
             inquiries = inquiries.filter(type=type)
@@ -86,18 +86,16 @@ class InquiryAnswerCreateView(views.APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        obj = serializer.save(
-            inquiry=inquiry,
-            user=request.user
-        )
+        with transaction.atomic():
+            obj = serializer.save(
+                inquiry=inquiry,
+                user=request.user
+            )
 
-        # send notification to user
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"user_{inquiry.user.id}",  # Group name for the user
-            {
-                "type": "send_notification",
-                "data": {
+            # send notification to user
+            NotificationOutbox.enqueue(
+                f"user_{inquiry.user_id}",  # Group name for the user
+                {
                     "type": "inquiry-answer",
                     "message": "New Answer To Your Inquiry",
                     "inquiry-answer": {
@@ -105,8 +103,7 @@ class InquiryAnswerCreateView(views.APIView):
                         "detail": obj.detail
                     },
                 }
-            }
-        )
+            )
         
         serialized_data = InquiryAnswerSerializer(obj).data
 
@@ -1,5 +1,6 @@
 from rest_framework import views, status
 from rest_framework.response import Response
+from django.db import transaction
 from utils.response import ApiResponse
 from apps.price_inquiry.models import (
     Inquiry,
@@ -16,8 +17,7 @@ from apps.price_inquiry.serializers import (
     InquiryAnswerSerializer,
     InquiryImageListSerializer,
 )
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from apps.notification.core import NotificationOutbox
 
 
 class InquiryCreateView(views.APIView):
@@ -165,17 +165,14 @@ class InquirySendSetView(views.APIView):
 
         # Update the inquiry
         inquiry.send = serializer.validated_data['send']
-        inquiry.save()
 
-        response_serializer = InquirySerializer(inquiry)
+        with transaction.atomic():
+            inquiry.save()
 
-        # send sms or notification to owners
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            "owners",
-            {
-                "type": "send_notification",
-                "data": {
+            # send sms or notification to owners
+            NotificationOutbox.enqueue(
+                "owners",
+                {
                     "type": "inquiry",
                     "message": "New Inquiry Added",
                     "inquiry": {
@@ -183,9 +180,9 @@ class InquirySendSetView(views.APIView):
                         "name": inquiry.name
                     },
                 }
-            }
-        )
+            )
 
+        response_serializer = InquirySerializer(inquiry)
 
         return Response(
             ApiResponse(
@@ -0,0 +1,491 @@
+import csv
+import heapq
+import io
+import itertools
+import json
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Prefetch, Q, Sum, Value
+from django.db.models.functions import Length
+
+from apps.product.models import Product, ProductKeyword, ProductTheme
+from apps.affiliate.models import AffiliateProduct, AffiliateProductTheme
+from apps.cart.models import StockReservation
+from apps.category.models import SubCategory
+from apps.discount.core import EffectivePrice
+from apps.market_subdomain.cache import StorefrontCache
+from apps.product.serializers.owner_serializers import ProductImportRowSerializer
+from apps.search.core import SearchIndex
+from utils.keywords import KeywordResolver
+from utils.cursor import DATETIME_CURSOR
+
+
+class ProductListStream:
+    """
+    A market's products, newest first, one keyset page at a time.
+
+    Pages are keyed on (created_at, id), so each page is an index range scan
+    on (market, created_at, id) instead of an OFFSET. With affiliate
+    products, both tables are read up to the same cursor and merged into a
+    single ordered stream.
+    """
+    DEFAULT_LIMIT = 20
+    MAX_LIMIT = 100
+    CURSOR = DATETIME_CURSOR  # (created_at, id)
+
+    @staticmethod
+    def sort_key(item):
+        return item.created_at, item.id
+
+    @classmethod
+    def _page(cls, queryset, limit, cursor):
+        queryset = queryset.prefetch_related(
+            'images',
+        ).order_by('-created_at', '-id')
+
+        if cursor:
+            created_at, item_id = cls.CURSOR.decode(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at)
+                | Q(created_at=created_at, id__lt=item_id)
+            )
+
+        return list(queryset[:limit + 1])
+
+    @classmethod
+    def page(cls, market_id, limit=DEFAULT_LIMIT, cursor=None, with_affiliate=False):
+        """Returns (items, next_cursor); items mixes Product and AffiliateProduct."""
+        limit = min(limit, cls.MAX_LIMIT)
+
+        items = cls._page(Product.objects.filter(market_id=market_id), limit, cursor)
+
+        if with_affiliate:
+            affiliates = cls._page(
+                AffiliateProduct.objects.filter(market_id=market_id),
+                limit,
+                cursor,
+            )
+            items = list(heapq.merge(items, affiliates, key=cls.sort_key, reverse=True))
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = cls.CURSOR.encode(items[-1].created_at, items[-1].id)
+
+        return items, next_cursor
+
+
+class ThemeLayout:
+    """
+    A market's product and affiliate product themes with their products and
+    images, in a fixed number of queries (three per theme kind) whatever
+    the number of themes and products.
+    """
+
+    @staticmethod
+    def product_themes(market_id):
+        # theme_index holds '1'..'99', sort it numerically; unindexed last
+        products = Product.objects.prefetch_related('images').order_by(
+            Length('theme_index').asc(nulls_last=True),
+            'theme_index',
+            'created_at',
+        )
+
+        return ProductTheme.objects.filter(
+            market_id=market_id,
+        ).order_by('order', 'created_at').prefetch_related(
+            Prefetch('products', queryset=products),
+        )
+
+    @staticmethod
+    def affiliate_themes(market_id):
+        products = AffiliateProduct.objects.prefetch_related(
+            'images',
+        ).order_by('created_at')
+
+        return AffiliateProductTheme.objects.filter(
+            market_id=market_id,
+        ).order_by('order', 'created_at').prefetch_related(
+            Prefetch('affiliate_products', queryset=products),
+        )
+
+
+class CatalogImporter:
+    """
+    Streams a CSV or JSONL catalog into a market's products.
+
+    Rows are read lazily and handled in chunks of CHUNK_SIZE: each chunk is
+    validated, its sub-categories and keywords are resolved with one query
+    each, and the products, their keyword links and search columns are
+    written with bulk_create/bulk_update. Invalid rows are skipped and
+    reported with their row number. Only new products are created.
+
+    In CSV files keywords are separated by '|'; empty cells are treated as
+    missing so model defaults apply.
+    """
+    CSV = 'csv'
+    JSONL = 'jsonl'
+    FORMATS = [CSV, JSONL]
+
+    CHUNK_SIZE = 500
+    MAX_ERRORS = 100
+
+    def __init__(self, market, progress=None):
+        self.market = market
+        self.progress = progress
+        self.created = 0
+        self.rows = 0
+        self.errors = []
+
+    @classmethod
+    def guess_format(cls, filename):
+        return cls.JSONL if filename.lower().endswith(('.jsonl', '.ndjson')) else cls.CSV
+
+    def read(self, stream, file_format):
+        """Yields row dicts from a binary stream, None for an unreadable line."""
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+        try:
+            if file_format == self.JSONL:
+                for line in text:
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        row = None
+                    yield row if isinstance(row, dict) else None
+            else:
+                for row in csv.DictReader(text):
+                    row = {
+                        key: value for key, value in row.items()
+                        if key and value not in ('', None)
+                    }
+                    if 'keywords' in row:
+                        row['keywords'] = row['keywords'].split('|')
+                    yield row
+        finally:
+            # leave the caller's stream open
+            text.detach()
+
+    def run(self, stream, file_format):
+        chunk = []
+        for row in self.read(stream, file_format):
+            self.rows += 1
+            if row is None:
+                self._error(self.rows, 'Invalid JSON object')
+                continue
+
+            chunk.append((self.rows, row))
+            if len(chunk) == self.CHUNK_SIZE:
+                self._import_chunk(chunk)
+                chunk = []
+
+        if chunk:
+            self._import_chunk(chunk)
+
+        StorefrontCache.bump(self.market.id)
+
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'failed': self.rows - self.created,
+            'errors': self.errors,
+        }
+
+    def _error(self, row_number, error):
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append({'row': row_number, 'error': error})
+
+    def _sub_categories(self, values):
+        """Maps sub-category ids and titles to SubCategory ids."""
+        ids, titles = set(), set()
+        for value in values:
+            try:
+                ids.add(uuid.UUID(value))
+            except ValueError:
+                titles.add(value)
+
+        result = {}
+        rows = SubCategory.objects.filter(
+            Q(id__in=ids) | Q(title__in=titles),
+        ).values_list('id', 'title')
+
+        for sub_category_id, title in rows:
+            result[str(sub_category_id)] = sub_category_id
+            result.setdefault(title, sub_category_id)
+        return result
+
+    def _import_chunk(self, chunk):
+        valid = []
+        for row_number, row in chunk:
+            serializer = ProductImportRowSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((row_number, serializer.validated_data))
+            else:
+                self._error(row_number, serializer.errors)
+
+        sub_categories = self._sub_categories(
+            {data['sub_category'] for _, data in valid}
+        )
+        # keywords are normalized by the serializer
+        names = list(dict.fromkeys(
+            name for _, data in valid for name in data['keywords']
+        ))
+        keyword_ids = dict(zip(
+            names,
+            KeywordResolver.for_model(ProductKeyword).resolve(names),
+        ))
+
+        products = []
+        product_keywords = {}
+        for row_number, data in valid:
+            data = dict(data)
+            sub_category_id = sub_categories.get(data.pop('sub_category'))
+            if sub_category_id is None:
+                self._error(row_number, {'sub_category': ['Sub category not found']})
+                continue
+
+            product = Product(
+                market=self.market,
+                sub_category_id=sub_category_id,
+                **{key: value for key, value in data.items() if key != 'keywords'},
+            )
+            products.append(product)
+            product_keywords[product.id] = data['keywords']
+
+        with transaction.atomic():
+            Product.objects.bulk_create(products, batch_size=self.CHUNK_SIZE)
+
+            Product.keywords.through.objects.bulk_create(
+                [
+                    Product.keywords.through(
+                        product_id=product_id,
+                        productkeyword_id=keyword_ids[name],
+                    )
+                    for product_id, names in product_keywords.items()
+                    for name in names
+                ],
+                batch_size=self.CHUNK_SIZE,
+            )
+
+            # bulk_create skips the post_save indexing and pricing
+            SearchIndex.index_products(products, product_keywords)
+            EffectivePrice.refresh([product.id for product in products])
+
+        self.created += len(products)
+        if self.progress:
+            self.progress(self.rows, self.created)
+
+
+class CatalogExporter:
+    """
+    Streams a market's products as CSV or JSONL, in import format.
+
+    csv() and jsonl() are sync generators. Under ASGI Django would buffer
+    those whole before sending, so views use stream(), which pulls
+    CHUNK_LINES lines at a time in the request's sync thread.
+    """
+    CHUNK_SIZE = 2000
+    CHUNK_LINES = 500
+
+    def __init__(self, market_id):
+        self.market_id = market_id
+
+    def rows(self):
+        fields = [
+            name for name in ProductImportRowSerializer.Meta.fields
+            if name not in ('sub_category', 'keywords')
+        ]
+
+        products = Product.objects.filter(
+            market_id=self.market_id,
+        ).annotate(
+            keyword_names=ArrayAgg(
+                'keywords__name',
+                filter=Q(keywords__isnull=False),
+                default=Value([]),
+            ),
+        ).order_by('created_at', 'id').values(
+            'id', 'sub_category_id', 'keyword_names', *fields,
+        ).iterator(chunk_size=self.CHUNK_SIZE)
+
+        for product in products:
+            yield {
+                'id': str(product.pop('id')),
+                'sub_category': str(product.pop('sub_category_id')),
+                'keywords': product.pop('keyword_names'),
+                **product,
+            }
+
+    def header(self):
+        return ['id', *ProductImportRowSerializer.Meta.fields]
+
+    def csv(self):
+        """Yields CSV lines."""
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.header())
+
+        def flush():
+            value = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return value
+
+        writer.writeheader()
+        yield flush()
+
+        for row in self.rows():
+            row['keywords'] = '|'.join(row['keywords'])
+            writer.writerow(row)
+            yield flush()
+
+    def jsonl(self):
+        """Yields JSON lines."""
+        for row in self.rows():
+            yield json.dumps(row, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n'
+
+    async def stream(self, file_format):
+        """Async iterator over the csv() or jsonl() output, in chunks."""
+        lines = getattr(self, file_format)()
+        # thread sensitive: the server-side cursor lives on that thread's connection
+        take = sync_to_async(lambda: list(itertools.islice(lines, self.CHUNK_LINES)))
+        try:
+            while chunk := await take():
+                yield ''.join(chunk)
+        finally:
+            await sync_to_async(lines.close)()
+
+
+class StockBelowHeld(Exception):
+    """Stock counts below the units held by pending orders."""
+    def __init__(self, held):
+        super().__init__('Stock below held units')
+        # product id -> units held
+        self.held = {str(product_id): units for product_id, units in held.items()}
+
+
+class ProductBulkUpdate:
+    """
+    Applies price/stock changes to many products of one owner at once.
+
+    Ownership is checked by the same locked query that loads the rows, and
+    the changes are written with bulk_update in one transaction. Affiliate
+    copies follow the source product: their price tracks main_price and
+    their stock tracks stock. bulk_update sends no signals, so the touched
+    products are re-priced and their storefronts bumped here.
+
+    A stock value is the owner's count of units on hand. Units held by
+    pending orders (see StockReservationCore) are already taken out of
+    Product.stock, so the value is stored net of them; releasing a hold
+    then gives back units that were counted. A count below the held units
+    would let releases oversell, so the whole update is rejected.
+    """
+    FIELDS = ['main_price', 'colleague_price', 'marketer_price', 'stock']
+    BATCH_SIZE = 500
+
+    @classmethod
+    def apply(cls, user, items):
+        """
+        items are dicts with an id and some of FIELDS. Returns
+        (updated, affiliates_updated), or raises Product.DoesNotExist with
+        the ids that are missing or not owned by user, or StockBelowHeld.
+        """
+        changes = {item['id']: item for item in items}
+        fields = sorted({
+            name for item in items for name in item if name in cls.FIELDS
+        })
+
+        with transaction.atomic():
+            products = list(
+                # of=self: the markets joined for the owner check stay unlocked
+                Product.objects.select_for_update(of=('self',)).filter(
+                    id__in=changes,
+                    market__user=user,
+                ).order_by('id').only('id', 'market_id', *cls.FIELDS)
+            )
+
+            missing = set(changes) - {product.id for product in products}
+            if missing:
+                raise Product.DoesNotExist(sorted(str(i) for i in missing))
+
+            held = {}
+            if 'stock' in fields:
+                held = dict(
+                    StockReservation.objects.filter(
+                        product_id__in=[
+                            product_id for product_id, item in changes.items()
+                            if 'stock' in item
+                        ],
+                        status=StockReservation.HELD,
+                    ).values('product').annotate(
+                        total=Sum('quantity'),
+                    ).values_list('product', 'total')
+                )
+
+            short = {
+                product_id: units for product_id, units in held.items()
+                if changes[product_id]['stock'] < units
+            }
+            if short:
+                raise StockBelowHeld(short)
+
+            for product in products:
+                for name in fields:
+                    if name in changes[product.id]:
+                        setattr(product, name, changes[product.id][name])
+                if 'stock' in changes[product.id]:
+                    product.stock -= held.get(product.id, 0)
+            stock = {product.id: product.stock for product in products}
+
+            Product.objects.bulk_update(products, fields, batch_size=cls.BATCH_SIZE)
+
+            if 'main_price' in fields:
+                EffectivePrice.refresh([
+                    product_id for product_id, item in changes.items()
+                    if 'main_price' in item
+                ])
+
+            # affiliate field -> product field it copies
+            propagated = {
+                affiliate_field: field
+                for affiliate_field, field in [('price', 'main_price'), ('stock', 'stock')]
+                if field in fields
+            }
+
+            affiliates = []
+            if propagated:
+                affiliates = list(
+                    AffiliateProduct.objects.select_for_update(of=('self',)).filter(
+                        product_id__in=[
+                            product_id for product_id, item in changes.items()
+                            if not item.keys().isdisjoint(propagated.values())
+                        ],
+                    ).order_by('id').only('id', 'market_id', 'product_id', 'price', 'stock')
+                )
+
+                for affiliate in affiliates:
+                    item = changes[affiliate.product_id]
+                    for affiliate_field, field in propagated.items():
+                        if field in item:
+                            value = stock[affiliate.product_id] if field == 'stock' else item[field]
+                            setattr(affiliate, affiliate_field, value)
+
+                AffiliateProduct.objects.bulk_update(
+                    affiliates,
+                    list(propagated),
+                    batch_size=cls.BATCH_SIZE,
+                )
+
+            market_ids = {item.market_id for item in [*products, *affiliates]}
+            for market_id in market_ids:
+                transaction.on_commit(
+                    lambda market_id=market_id: StorefrontCache.bump(market_id),
+                    robust=True,
+                )
+
+        return len(products), len(affiliates)
@@ -0,0 +1,44 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.market.models import Market
+from apps.product.core import CatalogImporter
+
+
+class Command(BaseCommand):
+    help = 'Import products into a market from a CSV or JSONL catalog file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('market_id')
+        parser.add_argument('path')
+        parser.add_argument(
+            '--type',
+            choices=CatalogImporter.FORMATS,
+            help='File format, guessed from the extension by default',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            market = Market.objects.get(id=options['market_id'])
+        except Market.DoesNotExist:
+            raise CommandError('Market not found')
+
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'{path} does not exist')
+
+        file_format = options['type'] or CatalogImporter.guess_format(path)
+
+        def progress(rows, created):
+            self.stdout.write(f'{rows} rows read, {created} products created')
+
+        with open(path, 'rb') as stream:
+            result = CatalogImporter(market, progress=progress).run(stream, file_format)
+
+        for error in result['errors']:
+            self.stderr.write(f"row {error['row']}: {error['error']}")
+
+        self.stdout.write(
+            f"{result['created']} products created, {result['failed']} rows failed"
+        )
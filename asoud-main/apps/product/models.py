@@ -1,7 +1,9 @@
 from django.utils.translation import gettext_lazy as _
 from django.contrib.contenttypes.fields import GenericRelation
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
-from apps.base.models import models, BaseModel
+from apps.base.models import models, BaseModel, DerivedImagesModel
 from apps.users.models import User
 from apps.market.models import Market
 from apps.comment.models import Comment
@@ -287,10 +289,68 @@ class Product(BaseModel):
         verbose_name=_('Theme Index')
     )
 
+    # kept in sync by apps.search.signals
+    search_name = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name=_('Search name'),
+    )
+    search_vector = SearchVectorField(
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name=_('Search vector'),
+    )
+
+    # main_price after the best public discount, kept in sync by
+    # apps.discount.core.EffectivePrice
+    effective_price = models.DecimalField(
+        max_digits=14,
+        decimal_places=3,
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name=_('Effective price'),
+    )
+    effective_price_until = models.DateTimeField(
+        blank=True,
+        null=True,
+        editable=False,
+        verbose_name=_('Effective price until'),
+    )
+
     class Meta:
         db_table = 'product'
         verbose_name = _('Product')
         verbose_name_plural = _('Products')
+        indexes = [
+            # keyset pagination of a market's products, see ProductListStream
+            models.Index(
+                fields=['market', '-created_at', '-id'],
+                name='product_market_created_idx',
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='product_search_vector_idx',
+            ),
+            GinIndex(
+                fields=['search_name'],
+                name='product_search_name_trgm_idx',
+                opclasses=['gin_trgm_ops'],
+            ),
+            models.Index(
+                fields=['market', 'effective_price'],
+                name='product_market_price_idx',
+            ),
+            # expired discounts to re-price, see refresh_effective_prices
+            models.Index(
+                fields=['effective_price_until'],
+                condition=models.Q(effective_price_until__isnull=False),
+                name='product_price_until_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -310,7 +370,7 @@ class ProductShipping(BaseModel):
         return self.name
     
     
-class ProductImage(BaseModel):
+class ProductImage(DerivedImagesModel):
     product = models.ForeignKey(
         Product,
         on_delete=models.CASCADE,
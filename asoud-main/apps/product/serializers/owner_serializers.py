@@ -1,4 +1,7 @@
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+from utils.images import ImageVariantField
+from utils.keywords import KeywordResolver
 from django.urls import reverse
 
 from apps.users.models import User
@@ -11,14 +14,42 @@ from apps.product.models import (
     ProductImage,
 )
 
+class KeywordListField(serializers.ManyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        # the whole list is resolved at once, returns keyword ids
+        try:
+            return KeywordResolver.for_model(ProductKeyword).resolve(data)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+
 class KeywordField(serializers.RelatedField):
 
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        # RelatedField.many_init, with the batched list field
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return KeywordListField(**list_kwargs)
+
     def to_representation(self, value):
         return value.name
 
     def to_internal_value(self, data):
-        keyword_obj, created = ProductKeyword.objects.get_or_create(name=data.strip())
-        return keyword_obj
+        try:
+            keyword_ids = KeywordResolver.for_model(ProductKeyword).resolve([data])
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        if not keyword_ids:
+            raise serializers.ValidationError("Keyword is empty")
+        return ProductKeyword.objects.get(id=keyword_ids[0])
     
 class UserField(serializers.RelatedField):
     def to_representation(self, value):
@@ -33,12 +64,16 @@ class UserField(serializers.RelatedField):
 
 class ProductImageSerializer(serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
+    image_thumb = ImageVariantField(source='image', variant='thumb')
+    image_webp = ImageVariantField(source='image', variant='webp')
 
     class Meta:
         model = ProductImage
         fields = [
             'id',
-            'image'
+            'image',
+            'image_thumb',
+            'image_webp',
         ]
 
 
@@ -173,6 +208,7 @@ class ProductListSerializer(serializers.ModelSerializer):
             'name',
             'description',
             'main_price',
+            'effective_price',
             'stock',
             'images',
         ]
@@ -186,6 +222,7 @@ class ProductWithIndexListSerializer(serializers.ModelSerializer):
             'name',
             'description',
             'main_price',
+            'effective_price',
             'stock',
             'images',
             'theme_index',
@@ -205,6 +242,7 @@ class ProductDetailSerializer(serializers.ModelSerializer):
             # 'keywords' TODO: Handle manytomanyfield
             'stock',
             'main_price',
+            'effective_price',
             'required_product',
             'gift_product',
             'is_marketer',
@@ -242,3 +280,80 @@ class ProductThemeCreateSerializer(serializers.ModelSerializer):
             'name',
             'order',
         ]
+
+
+class ProductImportRowSerializer(serializers.ModelSerializer):
+    """One catalog import row; sub_category and keywords are resolved per chunk."""
+    sub_category = serializers.CharField(max_length=255)
+    keywords = serializers.ListField(
+        child=serializers.CharField(max_length=50, allow_blank=True),
+        required=False,
+        default=list,
+    )
+
+    class Meta:
+        model = Product
+        fields = [
+            'type',
+            'name',
+            'description',
+            'technical_detail',
+            'sub_category',
+            'keywords',
+            'stock',
+            'main_price',
+            'colleague_price',
+            'marketer_price',
+            'maximum_sell_price',
+            'status',
+            'is_marketer',
+            'is_requirement',
+            'tag',
+            'tag_position',
+            'sell_type',
+            'ship_cost_pay_type',
+        ]
+
+    def validate_keywords(self, value):
+        try:
+            return KeywordResolver.for_model(ProductKeyword).normalize(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+
+class ProductBulkUpdateItemSerializer(serializers.ModelSerializer):
+    id = serializers.UUIDField()
+
+    class Meta:
+        model = Product
+        fields = [
+            'id',
+            'main_price',
+            'colleague_price',
+            'marketer_price',
+            'stock',
+        ]
+        extra_kwargs = {
+            'main_price': {'required': False},
+        }
+
+    def validate(self, attrs):
+        if len(attrs) == 1:
+            raise serializers.ValidationError("Nothing to update")
+        return attrs
+
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    MAX_ITEMS = 500
+
+    items = ProductBulkUpdateItemSerializer(
+        many=True,
+        allow_empty=False,
+        max_length=MAX_ITEMS,
+    )
+
+    def validate_items(self, value):
+        ids = [item['id'] for item in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Duplicate product id")
+        return value
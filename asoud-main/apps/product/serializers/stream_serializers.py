@@ -0,0 +1,32 @@
+from rest_framework import serializers
+
+from apps.affiliate.models import AffiliateProduct
+from apps.affiliate.serializers.user import AffiliateProductListSerializer
+from apps.product.core import ProductListStream
+from apps.product.serializers.owner_serializers import ProductListSerializer
+from utils.cursor import CursorField
+
+
+class ProductListQuerySerializer(serializers.Serializer):
+    cursor = CursorField(ProductListStream.CURSOR, required=False)
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=ProductListStream.MAX_LIMIT,
+        default=ProductListStream.DEFAULT_LIMIT,
+    )
+    affiliate = serializers.BooleanField(default=False)
+
+
+class ProductStreamSerializer(serializers.Serializer):
+    """Serializes the mixed Product/AffiliateProduct items of ProductListStream."""
+
+    def to_representation(self, instance):
+        if isinstance(instance, AffiliateProduct):
+            serializer = AffiliateProductListSerializer(instance, context=self.context)
+        else:
+            serializer = ProductListSerializer(instance, context=self.context)
+
+        return {
+            **serializer.data,
+            'is_affiliate': isinstance(instance, AffiliateProduct),
+        }
@@ -10,7 +10,10 @@ from apps.product.views.owner_views import (
     ProductThemeUpdateAPIView,
     ProductThemeDeleteAPIView,
     ProductShippingCreateAPIView,
-    ProductShippingListAPIView
+    ProductShippingListAPIView,
+    CatalogImportAPIView,
+    CatalogExportAPIView,
+    ProductBulkUpdateAPIView,
 )
 
 app_name = 'product_owner'
@@ -36,6 +39,11 @@ urlpatterns = [
         ProductShippingListAPIView.as_view(),
         name='ship-list'
     ),
+    path(
+        'bulk-update/',
+        ProductBulkUpdateAPIView.as_view(),
+        name='bulk-update',
+    ),
     path(
         'list/<str:pk>/',
         ProductListAPIView.as_view(),
@@ -66,4 +74,14 @@ urlpatterns = [
         ProductThemeDeleteAPIView.as_view(),
         name='theme-delete',
     ),
+    path(
+        'catalog/import/<str:pk>/',
+        CatalogImportAPIView.as_view(),
+        name='catalog-import',
+    ),
+    path(
+        'catalog/export/<str:pk>/',
+        CatalogExportAPIView.as_view(),
+        name='catalog-export',
+    ),
 ]
@@ -1,5 +1,7 @@
 from rest_framework import views, status
 from rest_framework.response import Response
+from django.http import StreamingHttpResponse
+from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 
 from utils.response import ApiResponse
@@ -8,24 +10,34 @@ from apps.product.serializers.owner_serializers import (
     ProductCreateSerializer,
     ProductDiscountCreateSerializer,
     ProductDetailSerializer,
-    ProductListSerializer,
     ProductThemeListSerializer,
     ProductThemeCreateSerializer,
     ProductShippingCreateSerializer,
-    ProductShipListSerializer
+    ProductShipListSerializer,
+    ProductBulkUpdateSerializer,
+)
+from apps.product.serializers.stream_serializers import (
+    ProductListQuerySerializer,
+    ProductStreamSerializer,
 )
 from apps.product.models import Product, ProductTheme
+from apps.product.core import (
+    ProductListStream,
+    CatalogImporter,
+    CatalogExporter,
+    ProductBulkUpdate,
+    StockBelowHeld,
+    ThemeLayout,
+)
 from apps.market.models import Market
 from apps.advertise.core  import AdvertisementCore
 
 # affiliate products
 from apps.affiliate.models import (
-    AffiliateProduct, 
     AffiliateProductTheme
 )
 from apps.affiliate.serializers.user import (
-    AffiliateProductThemeListSerializer,
-    AffiliateProductListSerializer
+    AffiliateProductThemeListSerializer
 )
 
 class ProductCreateAPIView(views.APIView):
@@ -139,43 +151,32 @@ class ProductShippingListAPIView(views.APIView):
 
 class ProductListAPIView(views.APIView):
     def get(self, request, pk):
-        product_list = Product.objects.filter(
-            market=pk
+        query = ProductListQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        products, next_cursor = ProductListStream.page(
+            market_id=pk,
+            limit=params['limit'],
+            cursor=params.get('cursor'),
+            with_affiliate=params['affiliate'],
         )
 
-        serializer = ProductListSerializer(
-            product_list,
+        serializer = ProductStreamSerializer(
+            products,
             many=True,
             context={"request": request},
         )
 
-        with_affiliate = request.GET.get('affiliate')
-
-        if with_affiliate:
-            affiliate_product_list = AffiliateProduct.objects.filter(
-                market=pk
-            )
-            
-            aff_serializer = AffiliateProductListSerializer(
-                affiliate_product_list,
-                many=True,
-                context={"request": request},
-            )
-
-            success_response = ApiResponse(
-                success=True,
-                code=200,
-                data=serializer.data + aff_serializer.data,
-                message='Data retrieved successfully'
-            )
-            
-        else:
-            success_response = ApiResponse(
-                success=True,
-                code=200,
-                data=serializer.data,
-                message='Data retrieved successfully'
-            )
+        success_response = ApiResponse(
+            success=True,
+            code=200,
+            data={
+                'results': serializer.data,
+                'next': next_cursor,
+            },
+            message='Data retrieved successfully'
+        )
 
         return Response(success_response)
 
@@ -284,7 +285,7 @@ class ProductThemeListAPIView(views.APIView):
                 )
             )
     
-        product_theme_list = ProductTheme.objects.filter(market=market)
+        product_theme_list = ThemeLayout.product_themes(market.id)
 
         serializer = ProductThemeListSerializer(
             product_theme_list,
@@ -371,3 +372,148 @@ class ProductThemeDeleteAPIView(views.APIView):
             message='Product theme removed successfully.',
         )
         return Response(success_response, status=status.HTTP_200_OK)
+
+
+def get_owned_market(request, pk):
+    """Returns (market, None) or (None, error response)."""
+    try:
+        market = Market.objects.get(id=pk)
+    except (Market.DoesNotExist, ValidationError):
+        return None, Response(
+            ApiResponse(
+                success=False,
+                code=404,
+                error="Market Not Found"
+            ),
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    if market.user_id != request.user.id:
+        return None, Response(
+            ApiResponse(
+                success=False,
+                code=403,
+                error="You do not own this market"
+            ),
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    return market, None
+
+
+class CatalogImportAPIView(views.APIView):
+    def post(self, request, pk):
+        market, error = get_owned_market(request, pk)
+        if error:
+            return error
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                ApiResponse(
+                    success=False,
+                    code=400,
+                    error="file is required"
+                ),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        file_format = request.data.get('type') or CatalogImporter.guess_format(upload.name)
+        if file_format not in CatalogImporter.FORMATS:
+            return Response(
+                ApiResponse(
+                    success=False,
+                    code=400,
+                    error="type must be csv or jsonl"
+                ),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        result = CatalogImporter(market).run(upload.file, file_format)
+
+        success_response = ApiResponse(
+            success=True,
+            code=200,
+            data=result,
+            message='Catalog imported.',
+        )
+
+        return Response(success_response)
+
+
+class CatalogExportAPIView(views.APIView):
+    CONTENT_TYPES = {
+        'csv': 'text/csv; charset=utf-8',
+        'jsonl': 'application/jsonl; charset=utf-8',
+    }
+
+    def get(self, request, pk):
+        market, error = get_owned_market(request, pk)
+        if error:
+            return error
+
+        # 'format' is taken by DRF's format suffix negotiation
+        file_format = request.query_params.get('type', 'csv')
+        if file_format not in self.CONTENT_TYPES:
+            return Response(
+                ApiResponse(
+                    success=False,
+                    code=400,
+                    error="type must be csv or jsonl"
+                ),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        exporter = CatalogExporter(market.id)
+        response = StreamingHttpResponse(
+            exporter.stream(file_format),
+            content_type=self.CONTENT_TYPES[file_format],
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="catalog-{market.id}.{file_format}"'
+        )
+        return response
+
+
+class ProductBulkUpdateAPIView(views.APIView):
+    def patch(self, request):
+        serializer = ProductBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            updated, affiliates_updated = ProductBulkUpdate.apply(
+                request.user,
+                serializer.validated_data['items'],
+            )
+        except Product.DoesNotExist as e:
+            return Response(
+                ApiResponse(
+                    success=False,
+                    code=403,
+                    error="Products not found or not owned by you",
+                    data={'ids': e.args[0]},
+                ),
+                status=status.HTTP_403_FORBIDDEN
+            )
+        except StockBelowHeld as e:
+            return Response(
+                ApiResponse(
+                    success=False,
+                    code=409,
+                    error="Stock is below the units held by pending orders",
+                    data={'held': e.held},
+                ),
+                status=status.HTTP_409_CONFLICT
+            )
+
+        success_response = ApiResponse(
+            success=True,
+            code=200,
+            data={
+                'updated': updated,
+                'affiliates_updated': affiliates_updated,
+            },
+            message='Products updated successfully.',
+        )
+
+        return Response(success_response)
@@ -0,0 +1,22 @@
+from django.apps import AppConfig
+from django.db.models.signals import pre_migrate
+
+
+def create_trigram_extension(sender, using, **kwargs):
+    # the gin_trgm_ops indexes need pg_trgm before the tables are migrated;
+    # migrations are generated per deployment, so this can't live in one
+    from django.db import connections
+
+    with connections[using].cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+class SearchConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.search'
+
+    def ready(self):
+        import apps.search.signals
+
+        # apps without models (like this one) get no pre_migrate of their own
+        pre_migrate.connect(create_trigram_extension)
@@ -0,0 +1,188 @@
+import re
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Cast
+
+from apps.discount.core import EffectivePrice
+from apps.market.models import Market
+from apps.product.models import Product
+from apps.search.normalizer import normalize
+from utils.cursor import NUMBER_CURSOR
+
+_TOKEN = re.compile(r'\w+')
+
+
+class SearchIndex:
+    """
+    Fills the search columns of Product and Market from normalized text.
+
+    search_vector weighs the fields (name A, keywords/slogan B, description
+    C, technical detail D) under the 'simple' config, as Postgres ships no
+    Persian dictionary. search_name backs the trigram index that catches
+    typos and partial words.
+    """
+    CONFIG = 'simple'
+
+    @classmethod
+    def vector(cls, *weighted):
+        vectors = [
+            SearchVector(Value(normalize(text)), weight=weight, config=cls.CONFIG)
+            for text, weight in weighted
+        ]
+        vector = vectors[0]
+        for other in vectors[1:]:
+            vector = vector + other
+        return vector
+
+    @classmethod
+    def index_product(cls, product_id):
+        product = Product.objects.filter(id=product_id).values(
+            'name', 'description', 'technical_detail',
+        ).first()
+        if product is None:
+            return
+
+        keywords = ' '.join(
+            Product.keywords.through.objects.filter(
+                product_id=product_id,
+            ).values_list('productkeyword__name', flat=True)
+        )
+
+        Product.objects.filter(id=product_id).update(
+            search_name=normalize(product['name']),
+            search_vector=cls.vector(
+                (product['name'], 'A'),
+                (keywords, 'B'),
+                (product['description'], 'C'),
+                (product['technical_detail'], 'D'),
+            ),
+        )
+
+    @classmethod
+    def index_products(cls, products, keywords):
+        """
+        Indexes freshly bulk created products with one bulk update.
+        keywords maps a product id to its keyword names.
+        """
+        for product in products:
+            product.search_name = normalize(product.name)
+            product.search_vector = cls.vector(
+                (product.name, 'A'),
+                (' '.join(keywords.get(product.id, [])), 'B'),
+                (product.description, 'C'),
+                (product.technical_detail, 'D'),
+            )
+
+        Product.objects.bulk_update(
+            products,
+            ['search_name', 'search_vector'],
+            batch_size=500,
+        )
+
+    @classmethod
+    def index_market(cls, market_id):
+        market = Market.objects.filter(id=market_id).values(
+            'name', 'slogan', 'description',
+        ).first()
+        if market is None:
+            return
+
+        Market.objects.filter(id=market_id).update(
+            search_name=normalize(market['name']),
+            search_vector=cls.vector(
+                (market['name'], 'A'),
+                (market['slogan'], 'B'),
+                (market['description'], 'C'),
+            ),
+        )
+
+
+class SearchEngine:
+    """
+    Ranked full-text + trigram search over published products and markets.
+
+    Rows match on the tsvector (every word of the query as a prefix) or on
+    trigram word similarity of the name. They are ranked by the sum of both
+    scores and paged with a (rank, id) cursor.
+    """
+    DEFAULT_LIMIT = 20
+    MAX_LIMIT = 50
+    CURSOR = NUMBER_CURSOR  # (rank, id)
+
+    @staticmethod
+    def tsquery(text):
+        tokens = _TOKEN.findall(text)
+        if not tokens:
+            return None
+
+        return SearchQuery(
+            ' & '.join(f'{token}:*' for token in tokens),
+            search_type='raw',
+            config=SearchIndex.CONFIG,
+        )
+
+    @classmethod
+    def querysets(cls):
+        return {
+            'product': Product.objects.filter(
+                status=Product.PUBLISHED,
+                market__status=Market.PUBLISHED,
+            ).prefetch_related('images'),
+            'market': Market.objects.filter(
+                status=Market.PUBLISHED,
+            ).select_related('sub_category'),
+        }
+
+    @classmethod
+    def search(cls, kind, text, limit=DEFAULT_LIMIT, cursor=None,
+               user=None, min_price=None, max_price=None):
+        """
+        Returns (items, next_cursor) for kind 'product' or 'market'.
+        Products carry final_price, the price user pays, and can be
+        filtered on it.
+        """
+        text = normalize(text)
+        query = cls.tsquery(text)
+        if query is None:
+            return [], None
+
+        queryset = cls.querysets()[kind]
+        if kind == 'product':
+            queryset = EffectivePrice.annotate(queryset, user)
+            if min_price is not None:
+                queryset = queryset.filter(final_price__gte=min_price)
+            if max_price is not None:
+                queryset = queryset.filter(final_price__lte=max_price)
+
+        queryset = queryset.filter(
+            Q(search_vector=query) | Q(search_name__trigram_word_similar=text),
+        ).annotate(
+            # both scores are float4; as float8 the rank survives the
+            # round trip through the cursor exactly
+            rank=Cast(
+                SearchRank(F('search_vector'), query)
+                + TrigramWordSimilarity(text, 'search_name'),
+                FloatField(),
+            ),
+        ).order_by('-rank', 'id')
+
+        if cursor:
+            rank, item_id = cls.CURSOR.decode(cursor)
+            queryset = queryset.filter(
+                Q(rank__lt=rank) | Q(rank=rank, id__gt=item_id)
+            )
+
+        items = list(queryset[:limit + 1])
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = cls.CURSOR.encode(items[-1].rank, items[-1].id)
+
+        return items, next_cursor
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from apps.market.models import Market
+from apps.product.models import Product
+from apps.search.core import SearchIndex
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search columns of every product and market'
+
+    def handle(self, *args, **options):
+        count = 0
+        for market_id in Market.objects.values_list('id', flat=True).iterator():
+            SearchIndex.index_market(market_id)
+            count += 1
+        self.stdout.write(f'{count} markets indexed')
+
+        count = 0
+        for product_id in Product.objects.values_list('id', flat=True).iterator():
+            SearchIndex.index_product(product_id)
+            count += 1
+        self.stdout.write(f'{count} products indexed')
@@ -0,0 +1,44 @@
+import re
+
+# Arabic letters typed on Arabic keyboards -> their Persian forms
+_LETTERS = {
+    'ي': 'ی',  # ي -> ی
+    'ى': 'ی',  # ى -> ی
+    'ك': 'ک',  # ك -> ک
+    'ة': 'ه',  # ة -> ه
+    'ۀ': 'ه',  # ۀ -> ه
+    'أ': 'ا',  # أ -> ا
+    'إ': 'ا',  # إ -> ا
+}
+
+# Persian (۰-۹) and Arabic (٠-٩) digits -> ascii
+_DIGITS = {
+    **{0x06f0 + i: str(i) for i in range(10)},
+    **{0x0660 + i: str(i) for i in range(10)},
+}
+
+# zwnj, zwj, tatweel and the harakat/tanwin marks are dropped
+_REMOVED = {
+    **{ord(c): None for c in '‌‍ـٰ'},
+    **{code: None for code in range(0x064b, 0x0660)},
+}
+
+_TABLE = str.maketrans({
+    **{ord(k): v for k, v in _LETTERS.items()},
+    **_DIGITS,
+    **_REMOVED,
+})
+
+_SPACES = re.compile(r'\s+')
+
+
+def normalize(text):
+    """
+    Normalizes Persian text for indexing and querying, so that
+    'كتاب‌ها ۱۲' and 'کتابها 12' compare equal.
+    """
+    if not text:
+        return ''
+
+    text = text.translate(_TABLE).lower()
+    return _SPACES.sub(' ', text).strip()
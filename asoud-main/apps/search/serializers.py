@@ -0,0 +1,32 @@
+from rest_framework import serializers
+
+from apps.product.serializers.owner_serializers import ProductListSerializer
+from apps.search.core import SearchEngine
+from utils.cursor import CursorField
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    PRODUCT = 'product'
+    MARKET = 'market'
+
+    q = serializers.CharField(max_length=100)
+    type = serializers.ChoiceField(
+        choices=[PRODUCT, MARKET],
+        default=PRODUCT,
+    )
+    cursor = CursorField(SearchEngine.CURSOR, required=False)
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=SearchEngine.MAX_LIMIT,
+        default=SearchEngine.DEFAULT_LIMIT,
+    )
+    min_price = serializers.DecimalField(max_digits=14, decimal_places=3, required=False)
+    max_price = serializers.DecimalField(max_digits=14, decimal_places=3, required=False)
+
+
+class ProductSearchSerializer(ProductListSerializer):
+    # the caller's price, see EffectivePrice.annotate
+    final_price = serializers.DecimalField(max_digits=14, decimal_places=3, read_only=True)
+
+    class Meta(ProductListSerializer.Meta):
+        fields = ProductListSerializer.Meta.fields + ['final_price', 'market']
@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import post_save, m2m_changed
+from django.dispatch import receiver
+
+from apps.market.models import Market
+from apps.product.models import Product, ProductKeyword
+from apps.search.core import SearchIndex
+
+# The search columns are written with update(), so these never re-trigger
+# themselves. Saves that only touch other columns (e.g. stock) re-index as
+# well; it is a single indexed update.
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    transaction.on_commit(lambda: SearchIndex.index_product(instance.id))
+
+
+@receiver(m2m_changed, sender=Product.keywords.through)
+def index_product_keywords(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if isinstance(instance, Product):
+        product_ids = [instance.id]
+    else:
+        # changed from the keyword side: pk_set holds product ids
+        product_ids = pk_set or []
+
+    for product_id in product_ids:
+        transaction.on_commit(lambda product_id=product_id: SearchIndex.index_product(product_id))
+
+
+@receiver(post_save, sender=ProductKeyword)
+def index_keyword_products(sender, instance, created, **kwargs):
+    if created:
+        return
+
+    for product_id in instance.products.values_list('id', flat=True):
+        transaction.on_commit(lambda product_id=product_id: SearchIndex.index_product(product_id))
+
+
+@receiver(post_save, sender=Market)
+def index_market(sender, instance, **kwargs):
+    transaction.on_commit(lambda: SearchIndex.index_market(instance.id))
@@ -0,0 +1,13 @@
+from django.urls import path
+
+from apps.search.views import SearchAPIView
+
+app_name = 'search'
+
+urlpatterns = [
+    path(
+        '',
+        SearchAPIView.as_view(),
+        name='search',
+    ),
+]
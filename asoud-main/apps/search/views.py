@@ -0,0 +1,51 @@
+from rest_framework import views
+from rest_framework.response import Response
+
+from utils.response import ApiResponse
+
+from apps.market.serializers.user_serializers import MarketListSerializer
+from apps.search.core import SearchEngine
+from apps.search.serializers import (
+    SearchQuerySerializer,
+    ProductSearchSerializer,
+)
+
+
+class SearchAPIView(views.APIView):
+    def get(self, request):
+        query = SearchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        items, next_cursor = SearchEngine.search(
+            kind=params['type'],
+            text=params['q'],
+            limit=params['limit'],
+            cursor=params.get('cursor'),
+            user=request.user,
+            min_price=params.get('min_price'),
+            max_price=params.get('max_price'),
+        )
+
+        if params['type'] == SearchQuerySerializer.MARKET:
+            serializer_class = MarketListSerializer
+        else:
+            serializer_class = ProductSearchSerializer
+
+        serializer = serializer_class(
+            items,
+            many=True,
+            context={"request": request},
+        )
+
+        success_response = ApiResponse(
+            success=True,
+            code=200,
+            data={
+                'results': serializer.data,
+                'next': next_cursor,
+            },
+            message='Data retrieved successfully'
+        )
+
+        return Response(success_response)
@@ -3,7 +3,7 @@ from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import AbstractUser
 
 from .managers import CustomUserManager
-from apps.base.models import models, BaseModel
+from apps.base.models import models, BaseModel, DerivedImagesModel
 
 # Create your models here.
 
@@ -57,7 +57,7 @@ class User(AbstractUser):
     def is_owner(self):
         return self.markets.exists()
 
-class UserProfile(BaseModel):
+class UserProfile(DerivedImagesModel):
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
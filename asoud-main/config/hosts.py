@@ -5,6 +5,11 @@ host_patterns = patterns(
     '',
     #host(r'', 'config.urls', name='main'),
     host(r'app', 'config.app_urls', name='app'),
-    host(r'(?P<market_id>[a-zA-Z0-9-]{4,})', 'config.market_urls', name='market'),  # Dynamic pattern
+    host(
+        r'(?P<market_id>[a-zA-Z0-9-]{4,})',
+        'config.market_urls',
+        name='market',
+        callback='apps.market_subdomain.callbacks.resolve_market',
+    ),  # Dynamic pattern
     host(r'', 'config.urls', name='main'),
 )
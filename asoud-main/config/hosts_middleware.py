@@ -1,17 +1,50 @@
 from django_hosts.middleware import HostsBaseMiddleware
 from django.urls import NoReverseMatch, set_urlconf, get_urlconf
-from django.core.exceptions import ImproperlyConfigured
+from django.core.exceptions import ImproperlyConfigured, DisallowedHost
+from django.http.request import validate_host
 from django.conf import settings
 from django_hosts.resolvers import (
     get_host_patterns,
     get_host
 )
+from django.db import DatabaseError
+from redis import RedisError
+from apps.market.core import MarketHostResolver, MarketHostRegistry
 import re
 
 class HostsRequestMiddleware(HostsBaseMiddleware):
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        # compile the host patterns once per process instead of per request
+        self.compiled_patterns = [
+            (host, re.compile(host.regex))
+            for host in get_host_patterns()
+        ]
+        try:
+            self.main_host = get_host(settings.DEFAULT_HOST)
+        except AttributeError:
+            raise ImproperlyConfigured("Missing DEFAULT_HOST setting")
+
+        # warm the subdomain -> market table at startup; when the db or redis
+        # is not reachable yet, the first request warms it instead
+        try:
+            MarketHostResolver.warm()
+        except (DatabaseError, RedisError):
+            pass
+
+        if settings.HOST_REGISTRY_ENABLED:
+            try:
+                MarketHostRegistry.rebuild()
+                MarketHostRegistry.start()
+            except (DatabaseError, RedisError):
+                pass
+
     def process_request(self, request):
         # Extract the host from the request
         request_host = request.get_host().split(':')[0]  # Remove port if present
+        if settings.HOST_REGISTRY_ENABLED and not self.is_allowed_host(request_host):
+            raise DisallowedHost("Invalid HTTP_HOST header: %r." % request_host)
+
         # Find the best match for the host
         host, kwargs = self.get_best_match(request_host)
 
@@ -28,33 +61,28 @@ class HostsRequestMiddleware(HostsBaseMiddleware):
             # Reset URLconf for this thread
             set_urlconf(current_urlconf)
 
+    def is_allowed_host(self, request_host):
+        """
+        Host validation hook used instead of a static ALLOWED_HOSTS list:
+        static hosts first, then the published market domains.
+        """
+        return (
+            validate_host(request_host, settings.BASE_ALLOWED_HOSTS)
+            or MarketHostRegistry.is_allowed(request_host)
+        )
+
     def get_best_match(self, request_host):
         """
         Find the best matching host pattern for the given request host.
         Prioritizes the empty subdomain pattern if no subdomain is present.
         """
-        host_patterns = get_host_patterns()
-
-        subdomain = request_host.split('.')[0]
-        domains = settings.ALLOWED_HOSTS
-        #if any([subdomain in domain for domain in domains]):
-            #print('88888', subdomain)
-            #return [host for host in host_patterns if host.regex==''][0], {}    # main
-        
         # Check if the request host matches any subdomain pattern
-        for host in host_patterns:
-            #if host.regex == r'':
-                #print("111", host, "reg:", host.regex)
-                #return host, {}
-            
-            compiled_regex = re.compile(host.regex)
-            if request_host != 'asoud.ir' and compiled_regex.match(request_host):  # Use the compiled regex to match
-                return host, compiled_regex.match(request_host).groupdict()
-            
-        if any([subdomain in domain for domain in domains]):
-            return [host for host in host_patterns if host.regex==''][0], {}    # main
-        # Fall back to the default host
-        try:
-            return get_host(settings.DEFAULT_HOST), {}
-        except AttributeError:
-            raise ImproperlyConfigured("Missing DEFAULT_HOST setting")
+        if request_host != 'asoud.ir':
+            for host, compiled_regex in self.compiled_patterns:
+                match = compiled_regex.match(request_host)
+                if match:
+                    return host, match.groupdict()
+
+        # Every remaining host (the bare domain, ip addresses, short names)
+        # is served by the main urlconf, which is also the DEFAULT_HOST
+        return self.main_host, {}
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'apps.base',
     'apps.category',
     'apps.cart',
@@ -67,6 +68,7 @@ INSTALLED_APPS = [
     'apps.referral',
     'apps.wallet',
     'apps.payment',
+    'apps.search',
 
     'rest_framework',
     'rest_framework.authtoken',
@@ -177,6 +179,16 @@ STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.ManifestStaticFilesSto
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# processes generating image thumbnails/webp (utils/images.py)
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# minutes a checkout holds product stock until payment (apps/cart/core.py)
+STOCK_RESERVATION_MINUTES = 15
+
+# Hot carts live in redis and are written behind into Order/OrderItem
+CART_TTL = 7 * 24 * 60 * 60  # seconds an untouched cart is kept
+CART_FLUSH_INTERVAL = 60  # seconds
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -246,15 +258,37 @@ REDIS_USERNAME = os.getenv("REDIS_USERNAME")
 REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD')
 REDIS_PORT = os.environ.get('REDIS_PORT')
  
+REDIS_URL = f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}"
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [(f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/0")],
+            "hosts": [(f"{REDIS_URL}/0")],
         },
     },
 }
 
+# Shared cache and counters (db 1, the channel layer keeps db 0)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"{REDIS_URL}/1",
+    },
+}
+
+# Zarinpal gateway, see apps.payment.gateway. ZARINPAL_BASE_URL overrides
+# https://<ZARINPAL_URL>.zarinpal.com, e.g. for the run_fake_zarinpal server
+ZARINPAL_URL = 'payment'
+ZARINPAL_BASE_URL = os.environ.get('ZARINPAL_BASE_URL')
+ZARINPAL_CONNECT_TIMEOUT = 3.05  # seconds
+ZARINPAL_READ_TIMEOUT = 10  # seconds
+ZARINPAL_POOL_SIZE = 20  # keep-alive connections per worker
+
+# Market view counter: hits are buffered and flushed into Market.view_count
+MARKET_VIEW_FLUSH_INTERVAL = 60  # seconds
+MARKET_VIEW_FLUSH_THRESHOLD = 1000  # buffered hits per process
+
 
 # comments 
 COMMENTS_APP = 'django_comments_xtd'
@@ -266,3 +300,11 @@ COMMENTS_XTD_LIST_ORDER = ('-thread_id', 'order')
 
 ROOT_HOSTCONF = 'config.hosts'
 DEFAULT_HOST = 'main'
+
+# Published markets are served on <business_id>.MARKET_BASE_DOMAIN
+MARKET_BASE_DOMAIN = 'asoud.ir'
+
+# When enabled, HostsRequestMiddleware validates the request host against
+# BASE_ALLOWED_HOSTS and the shared market host registry
+HOST_REGISTRY_ENABLED = False
+BASE_ALLOWED_HOSTS = []
@@ -69,6 +69,10 @@ urlpatterns = [
         'api/v1/user/market/',
         include('apps.market.urls.user_urls'),
     ),
+    path(
+        'api/v1/user/search/',
+        include('apps.search.urls'),
+    ),
     path(
         'api/v1/user/',
         include('apps.users.urls.user_urls'),
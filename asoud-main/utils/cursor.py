@@ -0,0 +1,58 @@
+import base64
+import binascii
+import json
+import uuid
+
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+
+
+class KeysetCursor:
+    """
+    Opaque cursor of keyset pagination on (key, id): the url-safe base64 of
+    the JSON [key, id] of the last row of a page. dump turns the key into a
+    JSON value and load turns it back, returning None or raising for a bad
+    value.
+    """
+
+    def __init__(self, dump, load):
+        self.dump = dump
+        self.load = load
+
+    def encode(self, key, row_id):
+        raw = json.dumps([self.dump(key), str(row_id)])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode(self, cursor):
+        """Returns (key, id), raises ValueError for a bad cursor."""
+        try:
+            key, row_id = json.loads(base64.urlsafe_b64decode(cursor))
+            key = self.load(key)
+            row_id = uuid.UUID(row_id)
+        # uuid.UUID raises AttributeError for an id that is not a string
+        except (TypeError, ValueError, AttributeError, binascii.Error) as e:
+            raise ValueError('Invalid cursor') from e
+
+        if key is None:
+            raise ValueError('Invalid cursor')
+        return key, row_id
+
+
+NUMBER_CURSOR = KeysetCursor(float, float)
+DATETIME_CURSOR = KeysetCursor(lambda value: value.isoformat(), parse_datetime)
+
+
+class CursorField(serializers.CharField):
+    """A query parameter holding a cursor of codec, checked on input."""
+
+    def __init__(self, codec, **kwargs):
+        self.codec = codec
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        try:
+            self.codec.decode(value)
+        except ValueError:
+            raise serializers.ValidationError("Invalid cursor")
+        return value
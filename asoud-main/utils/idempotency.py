@@ -0,0 +1,205 @@
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from apps.base.models import IdempotencyKey
+from utils.response import ApiResponse
+
+
+class IdempotentRequest:
+    """
+    Replays the first response to requests that repeat an Idempotency-Key
+    header, so a client retrying on a flaky network creates one payment or
+    order, not one per attempt.
+
+    Keys are per user and scope. The first request claims its key with an
+    INSERT on the (user, scope, key) unique constraint, so of two racing
+    requests only one runs the view; the other gets a 409 until the first
+    finishes. The stored response is then replayed for TTL from redis, or
+    from the database when redis has lost it. Reusing a key with another
+    request body is a 422. Failed attempts (a 5xx, or an ApiResponse code
+    of 500 and up) give the key back so the client can retry with it.
+
+    A claim not finished after PROCESSING_TIMEOUT (a worker died) can be
+    taken over; it is well above the gateway timeouts. Expired rows are
+    removed by the purge_idempotency_keys command.
+    """
+    HEADER = 'Idempotency-Key'
+    TTL = timedelta(hours=24)
+    PROCESSING_TIMEOUT = timedelta(seconds=60)
+    MAX_KEY_LENGTH = 255
+
+    def __init__(self, request, scope, key):
+        self.request = request
+        self.scope = scope
+        self.key = key
+        self.fingerprint = hashlib.sha256(
+            json.dumps(
+                [request.method, request.path, request.data],
+                sort_keys=True,
+                cls=DjangoJSONEncoder,
+            ).encode()
+        ).hexdigest()
+        self.cache_key = 'idempotency:{}:{}:{}'.format(
+            scope,
+            request.user.id,
+            hashlib.sha256(key.encode()).hexdigest(),
+        )
+        self.record = None
+
+    @staticmethod
+    def error(code, message):
+        return Response(
+            ApiResponse(
+                success=False,
+                code=code,
+                error=message,
+            ),
+            status=code,
+        )
+
+    @staticmethod
+    def replay(stored):
+        response = Response(stored['response'], status=stored['status_code'])
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def _stored(self, record):
+        return {
+            'fingerprint': record.fingerprint,
+            'status_code': record.status_code,
+            'response': record.response,
+        }
+
+    def _answer(self, stored):
+        """Response to a request whose key was already used."""
+        if stored['fingerprint'] != self.fingerprint:
+            return self.error(
+                status.HTTP_422_UNPROCESSABLE_ENTITY,
+                f"{self.HEADER} was already used for another request",
+            )
+        if stored['status_code'] is None:
+            return self.error(
+                status.HTTP_409_CONFLICT,
+                f"A request with this {self.HEADER} is in progress",
+            )
+        return self.replay(stored)
+
+    def claim(self):
+        """
+        Returns None when this request may run the view, else the response
+        to send instead.
+        """
+        stored = cache.get(self.cache_key)
+        if stored is not None:
+            return self._answer(stored)
+
+        now = timezone.now()
+        lookup = dict(user=self.request.user, scope=self.scope, key=self.key)
+        try:
+            with transaction.atomic():
+                self.record = IdempotencyKey.objects.create(
+                    fingerprint=self.fingerprint,
+                    expires_at=now + self.TTL,
+                    **lookup,
+                )
+            return None
+        except IntegrityError:
+            pass
+
+        # an expired key, or a claim whose worker died, is taken over
+        taken = IdempotencyKey.objects.filter(**lookup).filter(
+            Q(expires_at__lte=now)
+            | Q(status_code__isnull=True, updated_at__lte=now - self.PROCESSING_TIMEOUT)
+        ).update(
+            fingerprint=self.fingerprint,
+            status_code=None,
+            response=None,
+            expires_at=now + self.TTL,
+            updated_at=now,
+        )
+        if taken:
+            self.record = IdempotencyKey.objects.get(**lookup)
+            return None
+
+        try:
+            record = IdempotencyKey.objects.get(**lookup)
+        except IdempotencyKey.DoesNotExist:
+            # given back by a failed attempt in the meantime
+            return self.error(
+                status.HTTP_409_CONFLICT,
+                f"A request with this {self.HEADER} is in progress",
+            )
+
+        stored = self._stored(record)
+        if record.status_code is not None:
+            cache.set(self.cache_key, stored, self.TTL.total_seconds())
+        return self._answer(stored)
+
+    @staticmethod
+    def failed(response):
+        if response.status_code >= 500:
+            return True
+        # the views report some errors as an ApiResponse code with a 200
+        data = response.data
+        return isinstance(data, dict) and isinstance(data.get('code'), int) and data['code'] >= 500
+
+    def release(self):
+        IdempotencyKey.objects.filter(id=self.record.id).delete()
+
+    def store(self, response):
+        if self.failed(response):
+            self.release()
+            return
+
+        # stored as json, as it will be replayed
+        self.record.status_code = response.status_code
+        self.record.response = json.loads(json.dumps(response.data, cls=DjangoJSONEncoder))
+        self.record.save(update_fields=['status_code', 'response', 'updated_at'])
+        cache.set(self.cache_key, self._stored(self.record), self.TTL.total_seconds())
+
+
+def idempotent(scope):
+    """
+    Makes an APIView method honour the Idempotency-Key header, see
+    IdempotentRequest. Requests without the header run as before.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.headers.get(IdempotentRequest.HEADER)
+            if not key or not request.user.is_authenticated:
+                return method(view, request, *args, **kwargs)
+
+            if len(key) > IdempotentRequest.MAX_KEY_LENGTH:
+                return IdempotentRequest.error(
+                    status.HTTP_400_BAD_REQUEST,
+                    f"{IdempotentRequest.HEADER} is longer than {IdempotentRequest.MAX_KEY_LENGTH} characters",
+                )
+
+            guard = IdempotentRequest(request, scope, key)
+            answer = guard.claim()
+            if answer is not None:
+                return answer
+
+            try:
+                response = method(view, request, *args, **kwargs)
+            except Exception:
+                guard.release()
+                raise
+
+            guard.store(response)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,167 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import F, Func, JSONField, Value
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# Derivatives live next to the original under a fixed suffix, so their urls
+# can be computed from the original name:
+#   product/image/<uuid>.jpg -> product/image/<uuid>.thumb.jpg
+#                            -> product/image/<uuid>.w.webp
+# (never <uuid>.webp, which would be the original of a webp upload)
+# Once they are written, the model's derived_images records the name (see
+# DerivedImagesModel), so nothing asks the storage whether they exist.
+THUMB_SIZE = (320, 320)
+WEBP_MAX_SIZE = (1280, 1280)
+QUALITY = 80
+
+_executor = None
+
+
+def thumb_name(name):
+    root, _ = os.path.splitext(name)
+    return f"{root}.thumb.jpg"
+
+
+def webp_name(name):
+    root, _ = os.path.splitext(name)
+    return f"{root}.w.webp"
+
+
+def generate_derivatives(path):
+    """
+    Writes the thumbnail and webp variants of the image at path. Runs in a
+    pool process, so it only touches the filesystem.
+    """
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img)
+        has_alpha = img.mode in ('RGBA', 'LA', 'P')
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+
+        webp = img.copy()
+        webp.thumbnail(WEBP_MAX_SIZE)
+        webp.save(webp_name(path), 'WEBP', quality=QUALITY, method=4)
+
+        thumb = img.convert('RGB')
+        thumb.thumbnail(THUMB_SIZE)
+        thumb.save(thumb_name(path), 'JPEG', quality=QUALITY, optimize=True)
+
+    return path
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        # spawn, not fork: the web workers run threads (channels, redis
+        # listeners) that must not be copied into the pool
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_DERIVATIVE_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+
+    return _executor
+
+
+def has_derivatives(field_file):
+    derived = getattr(field_file.instance, 'derived_images', None) or {}
+    return derived.get(field_file.field.name) == field_file.name
+
+
+def record_derivatives(model, pk, field_name, name):
+    """Marks the derivatives of name, the file of field_name, as written."""
+    model.objects.filter(pk=pk).update(
+        derived_images=Func(
+            F('derived_images'),
+            Value({field_name: name}, output_field=JSONField()),
+            template='%(expressions)s',
+            arg_joiner=' || ',
+            output_field=JSONField(),
+        ),
+    )
+
+
+def _done(model, pk, field_name, name):
+    submitter = threading.get_ident()
+
+    def callback(future):
+        error = future.exception()
+        if error is not None:
+            logger.warning("image derivative failed: %s", error)
+            return
+
+        try:
+            record_derivatives(model, pk, field_name, name)
+        except Exception as e:
+            logger.warning("image derivative not recorded: %s", e)
+        finally:
+            # the executor's thread keeps no connection; a future already
+            # done runs this on the submitting thread, which keeps its own
+            if threading.get_ident() != submitter:
+                connection.close()
+
+    return callback
+
+
+def schedule_derivatives(field_file):
+    """Queues derivative generation for an uploaded image, if it is missing."""
+    if not field_file or has_derivatives(field_file):
+        return
+
+    global _executor
+
+    try:
+        future = _get_executor().submit(generate_derivatives, field_file.path)
+    except BrokenProcessPool:
+        # a crashed worker breaks the pool for good, start a new one
+        _executor = None
+        future = _get_executor().submit(generate_derivatives, field_file.path)
+
+    future.add_done_callback(_done(
+        type(field_file.instance),
+        field_file.instance.pk,
+        field_file.field.name,
+        field_file.name,
+    ))
+
+
+class ImageVariantField(serializers.Field):
+    """
+    Read-only url of an image derivative. Falls back to the original until
+    the pool has produced the variant.
+
+        image_thumb = ImageVariantField(source='image', variant='thumb')
+    """
+    VARIANTS = {
+        'thumb': thumb_name,
+        'webp': webp_name,
+    }
+
+    def __init__(self, variant, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        self.variant = variant
+
+    def to_representation(self, value):
+        if not value:
+            return None
+
+        if has_derivatives(value):
+            url = default_storage.url(self.VARIANTS[self.variant](value.name))
+        else:
+            url = value.url
+
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
@@ -0,0 +1,201 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.search.normalizer import normalize
+from utils.redis_client import get_redis_connection, get_pubsub_connection
+
+
+class KeywordResolver:
+    """
+    Resolves keyword names to ids of a keyword model (a model with a unique
+    `name`), creating the missing rows.
+
+    Name -> id pairs are kept in a bounded LRU per worker, in front of the
+    shared cache (CACHE_TTL). A whole list costs no round trip when every
+    name is in the LRU, else one cache get_many and at most three queries:
+    one name__in lookup for names missing from the cache, one bulk insert
+    with ignore_conflicts (a concurrent request may insert the same name)
+    and one lookup of the inserted ids.
+
+    keyword_deleted evicts a deleted keyword from the shared cache and
+    publishes it on CHANNEL, so every worker drops it from its LRU. The LRU
+    is only used while the worker is subscribed, and it is cleared on every
+    (re)subscription, as messages may have been missed meanwhile.
+    """
+    CACHE_TTL = 60 * 60 * 24
+    LOCAL_SIZE = 10000
+    CHANNEL = 'keyword:events'
+
+    _resolvers = {}
+    _resolvers_lock = threading.Lock()
+    _listener = None
+    _listening = False
+
+    def __init__(self, model):
+        self.model = model
+        self.label = model._meta.label_lower
+        self.max_length = model._meta.get_field('name').max_length
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_model(cls, model):
+        with cls._resolvers_lock:
+            if cls._listener is None:
+                cls._listener = threading.Thread(
+                    target=cls._listen,
+                    name='keyword-resolver',
+                    daemon=True,
+                )
+                cls._listener.start()
+
+            if model not in cls._resolvers:
+                cls._resolvers[model] = cls(model)
+            return cls._resolvers[model]
+
+    @classmethod
+    def _clear_local(cls):
+        with cls._resolvers_lock:
+            resolvers = list(cls._resolvers.values())
+        for resolver in resolvers:
+            with resolver._lock:
+                resolver._local.clear()
+
+    @classmethod
+    def _listen(cls):
+        while True:
+            try:
+                pubsub = get_pubsub_connection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(cls.CHANNEL)
+                cls._clear_local()
+                cls._listening = True
+
+                for message in pubsub.listen():
+                    label, _, name = message['data'].partition(' ')
+                    with cls._resolvers_lock:
+                        resolvers = [
+                            resolver for resolver in cls._resolvers.values()
+                            if resolver.label == label
+                        ]
+                    for resolver in resolvers:
+                        resolver._forget_local(name)
+
+            except Exception:
+                cls._listening = False
+                time.sleep(5)
+
+    def normalize(self, names):
+        """Normalized, de-duplicated names in their original order."""
+        result = []
+        for name in names:
+            name = normalize(name)
+            if not name:
+                continue
+            if len(name) > self.max_length:
+                raise ValueError(
+                    f"Keyword '{name}' is longer than {self.max_length} characters"
+                )
+            if name not in result:
+                result.append(name)
+        return result
+
+    def cache_key(self, name):
+        # names may hold spaces and non-ascii characters
+        return 'keyword:{}:{}'.format(
+            self.label,
+            hashlib.sha256(name.encode()).hexdigest(),
+        )
+
+    def _get_local(self, names):
+        if not self._listening:
+            return {}
+
+        found = {}
+        with self._lock:
+            for name in names:
+                keyword_id = self._local.get(name)
+                if keyword_id is not None:
+                    self._local.move_to_end(name)
+                    found[name] = keyword_id
+        return found
+
+    def _remember_local(self, mapping):
+        if not self._listening:
+            return
+
+        with self._lock:
+            for name, keyword_id in mapping.items():
+                self._local[name] = keyword_id
+                self._local.move_to_end(name)
+            while len(self._local) > self.LOCAL_SIZE:
+                self._local.popitem(last=False)
+
+    def _forget_local(self, name):
+        with self._lock:
+            self._local.pop(name, None)
+
+    def _get_cached(self, names):
+        keys = {self.cache_key(name): name for name in names}
+        return {keys[key]: keyword_id for key, keyword_id in cache.get_many(keys).items()}
+
+    def _remember(self, mapping):
+        cache.set_many(
+            {self.cache_key(name): keyword_id for name, keyword_id in mapping.items()},
+            self.CACHE_TTL,
+        )
+
+    def forget(self, name):
+        """Drops name from the shared cache and from every worker's LRU."""
+        cache.delete(self.cache_key(name))
+        self._forget_local(name)
+        get_redis_connection().publish(self.CHANNEL, f'{self.label} {name}')
+
+    def _load(self, names):
+        return dict(
+            self.model.objects.filter(name__in=names).values_list('name', 'id')
+        )
+
+    def resolve(self, names):
+        """Returns the ids for names, in order. Raises ValueError for a too long name."""
+        names = self.normalize(names)
+
+        resolved = self._get_local(names)
+        missing = [name for name in names if name not in resolved]
+
+        if missing:
+            cached = self._get_cached(missing)
+            self._remember_local(cached)
+            resolved.update(cached)
+            missing = [name for name in missing if name not in cached]
+
+        if missing:
+            found = self._load(missing)
+            new = [name for name in missing if name not in found]
+
+            if new:
+                self.model.objects.bulk_create(
+                    [self.model(name=name) for name in new],
+                    ignore_conflicts=True,
+                )
+                # ids of conflicting rows are not returned, read them all back
+                found.update(self._load(new))
+
+            self._remember(found)
+            self._remember_local(found)
+            resolved.update(found)
+
+        return [resolved[name] for name in names]
+
+
+def keyword_deleted(sender, instance, **kwargs):
+    """post_delete receiver for keyword models."""
+    # after the commit, so a concurrent resolve can not cache the id again
+    transaction.on_commit(
+        lambda: KeywordResolver.for_model(sender).forget(instance.name),
+        robust=True,
+    )
@@ -0,0 +1,30 @@
+import redis
+from django.conf import settings
+
+# Shared connection pool for the raw redis features (counters, hashes, pub/sub)
+# that the django cache api does not cover. db 1 is shared with CACHES.
+_connection = None
+
+
+def get_redis_connection():
+    global _connection
+
+    if _connection is None:
+        _connection = redis.Redis.from_url(
+            f"{settings.REDIS_URL}/1",
+            socket_connect_timeout=2,
+            socket_timeout=2,
+            decode_responses=True,
+        )
+
+    return _connection
+
+
+def get_pubsub_connection():
+    # pub/sub listeners block on reads, so this client has no socket timeout
+    return redis.Redis.from_url(
+        f"{settings.REDIS_URL}/1",
+        socket_connect_timeout=2,
+        health_check_interval=30,
+        decode_responses=True,
+    )